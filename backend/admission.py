@@ -0,0 +1,201 @@
+"""
+Admission control for scan work.
+
+At most SCAN_MAX_CONCURRENCY scans run CLIP at once; the rest wait in a bounded
+queue instead of all contending for the same cores. Waiting scans are grouped
+per client and admitted round-robin across clients, so one client uploading a
+burst cannot starve everyone else.
+
+A scan is turned away early instead of waiting indefinitely:
+    429  the client already has SCAN_MAX_QUEUED_PER_CLIENT scans waiting
+    503  the whole queue is full (SCAN_MAX_QUEUE), or the scan waited longer
+         than SCAN_MAX_QUEUE_WAIT_SECONDS without being admitted
+Each rejection carries a Retry-After estimate from the current queue depth and
+the recent average scan time.
+
+Background work (bulk scan job batches) holds a slot too, but never queues for
+one: try_acquire_background() only succeeds when no scan is waiting and more
+than SCAN_BACKGROUND_RESERVE slots are free, so interactive scans always find
+a slot kept for them.
+
+The controller is only touched from the event loop, so it needs no locks.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from metrics import registry as metrics_registry
+
+SCAN_MAX_CONCURRENCY = int(os.getenv("SCAN_MAX_CONCURRENCY", "4"))
+SCAN_MAX_QUEUE = int(os.getenv("SCAN_MAX_QUEUE", "32"))
+SCAN_MAX_QUEUED_PER_CLIENT = int(os.getenv("SCAN_MAX_QUEUED_PER_CLIENT", "4"))
+SCAN_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("SCAN_MAX_QUEUE_WAIT_SECONDS", "2.0"))
+# Slots background work leaves free for interactive scans (capped at max concurrency - 1)
+SCAN_BACKGROUND_RESERVE = int(os.getenv("SCAN_BACKGROUND_RESERVE", "1"))
+
+# Weight of the newest sample in the moving average of scan service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+SCAN_QUEUE_WAIT_SECONDS = metrics_registry.histogram(
+    "scan_admission_wait_seconds", "Time scans spent queued before admission.")
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of admitting a scan; maps onto an HTTP error with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded, per-client fair wait queue."""
+
+    def __init__(self, max_concurrency: int = SCAN_MAX_CONCURRENCY, max_queue: int = SCAN_MAX_QUEUE,
+                 max_queued_per_client: int = SCAN_MAX_QUEUED_PER_CLIENT,
+                 max_wait_seconds: float = SCAN_MAX_QUEUE_WAIT_SECONDS,
+                 background_reserve: int = SCAN_BACKGROUND_RESERVE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queued_per_client = max_queued_per_client
+        self.max_wait_seconds = max_wait_seconds
+        self.background_reserve = max(0, min(background_reserve, max_concurrency - 1))
+        self.active = 0
+        self.background_active = 0
+        self.queued = 0
+        # Client key -> its waiting futures; iteration order is the round-robin order
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._service_time = 1.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"client_queue_full": 0, "queue_full": 0, "queue_timeout": 0}
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained."""
+        backlog = self.queued + self.active
+        return max(1, math.ceil(backlog * self._service_time / max(self.max_concurrency, 1)))
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(status_code, reason, self.retry_after())
+
+    def _admit_next(self) -> None:
+        """Hand free slots to waiting scans, one client at a time in turn."""
+        while self.active < self.max_concurrency and self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            if waiters:
+                # Client still has work waiting: move it to the back of the rotation
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            self.queued -= 1
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    def _withdraw(self, client: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[client]
+
+    async def _acquire(self, client: str) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            SCAN_QUEUE_WAIT_SECONDS.observe(0.0)
+            return
+
+        waiters = self._waiters.get(client)
+        if waiters is not None and len(waiters) >= self.max_queued_per_client:
+            raise self._reject(429, "client_queue_full")
+        if self.queued >= self.max_queue:
+            raise self._reject(503, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._withdraw(client, future)
+                future.cancel()
+                raise self._reject(503, "queue_timeout")
+            # Admitted just as the deadline passed: keep the slot
+        except asyncio.CancelledError:
+            # Client went away while waiting; give back the slot if it was just granted
+            if future.done() and not future.cancelled():
+                self.active -= 1
+                self._admit_next()
+            else:
+                self._withdraw(client, future)
+                future.cancel()
+            raise
+        self.admitted += 1
+        SCAN_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    def _release(self, service_seconds: float) -> None:
+        self.active -= 1
+        self._service_time += SERVICE_TIME_SMOOTHING * (service_seconds - self._service_time)
+        self._admit_next()
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        """Hold one scan slot for the enclosed block. Raises AdmissionRejected."""
+        await self._acquire(client)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def try_acquire_background(self) -> bool:
+        """
+        Take a slot for background work if one is idle: nothing waiting and more than
+        background_reserve slots free. Never queues; release with release_background().
+        """
+        if self._waiters or self.active >= self.max_concurrency - self.background_reserve:
+            return False
+        self.active += 1
+        self.background_active += 1
+        return True
+
+    def release_background(self) -> None:
+        self.active -= 1
+        self.background_active -= 1
+        self._admit_next()
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "background": self.background_active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "clients_waiting": len(self._waiters),
+            "retryAfter": self.retry_after(),
+        }
+
+
+scan_admission = AdmissionController()
+
+metrics_registry.callback("scan_admission_active", "Scans holding an admission slot.",
+                          "gauge", lambda: scan_admission.active)
+metrics_registry.callback("scan_admission_queued", "Scans waiting for an admission slot.",
+                          "gauge", lambda: scan_admission.queued)
+metrics_registry.callback("scan_admission_admitted_total", "Scans admitted.",
+                          "counter", lambda: scan_admission.admitted)
+metrics_registry.callback("scan_admission_rejected_total", "Scans turned away by admission control.",
+                          "counter", lambda: {(reason,): count for reason, count in scan_admission.rejected.items()},
+                          ["reason"])
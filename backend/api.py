@@ -2,15 +2,10 @@
 import logging
 import sys
 
-# Configure logging to work properly in Docker containers
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr)  # Use stderr instead of stdout
-    ],
-    force=True
-)
+# Configure logging to work properly in Docker containers: records are queued
+# and written to stderr by a background thread, never on the request path
+from log_config import RequestLogContextMiddleware, configure_logging, shutdown_logging
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Force Python to run unbuffered for Docker containers
@@ -18,23 +13,72 @@ sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
 
 # Now configure logging is done, import everything else
-from fastapi import FastAPI, UploadFile, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, HTTPException, Depends, Request, Query, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+from starlette.requests import HTTPConnection
 from PIL import Image
-from io import BytesIO
-import tempfile
 import os
 from typing import List, Dict, Any, Optional
-from image_similarity import embedding_image_similarity
+from image_similarity import (
+    embedding_image_search, embedding_image_search_batch, get_image_embeddings, loaded_card_index,
+    on_card_index_reload, phash_image_similarity, reload_card_index, start_index_watcher, stop_index_watcher,
+)
+from sharded_search import get_shard_coordinator, sharded_image_search
+from card_search import ensure_search_index, search_cards
+from text_search import search_by_text_embedding, text_embedding_cache
+from similar_cards import get_similar_card_graph
+from ocr import get_ocr_client
+from fuzzy_card_index import get_fuzzy_card_index, rerank_with_ocr
+from perceptual_hash import dhash64
+from card_detection import detect_cards, single_card_crop
+from scan_cache import SCAN_CACHE_MIN_MARGIN, scan_result_cache, filters_scope
+from image_decode import (
+    MAX_UPLOAD_BYTES, UPLOAD_BODY_SLACK, UploadSizeLimitMiddleware, read_upload_limited, decode_for_scan,
+    open_validated,
+)
+from live_scan import LiveScanSession
+from admission import AdmissionRejected, scan_admission
+from scan_jobs import (
+    SCAN_JOB_MAX_BYTES,
+    SCAN_JOB_MAX_IMAGES,
+    create_job,
+    discard_spool,
+    ensure_scan_job_tables,
+    get_job,
+    new_job_id,
+    spool_image,
+    start_scan_job_workers,
+    stop_scan_job_workers,
+)
+from profiling import (
+    ProfilingMiddleware, continuous_profile, profiling_enabled, start_continuous_profiler,
+    stop_continuous_profiler, token_matches,
+)
+from metrics import PROMETHEUS_CONTENT_TYPE, SCAN_REQUEST_SECONDS, registry as metrics_registry, time_stage
 import pandas as pd
 from fastapi import APIRouter
 import sqlite3
 import json
 import threading
 import traceback
+import base64
+import hmac
+import asyncio
+import time
 from contextlib import asynccontextmanager
+from card_store import card_summaries, get_card_from_db, get_card_updated_at, get_average_price
+from user_cache import (
+    get_library_revision as read_library_revision,
+    get_library_rows,
+    page_library_rows,
+    user_data_cache,
+)
+from http_cache import (
+    make_etag, sqlite_timestamp_to_http_date, etag_matches,
+    cache_headers, not_modified_response
+)
 
 # SuperTokens imports
 from supertokens_python.recipe.session.framework.fastapi import verify_session
@@ -51,6 +95,9 @@ print("🔍 DEBUG: After logging configuration!", file=sys.stderr)
 logger.info("🔍 DEBUG: Logger configured successfully!")
 logger.error("🔍 DEBUG: This is an ERROR level message to test stderr capture!")
 
+# Cached scan results name cards of the index they were computed on
+on_card_index_reload(scan_result_cache.clear)
+
 # Remove app creation from here - it will be created after lifespan function
 # app = FastAPI(...)
 
@@ -62,10 +109,20 @@ async def lifespan(app):
     
     print("=== SUPERTOKENS STATUS ===", file=sys.stderr)
     print("SuperTokens already initialized at module level!", file=sys.stderr)
+    start_continuous_profiler()
+    start_scan_job_workers()
+    start_index_watcher()
     
     yield
     # Code to be executed after the application shuts down
     print("🛑 FastAPI shutdown event triggered!", file=sys.stderr)
+    stop_continuous_profiler()
+    stop_scan_job_workers()
+    stop_index_watcher()
+    shutdown_logging()
+    await get_ocr_client().aclose()
+    if get_shard_coordinator() is not None:
+        await get_shard_coordinator().aclose()
 
 # Create FastAPI app after lifespan function definition
 app = FastAPI(
@@ -100,9 +157,25 @@ except Exception as e:
     print(f"Full traceback: {traceback.format_exc()}", file=sys.stderr)
     raise e
 
+# Admin-only request profiling; not installed at all unless PROFILING_TOKEN is set
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+# Refuse oversized uploads before Starlette spools the body
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    "/v1/api/scan-card": MAX_UPLOAD_BYTES + UPLOAD_BODY_SLACK,
+    "/v1/api/scan-cards": MAX_UPLOAD_BYTES + UPLOAD_BODY_SLACK,
+    "/v1/api/scan-jobs": SCAN_JOB_MAX_BYTES + UPLOAD_BODY_SLACK,
+})
+# Outermost: request ID, route and log-sampling decision for everything below
+app.add_middleware(RequestLogContextMiddleware)
+
 api_router = APIRouter(prefix="/v1/api")
 auth_router = APIRouter(prefix="/auth")
 
+# Page size bounds for cursor-paginated library listing
+LIBRARY_DEFAULT_PAGE_SIZE = 100
+LIBRARY_MAX_PAGE_SIZE = 500
+
 def create_user_library_table():
     conn = sqlite3.connect('pokemon_cards.db')
     cursor = conn.cursor()
@@ -113,50 +186,125 @@ def create_user_library_table():
             PRIMARY KEY (user_id, card_id)
         )
     ''')
+    # Secondary index on user_id: SQLite appends the rowid to every index entry,
+    # so this is effectively (user_id, added order) and serves keyset pagination
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_library_user_added
+        ON user_library (user_id)
+    ''')
+    # Per-user revision counter, bumped on every library write; used for ETags
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_library_revisions (
+            user_id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
     conn.commit()
     cursor.close()
     conn.close()
 
 # Ensure table is created at startup (thread-safe)
 threading.Thread(target=create_user_library_table).start()
+# Build the FTS card search index if it does not exist yet
+threading.Thread(target=ensure_search_index).start()
+# Tables for asynchronous bulk scan jobs
+threading.Thread(target=ensure_scan_job_tables).start()
 
 
+def encode_library_cursor(row_id: int) -> str:
+    """Encode the last returned rowid as an opaque pagination cursor."""
+    return base64.urlsafe_b64encode(str(row_id).encode()).decode().rstrip("=")
 
-def get_user_library(user_id: str) -> list:
-    logger.info(f"🔐 Getting library for user {user_id}")
+def decode_library_cursor(cursor_token: Optional[str]) -> int:
+    """Decode a pagination cursor back into a rowid. Raises ValueError if malformed."""
+    if not cursor_token:
+        return 0
+    padded = cursor_token + "=" * (-len(cursor_token) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode()).decode())
+
+def get_library_revision(user_id: str) -> tuple:
+    """
+    Get the library revision counter and last-modified timestamp for a user.
+    Read from SQLite on every request (a primary-key lookup), so a write made by
+    any worker changes the ETag everywhere at once.
+
+    Returns:
+        Tuple of (revision, updated_at); (0, None) if the user never wrote to the library
+    """
+    try:
+        return read_library_revision(user_id)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"🔐 Could not read library revision: {e}")
+        return (0, None)
+
+def get_user_library(user_id: str, after_row_id: int = 0, limit: Optional[int] = None,
+                     revision: Optional[int] = None) -> tuple:
+    """
+    Get one page of the user's library in the order cards were added.
+
+    Args:
+        user_id: The SuperTokens user ID
+        after_row_id: Keyset cursor; only rows added after this rowid are returned
+        limit: Maximum number of card IDs to return (None returns everything)
+        revision: Library revision already read for this request; the cached
+            library is used only if it was read at this revision
+
+    Returns:
+        Tuple of (card_ids, last_row_id_or_None); the second item is set only
+        when more rows may follow
+    """
+    if revision is None:
+        revision = get_library_revision(user_id)[0]
+    try:
+        library = get_library_rows(user_id, revision)
+    except sqlite3.OperationalError as e:
+        # Table not created yet (startup race) - treat as an empty library
+        logger.warning(f"🔐 user_library not readable, returning empty list: {e}")
+        return [], None
+    if library is not None:
+        return page_library_rows(library, after_row_id, limit)
+
+    # Too large to cache: page straight from SQLite
     conn = sqlite3.connect('pokemon_cards.db')
     cursor = conn.cursor()
     try:
-        # Check if user_library table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_library'")
-        table_exists = cursor.fetchone()
-        logger.info(f"🔐 user_library table exists: {table_exists}")
-        
-        if not table_exists:
-            logger.warning("🔐 user_library table does not exist, returning empty list")
-            return []
-        
-        cursor.execute('SELECT card_id FROM user_library WHERE user_id = ?', (user_id,))
+        query = 'SELECT rowid, card_id FROM user_library WHERE user_id = ? AND rowid > ? ORDER BY rowid'
+        params = [user_id, after_row_id]
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+        cursor.execute(query, params)
         rows = cursor.fetchall()
-        card_ids = [row[0] for row in rows]
-        logger.info(f"🔐 Found {len(card_ids)} cards in library for user {user_id}")
-        return card_ids
+
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+        card_ids = [row[1] for row in rows]
+        last_row_id = rows[-1][0] if has_more else None
+        logger.debug(f"🔐 Found {len(card_ids)} cards in library page for user {user_id}")
+        return card_ids, last_row_id
+    except sqlite3.OperationalError as e:
+        # Table not created yet (startup race) - treat as an empty library
+        logger.warning(f"🔐 user_library not readable, returning empty list: {e}")
+        return [], None
     except Exception as e:
         logger.error(f"❌ Error getting user library: {e}")
-        return []
+        return [], None
     finally:
         cursor.close()
         conn.close()
 
 def add_card_to_library(user_id: str, card_id: str) -> bool:
-    logger.info(f"🔐 Adding card {card_id} to library for user {user_id}")
+    logger.debug(f"🔐 Adding card {card_id} to library for user {user_id}")
     conn = sqlite3.connect('pokemon_cards.db')
     cursor = conn.cursor()
     try:
         # Check if user_library table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_library'")
         table_exists = cursor.fetchone()
-        logger.info(f"🔐 user_library table exists: {table_exists}")
+        logger.debug(f"🔐 user_library table exists: {table_exists}")
         
         if not table_exists:
             # Create the table if it doesn't exist
@@ -175,124 +323,180 @@ def add_card_to_library(user_id: str, card_id: str) -> bool:
         
         # Now add the card
         cursor.execute('INSERT OR IGNORE INTO user_library (user_id, card_id) VALUES (?, ?)', (user_id, card_id))
-        conn.commit()
         added = cursor.rowcount > 0
-        logger.info(f"🔐 Card added to library: {added}, rowcount: {cursor.rowcount}")
+        if added:
+            # Bump the revision in the same transaction so ETags change with the data
+            cursor.execute('''
+                INSERT INTO user_library_revisions (user_id, revision, updated_at)
+                VALUES (?, 1, datetime('now'))
+                ON CONFLICT(user_id) DO UPDATE SET
+                    revision = revision + 1,
+                    updated_at = datetime('now')
+            ''', (user_id,))
+        conn.commit()
+        logger.debug(f"🔐 Card added to library: {added}")
     except Exception as e:
         logger.error(f"❌ Error adding card to library: {e}")
         added = False
     finally:
         cursor.close()
         conn.close()
+    return added
+
+def build_scan_card_data(card_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a database card row into the cardData payload returned by scans."""
+    with time_stage("pricing"):
+        pricing = get_average_price(card_data)
+    return {
+        "name": card_data["name"],
+        "number": card_data["number"],
+        "id": card_data["id"],
+        "imageUrl": card_data["image_large"],
+        "artist": card_data["artist"],
+        "hp": card_data["hp"],
+        "rarity": card_data["rarity"],
+        "supertype": card_data["supertype"],
+        "set_name": card_data["set_name"],
+        "abilities": card_data["abilities"],
+        "attacks": card_data["attacks"],
+        "types": card_data["types"],
+        "weaknesses": card_data["weaknesses"],
+        "resistances": card_data["resistances"],
+        # Get pricing information
+        "pricing": pricing
+    }
+
+# How long a scan waits for OCR after CLIP search has finished. OCR runs
+# concurrently, so this only bounds the extra latency when OCR is slower.
+SCAN_OCR_GRACE_SECONDS = float(os.getenv("SCAN_OCR_GRACE_SECONDS", "0.5"))
 
-def get_card_from_db(card_id: str) -> Dict[str, Any]:
+async def rerank_with_ocr_task(similar_card_ids: List[str], ocr_task: "asyncio.Task") -> List[str]:
     """
-    Get card details from SQLite database by card ID.
-    
-    Args:
-        card_id: The Pokemon card ID
-        
-    Returns:
-        Dict containing card details
+    Re-rank embedding matches with OCR evidence if OCR finishes in time.
+    OCR failures never fail the scan; the embedding order is kept instead.
     """
     try:
-        conn = sqlite3.connect('pokemon_cards.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM pokemon_cards WHERE id = ?", (card_id,))
-        row = cursor.fetchone()
-        
-        if row is None:
-            return None
-            
-        # Get column names
-        columns = [description[0] for description in cursor.description]
-        
-        # Create dict from row data
-        card_data = dict(zip(columns, row))
-        
-        # Parse JSON fields
-        json_fields = ['abilities', 'attacks', 'subtypes', 'types', 'weaknesses', 
-                      'resistances', 'nationalPokedexNumbers', 'retreatCost',
-                      'cardmarket_prices', 'tcgplayer_prices']
-        
-        for field in json_fields:
-            if card_data.get(field) and isinstance(card_data[field], str):
-                try:
-                    card_data[field] = json.loads(card_data[field])
-                except json.JSONDecodeError:
-                    # Keep as string if JSON parsing fails
-                    pass
-        
-        cursor.close()
-        conn.close()
-        
-        return card_data
-        
-    except sqlite3.Error as err:
-        logger.error(f"Database error: {err}")
-        return None
+        with time_stage("ocr_wait"):
+            ocr_text = await asyncio.wait_for(ocr_task, timeout=SCAN_OCR_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        logger.info("OCR did not finish within the grace period, using embedding order")
+        return similar_card_ids
+    except Exception as e:
+        logger.warning(f"OCR failed, using embedding order: {e}")
+        return similar_card_ids
+
+    # First call builds the index from SQLite; keep that off the event loop
+    fuzzy_index = await asyncio.to_thread(get_fuzzy_card_index)
+    ocr_candidates = fuzzy_index.match(ocr_text)
+    return rerank_with_ocr(similar_card_ids, ocr_candidates)
+
+# Scans switch to the CLIP-free perceptual-hash engine when this many CLIP
+# inferences are already in flight (mode=auto), or always with mode=fast
+SCAN_FAST_MODE_QUEUE_THRESHOLD = int(os.getenv("SCAN_FAST_MODE_QUEUE_THRESHOLD", "8"))
+SCAN_MODES = ("auto", "accurate", "fast")
 
-def get_average_price(card_data: Dict[str, Any]) -> Dict[str, Any]:
+# CLIP inferences currently running or waiting for a worker thread.
+# Only touched from the event loop, so a plain int is safe.
+inference_in_flight = 0
+
+def scan_client_key(connection: HTTPConnection) -> str:
     """
-    Extract average price information from card data.
-    
-    Args:
-        card_data: Card data from database
-        
+    Fair-share key for admission control: the end client's address.
+    Behind nginx the peer is the proxy; uvicorn replaces it with the
+    X-Forwarded-For address only when the peer is listed in FORWARDED_ALLOW_IPS
+    (see docker-compose.yml), so clients cannot spoof their key.
+    """
+    return connection.client.host if connection.client else ""
+
+async def identify_card_ids(img: Image.Image, contents: bytes, filename: str,
+                            filters: Optional[Dict[str, List[str]]] = None,
+                            mode: str = "auto", client: str = "") -> tuple:
+    """
+    Run the full identification pipeline for one decoded upload:
+    CLIP embedding search (in a worker thread) with OCR re-ranking overlapped,
+    or the perceptual-hash fast path when requested or when inference is saturated.
+    CLIP work waits for an admission slot (fair-shared per client) and raises
+    AdmissionRejected when the queue is full or the wait exceeds its deadline.
+
     Returns:
-        Dict with pricing information
+        Tuple of (ranked candidate card IDs, mode actually used: "accurate" or "fast",
+        CLIP's top-1 score lead over the runner-up, or None when unknown: fast mode,
+        fewer than two matches, or OCR re-ranking picked a different winner)
     """
-    pricing_info = {
-        "averagePrice": None,
-        "priceSource": None,
-        "currency": "USD"
-    }
-    
-    # Try to get price from TCGPlayer first (usually more reliable)
-    if card_data.get("tcgplayer_prices") and isinstance(card_data["tcgplayer_prices"], dict):
-        tcg_prices = card_data["tcgplayer_prices"]
-        
-        # Look for normal market price first
-        normal_prices = tcg_prices.get("normal")
-        if normal_prices and isinstance(normal_prices, dict) and normal_prices.get("market"):
-            pricing_info["averagePrice"] = normal_prices["market"]
-            pricing_info["priceSource"] = "TCGPlayer"
-        # Fallback to normal mid price
-        elif normal_prices and isinstance(normal_prices, dict) and normal_prices.get("mid"):
-            pricing_info["averagePrice"] = normal_prices["mid"]
-            pricing_info["priceSource"] = "TCGPlayer"
-        # Try holofoil market price
-        elif tcg_prices.get("holofoil") and isinstance(tcg_prices["holofoil"], dict) and tcg_prices["holofoil"].get("market"):
-            pricing_info["averagePrice"] = tcg_prices["holofoil"]["market"]
-            pricing_info["priceSource"] = "TCGPlayer"
-        # Try holofoil mid price
-        elif tcg_prices.get("holofoil") and isinstance(tcg_prices["holofoil"], dict) and tcg_prices["holofoil"].get("mid"):
-            pricing_info["averagePrice"] = tcg_prices["holofoil"]["mid"]
-            pricing_info["priceSource"] = "TCGPlayer"
-    
-    # Fallback to CardMarket if TCGPlayer doesn't have price
-    if pricing_info["averagePrice"] is None and card_data.get("cardmarket_prices") and isinstance(card_data["cardmarket_prices"], dict):
-        cm_prices = card_data["cardmarket_prices"]
-        
-        if cm_prices.get("averageSellPrice"):
-            pricing_info["averagePrice"] = cm_prices["averageSellPrice"]
-            pricing_info["priceSource"] = "CardMarket"
-            pricing_info["currency"] = "EUR"
-        elif cm_prices.get("trendPrice"):
-            pricing_info["averagePrice"] = cm_prices["trendPrice"]
-            pricing_info["priceSource"] = "CardMarket"
-            pricing_info["currency"] = "EUR"
-    
-    return pricing_info
+    global inference_in_flight
+
+    use_fast = mode == "fast" or (mode == "auto" and inference_in_flight >= SCAN_FAST_MODE_QUEUE_THRESHOLD)
+    if use_fast:
+        try:
+            fast_card_ids = await asyncio.to_thread(phash_image_similarity, img, filters or None)
+            return fast_card_ids, "fast", None
+        except FileNotFoundError:
+            if mode == "fast":
+                raise HTTPException(status_code=503, detail="Fast mode is not available")
+            logger.warning("Perceptual hash index missing, staying on CLIP under load")
+
+    ocr_task = None
+    inference_in_flight += 1
+    try:
+        async with scan_admission.slot(client):
+            # Start OCR on the raw upload so it overlaps with CLIP inference
+            ocr_client = get_ocr_client()
+            if ocr_client.enabled:
+                ocr_task = asyncio.create_task(ocr_client.ocr_bytes(contents, filename))
+
+            # Get similar card IDs (CLIP + search run in a worker thread, not on the event loop)
+            # The already-decoded image is passed straight through: no temp file, no second decode
+            coordinator = get_shard_coordinator()
+            if coordinator is not None:
+                # Index is partitioned across shard servers: scatter-gather within the deadline
+                result = await sharded_image_search(img, filters or None, 10, coordinator,
+                                                    card_image=lambda: single_card_crop(img))
+                if len(result["failed_shards"]) == len(coordinator.shards):
+                    raise HTTPException(status_code=503, detail="Card index unavailable")
+                matches = result["matches"]
+                if result["partial"]:
+                    logger.warning(f"Scan answered without shards {result['failed_shards']}")
+            else:
+                # Region re-ranking needs the card on its own, so it is only detected on a near-tie
+                matches = await asyncio.to_thread(embedding_image_search, img, filters or None, 10,
+                                                  card_image=lambda: single_card_crop(img))
+        # The OCR wait is network-bound, so it does not hold a scan slot
+        similar_card_ids = [card_id for card_id, _ in matches]
+        margin = matches[0][1] - matches[1][1] if len(matches) > 1 else None
+        if ocr_task is not None:
+            similar_card_ids = await rerank_with_ocr_task(similar_card_ids, ocr_task)
+            if margin is not None and similar_card_ids[0] != matches[0][0]:
+                margin = None
+        return similar_card_ids, "accurate", margin
+    finally:
+        inference_in_flight -= 1
+        if ocr_task is not None:
+            if ocr_task.done() and not ocr_task.cancelled():
+                # Mark a failure as retrieved; the scan already went on without it
+                ocr_task.exception()
+            else:
+                # The search failed before OCR was awaited: stop the request instead of leaking it
+                ocr_task.cancel()
 
 @api_router.post("/scan-card", response_model=Dict[str, Any])
-async def scan_card(image: UploadFile):
+async def scan_card(
+    request: Request,
+    image: UploadFile,
+    set_id: Optional[List[str]] = Query(None),
+    supertype: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    regulation_mark: Optional[List[str]] = Query(None),
+    mode: str = Query("auto", pattern="^(auto|accurate|fast)$")
+):
     """
     Scan a Pokemon card image and return the best matches.
     
     Args:
         image: The uploaded card image file
+        set_id, supertype, types, regulation_mark: Optional metadata filters
+            (repeat a parameter to allow several values); only matching cards are searched
+        mode: "accurate" always uses CLIP, "fast" uses the perceptual-hash index,
+            "auto" (default) falls back to fast mode when inference is saturated
         
     Returns:
         Dict containing:
@@ -300,116 +504,339 @@ async def scan_card(image: UploadFile):
         - cardData: Dict with card details (if successful)
         - error: str (if unsuccessful)
     """
+    request_start = time.perf_counter()
+    outcome = "error"
+    mode_used = "accurate"
+    engine = "accurate"
     try:
         
         # Validate file type
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
-        logger.info(f"Scanning card: {image.filename}")
-        print(f"Scanning card: {image.filename}")
-        sys.stdout.flush()
-        # Read and validate image
-        contents = await image.read()
-        try:
-            img = Image.open(BytesIO(contents))
-            img.verify()  # Verify it's a valid image
-            img = Image.open(BytesIO(contents))  # Reopen for processing
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+        logger.debug(f"Scanning card: {image.filename}")
+        # Read with size limits, validate from the header, then decode once at reduced resolution
+        with time_stage("upload_read"):
+            contents = await read_upload_limited(image)
+        with time_stage("decode"):
+            img = await asyncio.to_thread(decode_for_scan, contents)
+
+        filters = {
+            "set_id": set_id,
+            "supertype": supertype,
+            "types": types,
+            "regulation_mark": regulation_mark,
+        }
+        filters = {field: values for field, values in filters.items() if values}
+
+        # Near-duplicate frames of a recent scan reuse its result and skip CLIP entirely
+        frame_hash = await asyncio.to_thread(dhash64, img)
+        cache_scope = filters_scope(filters)
+        similar_card_ids = scan_result_cache.get(frame_hash, cache_scope) if mode != "fast" else None
+        if similar_card_ids is None:
+            similar_card_ids, mode_used, margin = await identify_card_ids(
+                img, contents, image.filename or "card.jpg", filters, mode,
+                scan_client_key(request)
+            )
+            # Only full-accuracy results are reused for later frames, and only
+            # unambiguous ones for frames that merely hash close to this one
+            if similar_card_ids and mode_used == "accurate":
+                scan_result_cache.put(frame_hash, similar_card_ids, cache_scope,
+                                      near_matches=margin is not None and margin >= SCAN_CACHE_MIN_MARGIN)
+            engine = mode_used
+        else:
+            engine = "cache"
+            logger.info("Scan result served from perceptual-hash cache")
+
+        logger.debug(f"Scan candidates: {similar_card_ids}")
+        if not similar_card_ids:
+            outcome = "no_match"
+            return JSONResponse(
+                status_code=404,
+                content={
+                    "success": False,
+                    "error": "No matching cards found"
+                }
+            )
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            img.save(temp_file.name, format='JPEG')
-            temp_path = temp_file.name
+        # Get card details for the best match from SQLite database
+        best_match_card_id = similar_card_ids[0]
+        logger.info(f"best_match_card_id: {best_match_card_id}",
+                    extra={"fields": {"card_id": best_match_card_id, "engine": engine}})
         
-        try:
-            logger.info(f"Reading image: {temp_path}")      
-            print(f"Reading image: {temp_path}")
-            sys.stdout.flush()
-            # Get similar card IDs
-            similar_card_ids = embedding_image_similarity(temp_path)
-            logger.info(f"embedding_image_similarity: {similar_card_ids}")            
-            print(f"embedding_image_similarity: {similar_card_ids}")
-            sys.stdout.flush()
-            if not similar_card_ids:
-                return JSONResponse(
-                    status_code=404,
-                    content={
-                        "success": False,
-                        "error": "No matching cards found"
-                    }
-                )
-            
-            # Get card details for the best match from SQLite database
-            best_match_card_id = similar_card_ids[0]
-            logger.info(f"best_match_card_id: {best_match_card_id}")
-            print(f"best_match_card_id: {best_match_card_id}")
-            sys.stdout.flush()
-            
+        with time_stage("db_fetch"):
             card_data = get_card_from_db(best_match_card_id)
-            if not card_data:
-                return JSONResponse(
-                    status_code=404,
-                    content={
-                        "success": False,
-                        "error": "Card not found in database"
-                    }
-                )
-            
-            logger.info(f"card_data: {card_data}")
-            print(f"card_data: {card_data}")
-            sys.stdout.flush()
-            
-            # Get pricing information
-            pricing_info = get_average_price(card_data)
-            
-            return {
-                "success": True,
-                "cardData": {
-                    "name": card_data["name"],
-                    "number": card_data["number"],
-                    "id": card_data["id"],
-                    "imageUrl": card_data["image_large"],
-                    "artist": card_data["artist"],
-                    "hp": card_data["hp"],
-                    "rarity": card_data["rarity"],
-                    "supertype": card_data["supertype"],
-                    "set_name": card_data["set_name"],
-                    "abilities": card_data["abilities"],
-                    "attacks": card_data["attacks"],
-                    "types": card_data["types"],
-                    "weaknesses": card_data["weaknesses"],
-                    "resistances": card_data["resistances"],
-                    "pricing": pricing_info
+        if not card_data:
+            outcome = "no_match"
+            return JSONResponse(
+                status_code=404,
+                content={
+                    "success": False,
+                    "error": "Card not found in database"
                 }
-            }
-            
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_path)
+            )
+        
+        payload = {
+            "success": True,
+            "mode": mode_used,
+            "cardData": build_scan_card_data(card_data)
+        }
+        # Render here rather than in FastAPI so serialization shows up as its own stage
+        with time_stage("serialization"):
+            response = JSONResponse(content=payload)
+        outcome = "success"
+        return response
             
+    except AdmissionRejected as e:
+        outcome = "rejected"
+        logger.warning(f"Scan rejected by admission control: {e.reason}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail="Too many scans in progress, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except HTTPException as he:
         logger.error(f"HTTP Exception: {he}")
-        print(f"HTTP Exception: {he}")
-        sys.stdout.flush()
         raise he
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
-        print(f"Unexpected error: {str(e)}")
-        sys.stdout.flush()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        SCAN_REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome, engine)
+
+# Multi-card photos are decoded larger so every card on a binder page keeps
+# enough pixels after rectification; at most SCAN_MULTI_MAX_CARDS are identified
+SCAN_MULTI_DECODE_MIN_SIDE = int(os.getenv("SCAN_MULTI_DECODE_MIN_SIDE", "1440"))
+SCAN_MULTI_MAX_CARDS = int(os.getenv("SCAN_MULTI_MAX_CARDS", "16"))
+
+async def identify_card_crops(crops: List[Image.Image], filters: Optional[Dict[str, List[str]]] = None,
+                              client: str = "", top_k: int = 10,
+                              card_aligned: bool = True) -> List[Optional[List[tuple]]]:
+    """
+    Identify several card crops under one admission slot: all crops share one
+    batched CLIP forward pass, then each is searched on its own. Near-ties are
+    region re-ranked when card_aligned (the crops are rectified detections).
+
+    Returns:
+        Per crop, its (card_id, score) matches best first, or None if it could not be embedded
+    """
+    global inference_in_flight
+    inference_in_flight += 1
+    try:
+        async with scan_admission.slot(client):
+            embeddings = await asyncio.to_thread(get_image_embeddings, crops)
+            coordinator = get_shard_coordinator()
+            if coordinator is not None:
+                results = await asyncio.gather(*[
+                    sharded_image_search(crop, filters or None, top_k, coordinator, query_embedding=embedding,
+                                         card_image=crop if card_aligned else None)
+                    for crop, embedding in zip(crops, embeddings) if embedding is not None
+                ])
+                if results and all(len(r["failed_shards"]) == len(coordinator.shards) for r in results):
+                    raise HTTPException(status_code=503, detail="Card index unavailable")
+                found = iter([r["matches"] for r in results])
+                return [next(found) if embedding is not None else None for embedding in embeddings]
+
+            return await asyncio.to_thread(embedding_image_search_batch, embeddings, [filters or None] * len(crops),
+                                           top_k, crops if card_aligned else None)
+    finally:
+        inference_in_flight -= 1
+
+@api_router.post("/scan-cards", response_model=Dict[str, Any])
+async def scan_cards(
+    request: Request,
+    image: UploadFile,
+    set_id: Optional[List[str]] = Query(None),
+    supertype: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    regulation_mark: Optional[List[str]] = Query(None)
+):
+    """
+    Scan a photo of several cards (a binder page, cards laid out on a table) and
+    identify each one. Cards are found and rectified by card_detection; a photo
+    with no detectable card outline is scanned as a single card.
+
+    Args:
+        image: The uploaded photo
+        set_id, supertype, types, regulation_mark: Metadata filters, as for /scan-card
+
+    Returns:
+        Dict containing:
+        - success: bool
+        - detected: False when no card outline was found and the whole photo was scanned
+        - cards: one entry per card in reading order, with its corners (fractions of
+          the photo width/height, clockwise from top-left), cardId, score, candidates
+          and cardData, or success=False and an error for cards that could not be identified
+    """
+    request_start = time.perf_counter()
+    outcome = "error"
+    try:
+        if not image.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        with time_stage("upload_read"):
+            contents = await read_upload_limited(image)
+        with time_stage("decode"):
+            img = await asyncio.to_thread(decode_for_scan, contents, SCAN_MULTI_DECODE_MIN_SIDE)
+
+        filters = {
+            "set_id": set_id,
+            "supertype": supertype,
+            "types": types,
+            "regulation_mark": regulation_mark,
+        }
+        filters = {field: values for field, values in filters.items() if values}
+
+        with time_stage("card_detection"):
+            detections = await asyncio.to_thread(detect_cards, img, SCAN_MULTI_MAX_CARDS)
+        detected = bool(detections)
+        if not detected:
+            width, height = img.size
+            detections = [([(0, 0), (width, 0), (width, height), (0, height)], img)]
+        logger.info(f"Detected {len(detections) if detected else 0} cards in {image.filename}")
+
+        all_matches = await identify_card_crops(
+            [crop for _, crop in detections], filters,
+            scan_client_key(request), card_aligned=detected
+        )
+
+        cards = []
+        width, height = img.size
+        for index, ((quad, _), matches) in enumerate(zip(detections, all_matches)):
+            card = {
+                "index": index,
+                "corners": [[round(float(x) / width, 4), round(float(y) / height, 4)] for x, y in quad],
+            }
+            card_data = None
+            if matches:
+                with time_stage("db_fetch"):
+                    card_data = await asyncio.to_thread(get_card_from_db, matches[0][0])
+            if card_data:
+                card.update({
+                    "success": True,
+                    "cardId": matches[0][0],
+                    "score": round(matches[0][1], 4),
+                    "candidates": [card_id for card_id, _ in matches],
+                    "cardData": build_scan_card_data(card_data),
+                })
+            else:
+                card.update({"success": False, "error": "No matching cards found"})
+            cards.append(card)
+
+        identified = sum(1 for card in cards if card["success"])
+        if not identified:
+            outcome = "no_match"
+            return JSONResponse(
+                status_code=404,
+                content={
+                    "success": False,
+                    "error": "No matching cards found",
+                    "detected": detected,
+                    "cards": cards
+                }
+            )
+
+        payload = {
+            "success": True,
+            "detected": detected,
+            "identified": identified,
+            "cards": cards
+        }
+        with time_stage("serialization"):
+            response = JSONResponse(content=payload)
+        outcome = "success"
+        return response
+
+    except AdmissionRejected as e:
+        outcome = "rejected"
+        logger.warning(f"Multi-card scan rejected by admission control: {e.reason}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail="Too many scans in progress, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except HTTPException as he:
+        logger.error(f"HTTP Exception: {he}")
+        raise he
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        SCAN_REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome, "multi")
+
+@api_router.websocket("/live-scan")
+async def live_scan(
+    websocket: WebSocket,
+    set_id: Optional[List[str]] = Query(None),
+    supertype: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    regulation_mark: Optional[List[str]] = Query(None)
+):
+    """
+    Continuous camera scanning over one WebSocket (protocol in live_scan.py).
+    Accepts the same metadata filters as /scan-card.
+    """
+    filters = {
+        "set_id": set_id,
+        "supertype": supertype,
+        "types": types,
+        "regulation_mark": regulation_mark,
+    }
+    filters = {field: values for field, values in filters.items() if values}
+
+    async def identify_frame(img):
+        global inference_in_flight
+        inference_in_flight += 1
+        try:
+            async with scan_admission.slot(scan_client_key(websocket)):
+                # Two results are enough to judge the top-1 margin
+                return await asyncio.to_thread(embedding_image_search, img, filters or None, 2,
+                                               card_image=lambda: single_card_crop(img))
+        finally:
+            inference_in_flight -= 1
+
+    async def describe_card(card_id):
+        card_data = await asyncio.to_thread(get_card_from_db, card_id)
+        return build_scan_card_data(card_data) if card_data else None
+
+    await websocket.accept()
+    await LiveScanSession(websocket, identify_frame, describe_card).run()
 
 @api_router.get('/library')
-async def get_library(s: SessionContainer = Depends(verify_session())):
-    """Get the authenticated user's library."""
-    logger.info("🚀 /library endpoint called!")
+async def get_library(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(LIBRARY_DEFAULT_PAGE_SIZE, ge=1, le=LIBRARY_MAX_PAGE_SIZE),
+    s: SessionContainer = Depends(verify_session())
+):
+    """
+    Get one page of the authenticated user's library.
+    Pass the returned next_cursor back as `cursor` to fetch the following page.
+    Supports If-None-Match: unchanged pages are answered with 304.
+    """
+    logger.debug("🚀 /library endpoint called!")
     
+    try:
+        after_row_id = decode_library_cursor(cursor)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     try:
         user_id = s.get_user_id()
-        logger.info(f"🔐 Getting library for user ID: {user_id}")
-        card_ids = get_user_library(user_id)
-        logger.info(f"🔐 Library result: {card_ids}")
-        return { 'success': True, 'card_ids': card_ids }
+        logger.debug(f"🔐 Getting library for user ID: {user_id}")
+
+        # Validators come from the revision counter, so a 304 never touches user_library
+        revision, updated_at = get_library_revision(user_id)
+        etag = make_etag("library", user_id, revision, after_row_id, limit)
+        headers = cache_headers(etag, sqlite_timestamp_to_http_date(updated_at), private=True)
+        if etag_matches(request, etag):
+            return not_modified_response(headers)
+
+        card_ids, last_row_id = get_user_library(user_id, after_row_id, limit, revision)
+        logger.info(f"🔐 Library page size: {len(card_ids)}")
+        next_cursor = encode_library_cursor(last_row_id) if last_row_id is not None else None
+        return JSONResponse(
+            content={ 'success': True, 'card_ids': card_ids, 'next_cursor': next_cursor },
+            headers=headers
+        )
     except Exception as e:
         logger.error(f"❌ Error in get_library: {e}")
         logger.error(f"Error type: {type(e)}")
@@ -420,8 +847,7 @@ async def get_library(s: SessionContainer = Depends(verify_session())):
 @api_router.post('/library/add')
 async def add_to_library(card_id: str, s: SessionContainer = Depends(verify_session())):
     """Add a card to the authenticated user's library."""
-    logger.info("🚀 /library/add endpoint called!")
-    logger.info(f"🔐 Card ID: {card_id}")
+    logger.debug("🚀 /library/add endpoint called!")
     
     try:
         if not card_id:
@@ -431,7 +857,7 @@ async def add_to_library(card_id: str, s: SessionContainer = Depends(verify_sess
         user_id = s.get_user_id()
         logger.info(f"🔐 Adding card {card_id} to library for user {user_id}")
         added = add_card_to_library(user_id, card_id)
-        logger.info(f"🔐 Add result: {added}")
+        logger.debug(f"🔐 Add result: {added}")
         return { 'success': True, 'added': added }
     except Exception as e:
         logger.error(f"❌ Error in add_to_library: {e}")
@@ -440,20 +866,342 @@ async def add_to_library(card_id: str, s: SessionContainer = Depends(verify_sess
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+# Server-sent events: how often a job stream re-reads progress, and how often it
+# sends a comment line when nothing changed so proxies keep the connection open
+SCAN_JOB_EVENTS_POLL_SECONDS = 0.5
+SCAN_JOB_EVENTS_HEARTBEAT_SECONDS = 15.0
+
+@api_router.post('/scan-jobs', status_code=202)
+async def create_scan_job(
+    images: List[UploadFile],
+    auto_add: bool = Query(False),
+    set_id: Optional[List[str]] = Query(None),
+    supertype: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    regulation_mark: Optional[List[str]] = Query(None),
+    s: SessionContainer = Depends(verify_session())
+):
+    """
+    Submit a batch of card photos to be scanned in the background.
+
+    Args:
+        images: The card photos (multipart, repeat the field per file)
+        auto_add: Add confidently identified cards to the library when the job finishes
+        set_id, supertype, types, regulation_mark: Metadata filters, as for /scan-card
+
+    Returns:
+        The job ID and where to poll (GET /scan-jobs/{id}) or stream
+        (GET /scan-jobs/{id}/events) its per-image results
+    """
+    if not images:
+        raise HTTPException(status_code=400, detail="At least one image is required")
+    if len(images) > SCAN_JOB_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"A job can contain at most {SCAN_JOB_MAX_IMAGES} images")
+
+    filters = {
+        "set_id": set_id,
+        "supertype": supertype,
+        "types": types,
+        "regulation_mark": regulation_mark,
+    }
+    filters = {field: values for field, values in filters.items() if values}
+
+    # Each image goes to the spool directory as soon as it is read, so at most one is held in memory
+    job_id = new_job_id()
+    uploads = []
+    total_bytes = 0
+    try:
+        for image in images:
+            contents = await read_upload_limited(image)
+            total_bytes += len(contents)
+            if total_bytes > SCAN_JOB_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"A job can contain at most {SCAN_JOB_MAX_BYTES} bytes of images")
+            # Header-only check, so a bad file is refused now rather than failing in the background
+            try:
+                await asyncio.to_thread(open_validated, contents)
+            except HTTPException as he:
+                raise HTTPException(status_code=he.status_code, detail=f"{image.filename}: {he.detail}")
+            path = await asyncio.to_thread(spool_image, job_id, len(uploads), contents)
+            uploads.append((image.filename or f"image-{len(uploads)}", path))
+
+        await asyncio.to_thread(create_job, job_id, s.get_user_id(), uploads, filters, auto_add)
+    except BaseException:
+        await asyncio.to_thread(discard_spool, job_id)
+        raise
+    logger.info(f"Created scan job {job_id} with {len(uploads)} images",
+                extra={"fields": {"job_id": job_id, "images": len(uploads), "auto_add": auto_add}})
+    return {
+        "success": True,
+        "job_id": job_id,
+        "total": len(uploads),
+        "status_url": f"/v1/api/scan-jobs/{job_id}",
+        "events_url": f"/v1/api/scan-jobs/{job_id}/events",
+    }
+
+@api_router.get('/scan-jobs/{job_id}')
+async def get_scan_job(job_id: str, after: int = Query(-1, ge=-1), s: SessionContainer = Depends(verify_session())):
+    """Job progress plus per-image results; pass `after` to only get images past that index."""
+    job = await asyncio.to_thread(get_job, job_id, s.get_user_id(), after)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    return job
+
+@api_router.get('/scan-jobs/{job_id}/events')
+async def stream_scan_job(job_id: str, request: Request, s: SessionContainer = Depends(verify_session())):
+    """
+    Stream per-image results as server-sent events.
+
+    Emits one "item" event per finished image, in image order (the event id is
+    the image index, so a reconnect with Last-Event-ID resumes after it), then
+    a final "done" event with the job summary.
+    """
+    user_id = s.get_user_id()
+    try:
+        last_index = int(request.headers.get("last-event-id", "-1"))
+    except ValueError:
+        last_index = -1
+    if await asyncio.to_thread(get_job, job_id, user_id, 2 ** 31) is None:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+
+    async def events():
+        nonlocal last_index
+        last_sent = time.monotonic()
+        while True:
+            job = await asyncio.to_thread(get_job, job_id, user_id, last_index)
+            if job is None:
+                return
+            for item in job.pop("items"):
+                if item["status"] not in ("done", "failed"):
+                    break
+                last_index = item["index"]
+                last_sent = time.monotonic()
+                yield f"id: {last_index}\nevent: item\ndata: {json.dumps(item)}\n\n"
+            if job["status"] == "done":
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+            if time.monotonic() - last_sent >= SCAN_JOB_EVENTS_HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(SCAN_JOB_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @api_router.get('/card/{card_id}')
-async def get_card(card_id: str):
+async def get_card(card_id: str, request: Request):
+    """
+    Get card details by ID.
+    Supports If-None-Match: unchanged cards are answered with 304 after a
+    single primary-key lookup of updated_at, without loading the full row.
+    """
+    try:
+        updated_at = get_card_updated_at(card_id)
+    except sqlite3.Error:
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+
+    etag = make_etag("card", card_id, updated_at)
+    headers = cache_headers(etag, sqlite_timestamp_to_http_date(updated_at))
+    if etag_matches(request, etag):
+        return not_modified_response(headers)
+
     card_data = get_card_from_db(card_id)
     if not card_data:
         raise HTTPException(status_code=404, detail="Card not found")
     card_data['imageUrl'] = card_data.get('image_large')
     card_data['pricing'] = get_average_price(card_data)
-    return card_data
+    return JSONResponse(content=card_data, headers=headers)
+
+@api_router.get('/card/{card_id}/similar')
+async def get_similar_cards(card_id: str, request: Request, limit: int = Query(10, ge=1, le=50)):
+    """
+    Cards that look most like this one (reprints, alternate art), read from the
+    precomputed neighbour graph built by `python similar_cards.py build`.
+    Supports If-None-Match: answers 304 until the graph is rebuilt.
+    """
+    try:
+        graph = get_similar_card_graph()
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Similar cards are not available")
+    neighbours = graph.similar(card_id, limit)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+
+    etag = make_etag("similar", card_id, limit, graph.version)
+    headers = cache_headers(etag)
+    if etag_matches(request, etag):
+        return not_modified_response(headers)
+
+    scores = dict(neighbours)
+    results = await asyncio.to_thread(card_summaries, [neighbour_id for neighbour_id, _ in neighbours])
+    for card in results:
+        card["score"] = round(scores[card["id"]], 4)
+    return JSONResponse(content={"success": True, "card_id": card_id, "results": results}, headers=headers)
+
+@api_router.get('/search')
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Ranked full-text search over card name, set, artist, attacks and abilities.
+    The last word is matched as a prefix, so it works for autocomplete ("Chari").
+    """
+    results = search_cards(q, limit)
+    return {"success": True, "query": q, "results": results}
+
+@api_router.get('/search/semantic')
+async def semantic_card_search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    set_id: Optional[List[str]] = Query(None),
+    supertype: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    regulation_mark: Optional[List[str]] = Query(None)
+):
+    """
+    Artwork search by description ("shiny charizard breathing fire"): the query is
+    embedded with CLIP's text tower and ranked against the card image index.
+    Accepts the same metadata filters as /scan-card.
+    """
+    filters = {
+        "set_id": set_id,
+        "supertype": supertype,
+        "types": types,
+        "regulation_mark": regulation_mark,
+    }
+    filters = {field: values for field, values in filters.items() if values}
+
+    # Cached and precomputed queries return without touching the model
+    text_embedding = await asyncio.to_thread(text_embedding_cache.get, q)
+    if text_embedding is None:
+        raise HTTPException(status_code=400, detail="Query could not be embedded")
+
+    coordinator = get_shard_coordinator()
+    if coordinator is not None:
+        result = await coordinator.search(text_embedding, limit, filters or None)
+        if len(result["failed_shards"]) == len(coordinator.shards):
+            raise HTTPException(status_code=503, detail="Card index unavailable")
+        matches = [(card_id, score) for card_id, score, _ in result["matches"]]
+    else:
+        matches = await asyncio.to_thread(search_by_text_embedding, text_embedding, filters or None, limit)
+
+    scores = dict(matches)
+    results = await asyncio.to_thread(card_summaries, [card_id for card_id, _ in matches])
+    for card in results:
+        card["score"] = round(scores[card["id"]], 4)
+    return {"success": True, "query": q, "results": results}
 
 @api_router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+def _scan_cache_lookups():
+    stats = scan_result_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+def _ocr_cache_lookups():
+    ocr_client = get_ocr_client()
+    return {("hit",): ocr_client.cache_hits, ("miss",): ocr_client.cache_misses}
+
+metrics_registry.callback("scan_cache_lookups_total", "Perceptual-hash scan result cache lookups.",
+                          "counter", _scan_cache_lookups, ["result"])
+metrics_registry.callback("scan_cache_entries", "Live entries in the scan result cache.",
+                          "gauge", lambda: scan_result_cache.stats()["entries"])
+metrics_registry.callback("ocr_cache_lookups_total", "OCR response cache lookups.",
+                          "counter", _ocr_cache_lookups, ["result"])
+def _text_embedding_cache_lookups():
+    stats = text_embedding_cache.stats()
+    return {("hit",): stats["hits"], ("precomputed",): stats["precomputedHits"], ("miss",): stats["misses"]}
+
+metrics_registry.callback("text_embedding_cache_lookups_total", "Semantic search query embedding lookups.",
+                          "counter", _text_embedding_cache_lookups, ["result"])
+def _user_cache_lookups():
+    stats = user_data_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+metrics_registry.callback("user_cache_lookups_total", "Per-user library cache lookups.",
+                          "counter", _user_cache_lookups, ["result"])
+metrics_registry.callback("user_cache_entries", "Users with a cached library.",
+                          "gauge", lambda: user_data_cache.stats()["entries"])
+metrics_registry.callback("card_index_rows", "Rows in the live embedding index (0 until first loaded).",
+                          "gauge", lambda: len(loaded_card_index() or ()))
+metrics_registry.callback("inference_in_flight", "CLIP inferences running or waiting for a worker thread.",
+                          "gauge", lambda: inference_in_flight)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus scrape endpoint. Served at the app root, outside /v1/api, so the
+    public nginx proxy does not expose it, and docker-compose does not publish the
+    backend port; scrape it from poke-network (http://backend:8000/metrics).
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/debug/profile", include_in_schema=False)
+async def debug_profile(request: Request, reset: bool = False):
+    """
+    Hot stacks aggregated by the continuous profiler, in folded-stack format.
+    Requires the X-Profile admin token; answers 404 otherwise so it stays invisible.
+    """
+    if not token_matches(request.headers.get("x-profile")):
+        raise HTTPException(status_code=404, detail="Not Found")
+    profile = continuous_profile(reset)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="Continuous profiling is off (set PROFILE_CONTINUOUS_HZ)")
+    return PlainTextResponse(profile["folded"], headers={"X-Profile-Samples": str(profile["samples"])})
+
+# Admin token for index hot reload; leave empty to disable the endpoints
+INDEX_ADMIN_TOKEN = os.getenv("INDEX_ADMIN_TOKEN", "")
+
+def _require_index_admin(request: Request) -> None:
+    """404 unless the X-Admin-Token header matches INDEX_ADMIN_TOKEN, so the endpoints stay invisible."""
+    candidate = request.headers.get("x-admin-token")
+    if not INDEX_ADMIN_TOKEN or candidate is None or not hmac.compare_digest(candidate, INDEX_ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/admin/index", include_in_schema=False)
+async def index_info(request: Request):
+    """Header (model, preprocessing version, dimension, rows, checksum) of this worker's live index."""
+    _require_index_admin(request)
+    index = loaded_card_index()
+    return {"loaded": index is not None, "index": index.describe() if index is not None else None}
+
+@app.post("/admin/index/reload", include_in_schema=False)
+async def reload_index(request: Request, force: bool = False):
+    """
+    Load the index files on disk and swap them in without dropping scans.
+    Only reloads the worker that receives the request; under serve.py each
+    worker's index watcher (INDEX_WATCH_SECONDS) picks up a rebuilt index on its own.
+    """
+    _require_index_admin(request)
+    try:
+        result = await asyncio.to_thread(reload_card_index, force)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"Index reload failed, keeping the current index: {e}")
+        raise HTTPException(status_code=409, detail=f"Index not reloaded: {e}")
+    if result["reloaded"]:
+        logger.info(f"Reloaded embedding index in {result['seconds']}s",
+                    extra={"fields": {"rows": result["index"]["rows"]}})
+    return result
+
+@api_router.get("/stats")
+async def cache_stats():
+    """Hit-rate metrics for the scan-path caches."""
+    ocr_client = get_ocr_client()
+    ocr_lookups = ocr_client.cache_hits + ocr_client.cache_misses
+    return {
+        "scanCache": scan_result_cache.stats(),
+        "ocrCache": {
+            "hits": ocr_client.cache_hits,
+            "misses": ocr_client.cache_misses,
+            "hitRate": round(ocr_client.cache_hits / ocr_lookups, 4) if ocr_lookups else 0.0,
+        },
+        "textEmbeddingCache": text_embedding_cache.stats(),
+    }
+
 # Remove manual auth endpoints - SuperTokens handles them automatically through middleware
 # The following endpoints are automatically created by SuperTokens:
 # - /auth/signinup (POST) - handles OTP sending and verification
@@ -537,4 +1285,6 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # log_config=None: uvicorn's loggers (including the access log) propagate to the
+    # queued root handler instead of writing to stdout synchronously
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None) 
\ No newline at end of file
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Component microbenchmarks for the scan hot path.
+
+Times each stage separately so a change can be attributed to the stage it
+touched:
+    decode_*          upload bytes -> RGB bitmap (legacy full decode vs reduced)
+    preprocess_image  border crop, 224px resize, sharpen
+    clip_processor    CLIPProcessor normalization to pixel_values
+    forward_b{1,8,32} model.get_image_features at batch sizes 1/8/32
+    search_{n}        CardEmbeddingIndex.coarse_candidates (cosine scoring + top-100
+                      selection) over n synthetic vectors
+    card_lookup       get_card_from_db + get_average_price
+
+Results are written as JSON (median/p95/min in ms per benchmark plus run
+metadata). Pass --baseline to compare against a stored run; benchmarks whose
+median got slower by more than --tolerance are reported as regressions.
+
+Usage:
+    python benchmark_suite.py [--stub-model] [--quick] [--only search]
+                              [--output benchmark_results.json]
+                              [--baseline benchmark_baseline.json] [--tolerance 0.15]
+                              [--fail-on-regression]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import torch
+
+from decode_benchmark import legacy_decode, synthetic_phone_photo
+from image_decode import decode_for_scan
+from image_similarity import CardEmbeddingIndex, ImageEmbeddingModel, preprocess_image
+
+DEFAULT_CATALOG_SIZES = (19_000, 100_000, 1_000_000)
+FORWARD_BATCH_SIZES = (1, 8, 32)
+EMBEDDING_DIM = 512
+
+
+def time_callable(fn, min_repeat=5, min_seconds=0.5, warmup=1):
+    """
+    Run fn until both min_repeat calls and min_seconds of wall time have elapsed.
+
+    Returns:
+        dict: median_ms, p95_ms, min_ms and the number of timed calls
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while len(timings) < min_repeat or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": float(np.median(timings)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "min_ms": float(np.min(timings)),
+        "repeat": len(timings),
+    }
+
+
+def synthetic_index(size, dim=EMBEDDING_DIM, seed=0):
+    """Unit-normalized random vectors shaped like embeddings.npy."""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((size, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    card_ids = [f"synthetic-{i}" for i in range(size)]
+    return CardEmbeddingIndex(embeddings, card_ids, np.arange(size))
+
+
+@contextmanager
+def card_database(db_path):
+    """
+    Run inside a directory whose pokemon_cards.db is db_path, or a one-card
+    synthetic database when db_path does not exist (card_store opens the
+    relative path 'pokemon_cards.db').
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if os.path.exists(db_path):
+            os.symlink(os.path.abspath(db_path), os.path.join(temp_dir, "pokemon_cards.db"))
+            conn = sqlite3.connect(db_path)
+            card_id = conn.execute("SELECT id FROM pokemon_cards LIMIT 1").fetchone()[0]
+            conn.close()
+        else:
+            card_id = "bench-1"
+            conn = sqlite3.connect(os.path.join(temp_dir, "pokemon_cards.db"))
+            conn.execute("""
+                CREATE TABLE pokemon_cards (
+                    id TEXT PRIMARY KEY, name TEXT NOT NULL, number TEXT, set_id TEXT, set_name TEXT,
+                    set_total INTEGER, image_large TEXT, attacks TEXT, types TEXT, subtypes TEXT,
+                    tcgplayer_prices TEXT, cardmarket_prices TEXT, updated_at TIMESTAMP
+                )
+            """)
+            conn.execute(
+                "INSERT INTO pokemon_cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (card_id, "Pikachu", "58", "base1", "Base", 102, "https://images.example/base1-58.png",
+                 json.dumps([{"name": "Thunder Jolt", "damage": "30"}]), json.dumps(["Lightning"]),
+                 json.dumps(["Basic"]), json.dumps({"holofoil": {"market": 12.5, "mid": 11.0}}),
+                 json.dumps({"averageSellPrice": 10.1})),
+            )
+            conn.commit()
+            conn.close()
+        os.chdir(temp_dir)
+        try:
+            yield card_id
+        finally:
+            os.chdir(previous)
+
+
+def run_benchmarks(args):
+    """Run the selected benchmarks and return {name: timing dict}."""
+    from card_store import get_average_price, get_card_from_db
+
+    repeat = {"min_repeat": 3, "min_seconds": 0.1} if args.quick else {"min_repeat": 5, "min_seconds": 0.5}
+    selected = lambda name: not args.only or any(part in name for part in args.only)
+    results = {}
+
+    def record(name, fn, **overrides):
+        if not selected(name):
+            return
+        results[name] = time_callable(fn, **{**repeat, **overrides})
+        print(f"{name:<22}{results[name]['median_ms']:>12.3f}{results[name]['p95_ms']:>12.3f}")
+
+    print(f"{'benchmark':<22}{'median ms':>12}{'p95 ms':>12}")
+
+    photo = synthetic_phone_photo()
+    record("decode_legacy", lambda: legacy_decode(photo))
+    record("decode_reduced", lambda: decode_for_scan(photo))
+
+    decoded = decode_for_scan(photo)
+    record("preprocess_image", lambda: preprocess_image(decoded))
+
+    clip = ImageEmbeddingModel()
+    preprocessed = preprocess_image(decoded)
+    record("clip_processor", lambda: clip.processor(images=preprocessed, return_tensors="pt", padding=True))
+
+    pixel_values = clip.processor(images=preprocessed, return_tensors="pt", padding=True)["pixel_values"]
+    for batch_size in FORWARD_BATCH_SIZES:
+        batch = pixel_values.repeat(batch_size, 1, 1, 1).to(clip.device)
+
+        def forward(batch=batch):
+            with torch.no_grad():
+                clip.model.get_image_features(pixel_values=batch)
+
+        record(f"forward_b{batch_size}", forward)
+
+    rng = np.random.default_rng(1)
+    query = rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
+    query /= np.linalg.norm(query)
+    for size in args.catalog_sizes:
+        name = f"search_{size}"
+        if not selected(name):
+            continue
+        index = synthetic_index(size)
+        record(name, lambda index=index: index.coarse_candidates(query))
+        del index
+
+    if selected("card_lookup"):
+        with card_database(args.db) as card_id:
+            record("card_lookup", lambda: get_average_price(get_card_from_db(card_id)))
+
+    return results
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "model": "stub" if args.stub_model else "openai/clip-vit-base-patch32",
+        "quick": args.quick,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compare medians against a stored run.
+
+    Returns:
+        list: Names of benchmarks slower than baseline by more than tolerance
+    """
+    if baseline["metadata"].get("model") != results["metadata"]["model"]:
+        print("Warning: baseline was recorded with a different model; forward/processor numbers are not comparable.")
+
+    regressions = []
+    print(f"\n{'benchmark':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1 if previous["median_ms"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<22}{previous['median_ms']:>12.3f}{current['median_ms']:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub-model", action="store_true", help="Use the offline stub model instead of CLIP")
+    parser.add_argument("--quick", action="store_true", help="Fewer timed calls, skip the 1M-vector search")
+    parser.add_argument("--only", nargs="*", help="Run only benchmarks whose name contains one of these")
+    parser.add_argument("--catalog-sizes", nargs="*", type=int, help="Synthetic catalog sizes for search")
+    parser.add_argument("--db", default="pokemon_cards.db", help="Card database (synthetic one-card DB if missing)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Stored results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed median slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any benchmark regressed")
+    args = parser.parse_args()
+
+    if args.catalog_sizes is None:
+        args.catalog_sizes = [size for size in DEFAULT_CATALOG_SIZES if not (args.quick and size >= 1_000_000)]
+
+    if args.stub_model:
+        from stub_model import install_stub_model
+        install_stub_model()
+
+    results = {"metadata": run_metadata(args), "benchmarks": run_benchmarks(args)}
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Columnar card attributes for metadata-filtered vector search.
+
+For every row of the embedding index we keep set_id, supertype, types and
+regulationMark (joined from pokemon_cards by card ID) as precomputed boolean
+masks, one per distinct value. A filter is resolved to the matching row numbers
+with a few vectorized OR/AND operations before any vector is scored, so the
+similarity scan only touches the rows that can actually be returned.
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'pokemon_cards.db'
+
+# Filter name -> pokemon_cards column. Values of multi-valued columns are JSON lists.
+FILTERABLE_FIELDS = {
+    "set_id": "set_id",
+    "supertype": "supertype",
+    "types": "types",
+    "regulation_mark": "regulationMark",
+}
+MULTI_VALUED_FIELDS = {"types"}
+
+
+class CardAttributeIndex:
+    """Per-value row bitmasks for each filterable attribute."""
+
+    def __init__(self, card_ids: Sequence[str], attributes: Dict[str, Dict[str, object]]):
+        """
+        Args:
+            card_ids: Card ID of each index row, in row order
+            attributes: card_id -> {filter name -> value (or list of values)}
+        """
+        self.num_rows = len(card_ids)
+        self.masks: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in FILTERABLE_FIELDS}
+
+        for row, card_id in enumerate(card_ids):
+            card_attributes = attributes.get(card_id)
+            if not card_attributes:
+                continue
+            for field in FILTERABLE_FIELDS:
+                values = card_attributes.get(field)
+                if values is None:
+                    continue
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    key = self._normalize_value(value)
+                    mask = self.masks[field].get(key)
+                    if mask is None:
+                        mask = self.masks[field][key] = np.zeros(self.num_rows, dtype=bool)
+                    mask[row] = True
+
+    @staticmethod
+    def _normalize_value(value) -> str:
+        # Filters are case-insensitive ("trainer" == "Trainer")
+        return str(value).strip().lower()
+
+    @classmethod
+    def from_database(cls, card_ids: Sequence[str], db_path: str = DB_PATH) -> "CardAttributeIndex":
+        """Join the index rows to pokemon_cards and build the masks."""
+        columns = ", ".join(FILTERABLE_FIELDS.values())
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT id, {columns} FROM pokemon_cards")
+            attributes = {}
+            for row in cursor.fetchall():
+                card_attributes = {}
+                for field, value in zip(FILTERABLE_FIELDS, row[1:]):
+                    if field in MULTI_VALUED_FIELDS and isinstance(value, str):
+                        try:
+                            value = json.loads(value)
+                        except json.JSONDecodeError:
+                            pass
+                    card_attributes[field] = value
+                attributes[row[0]] = card_attributes
+        finally:
+            cursor.close()
+            conn.close()
+
+        index = cls(card_ids, attributes)
+        logger.info(
+            "Built card attribute index: "
+            + ", ".join(f"{field}={len(values)} values" for field, values in index.masks.items())
+        )
+        return index
+
+    def filter_mask(self, filters: Dict[str, Iterable[str]]) -> Optional[np.ndarray]:
+        """
+        Combine filters into one row mask: values within a field are OR-ed,
+        fields are AND-ed. Returns None when no filter is active.
+        """
+        combined = None
+        for field, values in filters.items():
+            if field not in self.masks:
+                raise ValueError(f"Unknown filter field: {field}")
+            values = [value for value in (values or []) if value]
+            if not values:
+                continue
+            field_mask = np.zeros(self.num_rows, dtype=bool)
+            for value in values:
+                value_mask = self.masks[field].get(self._normalize_value(value))
+                if value_mask is not None:
+                    field_mask |= value_mask
+            combined = field_mask if combined is None else (combined & field_mask)
+        return combined
+
+    def filter_rows(self, filters: Dict[str, Iterable[str]]) -> Optional[np.ndarray]:
+        """Row numbers matching the filters, or None when no filter is active."""
+        mask = self.filter_mask(filters)
+        return None if mask is None else np.flatnonzero(mask)
+
+    def values(self, field: str) -> List[str]:
+        """Distinct (normalized) values available for a filter field."""
+        return sorted(self.masks.get(field, {}))
@@ -0,0 +1,354 @@
+"""
+Find and rectify every card in a photo (binder pages, cards laid out on a table).
+
+Classical edge/contour analysis, NumPy and PIL only:
+
+1. Sobel gradient magnitude on a downscaled grayscale copy, thresholded with Otsu.
+2. Connected components of the edge mask (run-wise label propagation with
+   pointer jumping, so it converges in a handful of vectorized passes).
+3. Each component's extreme points (min/max of x+y and x-y) give a candidate
+   quadrilateral. It is kept if it is large enough, has a card's aspect ratio
+   (63x88 mm, with slack for perspective) and its four sides lie on edges.
+4. Cards in a binder often touch and form one component. A quad is split into
+   an n x m grid when its rectified edge map shows straight seams at the grid
+   lines and the grid cells have a card's aspect ratio.
+5. A quad around two or more other cards that does not split into a grid is a
+   page or binder outline and is dropped. A quad inside another card is part of
+   that card's layout (art box, text box) and is dropped too.
+
+Each card is warped to an upright DETECT_CROP_SIZE image with a perspective
+transform, so it looks like the catalog scans before being embedded.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Analysis resolution (longest side); detection only needs coarse structure
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", "640"))
+# Rectified crop size, portrait 5:7 like the catalog images
+DETECT_CROP_SIZE = (440, 616)
+# Width / height of a portrait card, and how far a detected quad may deviate
+CARD_ASPECT = 63 / 88
+ASPECT_TOLERANCE = 0.2
+# Smallest card as a fraction of the photo area (a 4x4 page is ~6% per card)
+MIN_CARD_AREA_FRACTION = 0.005
+# Fraction of points along each side that must lie on an edge
+MIN_SIDE_SUPPORT = 0.5
+# Grid seams: a straight line covering this fraction of every band it crosses
+MIN_SEAM_STRENGTH = 0.8
+MAX_GRID = 4
+# An outline inside another one, covering at least this fraction of it, is a
+# tighter outline of the same thing (page margin, sleeve, inner border ring)
+CONCENTRIC_AREA_RATIO = 0.6
+# Detections smaller than this fraction of the largest card are dropped
+MIN_RELATIVE_CARD_AREA = 0.5
+
+
+def perspective_coefficients(source, target):
+    """Coefficients for Image.transform(PERSPECTIVE) mapping target corners back to source corners."""
+    matrix = []
+    for (x, y), (u, v) in zip(target, source):
+        matrix.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        matrix.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+    return np.linalg.solve(np.array(matrix, dtype=np.float64), np.array(source, dtype=np.float64).reshape(8))
+
+
+def _apply_perspective(coefficients, points: np.ndarray) -> np.ndarray:
+    a, b, c, d, e, f, g, h = coefficients
+    x, y = points[:, 0], points[:, 1]
+    w = g * x + h * y + 1
+    return np.stack([(a * x + b * y + c) / w, (d * x + e * y + f) / w], axis=1)
+
+
+def _otsu_threshold(values: np.ndarray) -> float:
+    hist, bin_edges = np.histogram(values, bins=256)
+    centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    weight_low = np.cumsum(hist)
+    weight_high = weight_low[-1] - weight_low
+    sum_low = np.cumsum(hist * centers)
+    mean_low = sum_low / np.maximum(weight_low, 1)
+    mean_high = (sum_low[-1] - sum_low) / np.maximum(weight_high, 1)
+    between = weight_low * weight_high * (mean_low - mean_high) ** 2
+    return float(centers[np.argmax(between)])
+
+
+def edge_mask(gray: Image.Image) -> np.ndarray:
+    """Boolean edge map: Otsu-thresholded Sobel magnitude, dilated by one pixel to close small gaps."""
+    g = np.asarray(gray.filter(ImageFilter.GaussianBlur(1)), dtype=np.float32)
+    gx = np.zeros_like(g)
+    gy = np.zeros_like(g)
+    gx[1:-1, 1:-1] = (g[:-2, 2:] + 2 * g[1:-1, 2:] + g[2:, 2:]) - (g[:-2, :-2] + 2 * g[1:-1, :-2] + g[2:, :-2])
+    gy[1:-1, 1:-1] = (g[2:, :-2] + 2 * g[2:, 1:-1] + g[2:, 2:]) - (g[:-2, :-2] + 2 * g[:-2, 1:-1] + g[:-2, 2:])
+    magnitude = np.hypot(gx, gy)
+    mask = magnitude > max(_otsu_threshold(magnitude), 40.0)
+    dilated = Image.fromarray(mask.astype(np.uint8) * 255).filter(ImageFilter.MaxFilter(3))
+    return np.asarray(dilated) > 0
+
+
+def _propagate_along_rows(labels: np.ndarray, mask: np.ndarray) -> None:
+    """Give every horizontal run of foreground pixels the smallest label in it (in place)."""
+    flat_mask = mask.ravel()
+    starts = flat_mask.copy()
+    starts[1:] &= ~flat_mask[:-1]
+    starts[::mask.shape[1]] = flat_mask[::mask.shape[1]]  # runs never wrap onto the next row
+    foreground = np.flatnonzero(flat_mask)
+    run_ids = np.cumsum(starts[foreground]) - 1
+    values = labels.ravel()[foreground]
+    run_min = np.minimum.reduceat(values, np.flatnonzero(starts[foreground]))
+    labels.ravel()[foreground] = run_min[run_ids]
+
+
+def label_components(mask: np.ndarray) -> np.ndarray:
+    """
+    4-connected component labels (-1 for background); a label is the flat index
+    of one of the component's pixels. Alternates whole-run minimum propagation
+    along rows and columns with pointer jumping, so it needs only a handful of
+    vectorized passes even for long, winding outlines.
+    """
+    height, width = mask.shape
+    if not mask.any():
+        return np.full(mask.shape, -1, dtype=np.int64)
+    labels = np.where(mask, np.arange(height * width, dtype=np.int64).reshape(height, width), -1)
+    foreground = np.flatnonzero(mask)
+    mask_t = np.ascontiguousarray(mask.T)
+    while True:
+        previous = labels.copy()
+        _propagate_along_rows(labels, mask)
+        labels_t = np.ascontiguousarray(labels.T)
+        _propagate_along_rows(labels_t, mask_t)
+        labels = np.ascontiguousarray(labels_t.T)
+        # Pointer jumping: every pixel adopts its label's label
+        flat = labels.ravel()
+        for _ in range(4):
+            flat[foreground] = flat[flat[foreground]]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def _quad_metrics(quad: np.ndarray) -> Tuple[float, float, float]:
+    """(area, width, height) of a tl, tr, br, bl quadrilateral."""
+    x, y = quad[:, 0], quad[:, 1]
+    area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+    width = (np.linalg.norm(quad[1] - quad[0]) + np.linalg.norm(quad[2] - quad[3])) / 2
+    height = (np.linalg.norm(quad[3] - quad[0]) + np.linalg.norm(quad[2] - quad[1])) / 2
+    return area, width, height
+
+
+def _is_card_shaped(width: float, height: float) -> bool:
+    if width <= 0 or height <= 0:
+        return False
+    aspect = min(width, height) / max(width, height)
+    return abs(aspect - CARD_ASPECT) <= ASPECT_TOLERANCE * CARD_ASPECT
+
+
+def _side_support(mask: np.ndarray, quad: np.ndarray, samples: int = 40) -> float:
+    """Smallest fraction, over the four sides, of sample points that land on an edge."""
+    height, width = mask.shape
+    t = np.linspace(0.1, 0.9, samples)[:, None]
+    support = []
+    for start, end in zip(quad, np.roll(quad, -1, axis=0)):
+        points = np.rint(start + t * (end - start)).astype(int)
+        xs = np.clip(points[:, 0], 0, width - 1)
+        ys = np.clip(points[:, 1], 0, height - 1)
+        support.append(mask[ys, xs].mean())
+    return min(support)
+
+
+def _component_quads(mask: np.ndarray, labels: np.ndarray) -> List[np.ndarray]:
+    """Card-shaped, edge-supported quads from the extreme points of each large component."""
+    height, width = mask.shape
+    min_area = MIN_CARD_AREA_FRACTION * height * width
+    flat = labels.ravel()
+    pixels = np.flatnonzero(flat >= 0)
+    component_labels, counts = np.unique(flat[pixels], return_counts=True)
+    # A card outline has at least its perimeter in edge pixels
+    min_pixels = 2 * np.sqrt(min_area)
+
+    order = np.argsort(flat[pixels], kind="stable")
+    groups = np.split(pixels[order], np.cumsum(counts)[:-1])
+    quads = []
+    for group, count in zip(groups, counts):
+        if count < min_pixels:
+            continue
+        ys, xs = np.divmod(group, width)
+        s, d = xs + ys, xs - ys
+        quad = np.array([
+            [xs[np.argmin(s)], ys[np.argmin(s)]],  # top-left
+            [xs[np.argmax(d)], ys[np.argmax(d)]],  # top-right
+            [xs[np.argmax(s)], ys[np.argmax(s)]],  # bottom-right
+            [xs[np.argmin(d)], ys[np.argmin(d)]],  # bottom-left
+        ], dtype=np.float64)
+        area, quad_width, quad_height = _quad_metrics(quad)
+        if area < min_area or area > 0.98 * height * width:
+            continue
+        if not _is_card_shaped(quad_width, quad_height):
+            continue
+        if _side_support(mask, quad) < MIN_SIDE_SUPPORT:
+            continue
+        quads.append(quad)
+    return quads
+
+
+def _contains(outer: np.ndarray, point: np.ndarray) -> bool:
+    """Point-in-convex-quad test (corners in order)."""
+    edges, offsets = np.roll(outer, -1, axis=0) - outer, point - outer
+    cross = edges[:, 0] * offsets[:, 1] - edges[:, 1] * offsets[:, 0]
+    return all(c >= 0 for c in cross) or all(c <= 0 for c in cross)
+
+
+def _select_cards(mask: np.ndarray, quads: List[np.ndarray]) -> List[np.ndarray]:
+    """Resolve nested candidates into one quad per card, splitting merged grids."""
+    centers = [quad.mean(axis=0) for quad in quads]
+    areas = [_quad_metrics(quad)[0] for quad in quads]
+    # j is inside i: smaller, and centred within i (concentric outlines have equal centres)
+    inside = [{j for j in range(len(quads)) if areas[j] < areas[i] and _contains(quads[i], centers[j])}
+              for i in range(len(quads))]
+
+    def separate_children(i):
+        # Children of i that are not themselves inside another child (art box within a card)
+        return [j for j in inside[i] if not any(j in inside[k] for k in inside[i] if k != j)]
+
+    cards, dropped = [], set()
+    # An outline around several cards (page, binder) is either a grid of touching
+    # cards, which replaces everything inside it, or just a frame, which goes
+    for i in sorted(range(len(quads)), key=lambda i: -areas[i]):
+        if i in dropped or len(separate_children(i)) < 2:
+            continue
+        dropped.add(i)
+        cells = _grid_split(mask, quads[i])
+        if len(cells) > 1:
+            cards.extend(cells)
+            # The grid explains everything inside it, and anything around it is a frame
+            dropped |= inside[i] | {k for k in range(len(quads)) if i in inside[k]}
+
+    remaining = [i for i in range(len(quads)) if i not in dropped]
+    for i in remaining:
+        if any(i in inside[j] for j in remaining if j != i):
+            continue  # Drawn inside a card (art box, inner border ring): part of it
+        # A concentric outline just inside this one (page margin around a grid of
+        # touching cards) may split more cleanly; on a tie the tighter grid wins,
+        # but a single card keeps its outermost edge
+        splits = [_grid_split(mask, quads[i])]
+        splits += [_grid_split(mask, quads[j]) for j in sorted(inside[i] & set(remaining), key=lambda j: -areas[j])
+                   if areas[j] >= CONCENTRIC_AREA_RATIO * areas[i]]
+        most = max(len(cells) for cells in splits)
+        cards.extend(splits[0] if most == 1 else [cells for cells in splits if len(cells) == most][-1])
+    return cards
+
+
+def _grid_split(mask: np.ndarray, quad: np.ndarray) -> List[np.ndarray]:
+    """Split a quad covering several touching cards along straight seams, or return it unchanged."""
+    _, quad_width, quad_height = _quad_metrics(quad)
+    rect_width, rect_height = max(int(quad_width), 8), max(int(quad_height), 8)
+    rect_corners = [(0, 0), (rect_width, 0), (rect_width, rect_height), (0, rect_height)]
+    to_image = perspective_coefficients(quad, rect_corners)
+    rectified = Image.fromarray(mask.astype(np.uint8) * 255).transform(
+        (rect_width, rect_height), Image.Transform.PERSPECTIVE, to_image, Image.Resampling.NEAREST)
+    edges = np.asarray(rectified) > 0
+    # Cells must still be card-sized at the analysis resolution
+    min_cell_area = MIN_CARD_AREA_FRACTION * mask.size
+
+    def seam_strength(profile_edges, position, bands):
+        # A seam is a straight line through the whole quad, not just a dense stretch
+        # of artwork: take the best line near `position` in each band, then the weakest band
+        window = max(2, int(0.03 * profile_edges.shape[1]))
+        near = profile_edges[:, max(0, position - window):position + window + 1]
+        return min(band.mean(axis=0).max() for band in np.array_split(near, bands, axis=0))
+
+    best = (1, 1)
+    for rows in range(1, MAX_GRID + 1):
+        for cols in range(1, MAX_GRID + 1):
+            cell_width, cell_height = rect_width / cols, rect_height / rows
+            if rows * cols <= best[0] * best[1] or not _is_card_shaped(cell_width, cell_height):
+                continue
+            # Landscape cells only in a landscape (rotated) page: a portrait card is
+            # never two landscape halves, however straight its art box edge is
+            if cell_width > cell_height and rect_height > rect_width:
+                continue
+            if cell_width * cell_height < min_cell_area:
+                continue
+            # Bands: two per grid cell along the seam
+            seams = [seam_strength(edges, k * rect_width // cols, 2 * rows) for k in range(1, cols)]
+            seams += [seam_strength(edges.T, k * rect_height // rows, 2 * cols) for k in range(1, rows)]
+            if min(seams) >= MIN_SEAM_STRENGTH:
+                best = (rows, cols)
+    rows, cols = best
+    if rows * cols == 1:
+        return [quad]
+
+    cell_width, cell_height = rect_width / cols, rect_height / rows
+    cells = []
+    for row in range(rows):
+        for col in range(cols):
+            x0, y0 = col * cell_width, row * cell_height
+            corners = np.array([[x0, y0], [x0 + cell_width, y0],
+                                [x0 + cell_width, y0 + cell_height], [x0, y0 + cell_height]])
+            cells.append(_apply_perspective(to_image, corners))
+    return cells
+
+
+def _reading_order(quads: List[np.ndarray]) -> List[np.ndarray]:
+    """Sort top-to-bottom in rows, then left-to-right."""
+    if not quads:
+        return quads
+    centers = np.array([quad.mean(axis=0) for quad in quads])
+    heights = np.array([_quad_metrics(quad)[2] for quad in quads])
+    row_gap = np.median(heights) / 2
+    order = np.argsort(centers[:, 1])
+    rows, current = [], [order[0]]
+    for i in order[1:]:
+        if centers[i, 1] - centers[current[-1], 1] > row_gap:
+            rows.append(current)
+            current = []
+        current.append(i)
+    rows.append(current)
+    return [quads[i] for row in rows for i in sorted(row, key=lambda i: centers[i, 0])]
+
+
+def detect_card_quads(image: Image.Image, max_side: int = DETECT_MAX_SIDE) -> List[np.ndarray]:
+    """
+    Find the cards in a photo.
+
+    Returns:
+        list: (4, 2) float arrays of corner coordinates in `image` pixels
+            (top-left, top-right, bottom-right, bottom-left), in reading order.
+            Empty if no card-shaped outline was found.
+    """
+    scale = min(1.0, max_side / max(image.size))
+    gray = image.convert("L")
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale))),
+                           Image.Resampling.BILINEAR)
+    mask = edge_mask(gray)
+    quads = _select_cards(mask, _component_quads(mask, label_components(mask)))
+    if quads:
+        # Cards in one photo are about the same size; much smaller survivors are
+        # art boxes or text panels of a card whose own outline was not closed
+        largest = max(_quad_metrics(quad)[0] for quad in quads)
+        quads = [quad for quad in quads if _quad_metrics(quad)[0] >= MIN_RELATIVE_CARD_AREA * largest]
+    return [quad / scale for quad in _reading_order(quads)]
+
+
+def rectify_card(image: Image.Image, quad: np.ndarray, size: Tuple[int, int] = DETECT_CROP_SIZE) -> Image.Image:
+    """Warp one detected card to an upright size[0] x size[1] image (landscape cards stay landscape)."""
+    _, quad_width, quad_height = _quad_metrics(quad)
+    width, height = size if quad_height >= quad_width else size[::-1]
+    coefficients = perspective_coefficients(quad, [(0, 0), (width, 0), (width, height), (0, height)])
+    return image.transform((width, height), Image.Transform.PERSPECTIVE, coefficients, Image.Resampling.BICUBIC)
+
+
+def detect_cards(image: Image.Image, max_cards: Optional[int] = None) -> List[Tuple[np.ndarray, Image.Image]]:
+    """(quad, rectified crop) for each detected card, in reading order."""
+    quads = detect_card_quads(image)
+    if max_cards is not None:
+        quads = quads[:max_cards]
+    return [(quad, rectify_card(image, quad)) for quad in quads]
+
+
+def single_card_crop(image: Image.Image) -> Optional[Image.Image]:
+    """The rectified card when exactly one card is found in the photo, otherwise None."""
+    quads = detect_card_quads(image)
+    return rectify_card(image, quads[0]) if len(quads) == 1 else None
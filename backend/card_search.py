@@ -0,0 +1,189 @@
+"""
+Full-text and prefix card search backed by SQLite FTS5.
+
+The pokemon_cards_fts virtual table indexes name, set name, artist and the
+attack / ability names pulled out of the JSON columns. Each entry carries its
+card ID in an unindexed column, and results join back to pokemon_cards on that
+primary key. pokemon_cards has a TEXT primary key, so its rowids are not stable
+(VACUUM may renumber them) and are never used to link the two tables.
+"""
+
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'pokemon_cards.db'
+FTS_TABLE = 'pokemon_cards_fts'
+
+# bm25 column weights: card_id (unindexed), name, set_name, artist, attack_names, ability_names
+BM25_WEIGHTS = (0.0, 10.0, 2.0, 1.0, 1.5, 1.5)
+
+# Projection from pokemon_cards into the FTS columns; attack and ability names
+# are extracted from their JSON arrays (malformed JSON indexes as empty).
+_FTS_SOURCE_SELECT = f"""
+    SELECT
+        c.id,
+        c.name,
+        c.set_name,
+        c.artist,
+        (SELECT group_concat(json_extract(a.value, '$.name'), ' ')
+           FROM json_each(CASE WHEN json_valid(c.attacks) THEN c.attacks ELSE '[]' END) AS a),
+        (SELECT group_concat(json_extract(b.value, '$.name'), ' ')
+           FROM json_each(CASE WHEN json_valid(c.abilities) THEN c.abilities ELSE '[]' END) AS b)
+    FROM pokemon_cards AS c
+"""
+
+_FTS_INSERT = f"""
+    INSERT INTO {FTS_TABLE} (card_id, name, set_name, artist, attack_names, ability_names)
+"""
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def create_search_index(cursor: sqlite3.Cursor) -> None:
+    """Create the FTS5 table and the plain name index if they do not exist."""
+    # remove_diacritics lets "flabebe" match "Flabébé"; prefix index keeps short
+    # autocomplete prefixes from walking the whole term list
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            card_id UNINDEXED,
+            name,
+            set_name,
+            artist,
+            attack_names,
+            ability_names,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3 4'
+        )
+    ''')
+    # Exact-name lookups (check_card_name / search_card) use this instead of a table scan
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pokemon_cards_name ON pokemon_cards (name)"
+    )
+
+
+def rebuild_search_index(cursor: sqlite3.Cursor) -> int:
+    """Repopulate the FTS table from pokemon_cards. Returns the number of indexed cards."""
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    cursor.execute(_FTS_INSERT + _FTS_SOURCE_SELECT)
+    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def remove_card_from_search_index(cursor: sqlite3.Cursor, card_id: str) -> None:
+    """Drop a card's FTS entry. Call before the card row is replaced or deleted."""
+    cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE card_id = ?", (card_id,))
+
+
+def add_card_to_search_index(cursor: sqlite3.Cursor, card_id: str) -> None:
+    """Index a card that is already stored in pokemon_cards."""
+    cursor.execute(_FTS_INSERT + _FTS_SOURCE_SELECT + " WHERE c.id = ?", (card_id,))
+
+
+def search_index_in_sync(cursor: sqlite3.Cursor) -> bool:
+    """True if the FTS table has exactly one entry per card and every entry names a stored card."""
+    cursor.execute("SELECT count(*) FROM pokemon_cards")
+    cards = cursor.fetchone()[0]
+    cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+    if cursor.fetchone()[0] != cards:
+        return False
+    cursor.execute(f'''
+        SELECT count(*) FROM {FTS_TABLE} AS f
+        JOIN pokemon_cards AS c ON c.id = f.card_id
+    ''')
+    return cursor.fetchone()[0] == cards
+
+
+def ensure_search_index() -> None:
+    """
+    Create the search index at startup and rebuild it if it does not match
+    pokemon_cards: empty (a database built before search existed), a different
+    number of cards, or entries for cards that are no longer stored.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='pokemon_cards'"
+        )
+        if cursor.fetchone() is None:
+            logger.warning("pokemon_cards table missing, skipping search index setup")
+            return
+        create_search_index(cursor)
+        if not search_index_in_sync(cursor):
+            indexed = rebuild_search_index(cursor)
+            logger.info(f"Built card search index with {indexed} cards")
+        conn.commit()
+    except sqlite3.Error as err:
+        logger.error(f"Failed to set up card search index: {err}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def build_match_query(user_query: str) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+    Every token is quoted (so FTS operators in user input are inert) and the
+    last token becomes a prefix query for autocomplete: "Chari" -> "chari"*.
+    Returns "" if the query has no searchable tokens.
+    """
+    tokens = _TOKEN_PATTERN.findall(user_query.lower())
+    if not tokens:
+        return ""
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_cards(user_query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text / prefix search over card names, sets, artists, attacks and abilities.
+
+    Args:
+        user_query: Free text typed by the user (partial last word allowed)
+        limit: Maximum number of results
+
+    Returns:
+        List of card summaries ordered by relevance (best first)
+    """
+    match_query = build_match_query(user_query)
+    if not match_query:
+        return []
+
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
+            SELECT c.id, c.name, c.number, c.set_name, c.image_small,
+                   bm25({FTS_TABLE}, {weights}) AS score
+            FROM {FTS_TABLE}
+            JOIN pokemon_cards AS c ON c.id = {FTS_TABLE}.card_id
+            WHERE {FTS_TABLE} MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (match_query, limit))
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "number": row[2],
+                "set_name": row[3],
+                "imageUrl": row[4],
+                # bm25 is lower-is-better; flip it so clients see higher-is-better
+                "score": -row[5],
+            }
+            for row in cursor.fetchall()
+        ]
+    except sqlite3.Error as err:
+        logger.error(f"Card search failed for {user_query!r}: {err}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,162 @@
+"""
+Card lookups against the pokemon_cards table.
+Kept free of import-time side effects so scripts and benchmarks can use them
+without starting the API (SuperTokens, background threads).
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+def get_card_updated_at(card_id: str) -> Optional[str]:
+    """
+    Get only the updated_at timestamp of a card (primary-key lookup).
+    Used to answer conditional requests without loading the full row.
+
+    Returns:
+        The timestamp string, "" if the card has no timestamp, None if the card does not exist
+
+    Raises:
+        sqlite3.Error: The lookup failed (not to be mistaken for a missing card)
+    """
+    try:
+        conn = sqlite3.connect('pokemon_cards.db')
+        try:
+            row = conn.execute("SELECT updated_at FROM pokemon_cards WHERE id = ?", (card_id,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as err:
+        logger.error(f"Database error: {err}")
+        raise
+    if row is None:
+        return None
+    return row[0] or ""
+
+def get_card_from_db(card_id: str) -> Dict[str, Any]:
+    """
+    Get card details from SQLite database by card ID.
+    
+    Args:
+        card_id: The Pokemon card ID
+        
+    Returns:
+        Dict containing card details
+    """
+    try:
+        conn = sqlite3.connect('pokemon_cards.db')
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM pokemon_cards WHERE id = ?", (card_id,))
+        row = cursor.fetchone()
+        
+        if row is None:
+            return None
+            
+        # Get column names
+        columns = [description[0] for description in cursor.description]
+        
+        # Create dict from row data
+        card_data = dict(zip(columns, row))
+        
+        # Parse JSON fields
+        json_fields = ['abilities', 'attacks', 'subtypes', 'types', 'weaknesses', 
+                      'resistances', 'nationalPokedexNumbers', 'retreatCost',
+                      'cardmarket_prices', 'tcgplayer_prices']
+        
+        for field in json_fields:
+            if card_data.get(field) and isinstance(card_data[field], str):
+                try:
+                    card_data[field] = json.loads(card_data[field])
+                except json.JSONDecodeError:
+                    # Keep as string if JSON parsing fails
+                    pass
+        
+        cursor.close()
+        conn.close()
+        
+        return card_data
+        
+    except sqlite3.Error as err:
+        logger.error(f"Database error: {err}")
+        return None
+
+def card_summaries(card_ids: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Card summaries in the shape /search returns, in the given order.
+    Unknown IDs are skipped; a database error yields an empty list.
+    """
+    if not card_ids:
+        return []
+    try:
+        conn = sqlite3.connect('pokemon_cards.db')
+        try:
+            placeholders = ", ".join("?" * len(card_ids))
+            rows = conn.execute(f'''
+                SELECT id, name, number, set_name, image_small FROM pokemon_cards WHERE id IN ({placeholders})
+            ''', list(card_ids)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as err:
+        logger.error(f"Database error: {err}")
+        return []
+    by_id = {row[0]: row for row in rows}
+    return [
+        {"id": row[0], "name": row[1], "number": row[2], "set_name": row[3], "imageUrl": row[4]}
+        for row in (by_id.get(card_id) for card_id in card_ids) if row is not None
+    ]
+
+def get_average_price(card_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract average price information from card data.
+    
+    Args:
+        card_data: Card data from database
+        
+    Returns:
+        Dict with pricing information
+    """
+    pricing_info = {
+        "averagePrice": None,
+        "priceSource": None,
+        "currency": "USD"
+    }
+    
+    # Try to get price from TCGPlayer first (usually more reliable)
+    if card_data.get("tcgplayer_prices") and isinstance(card_data["tcgplayer_prices"], dict):
+        tcg_prices = card_data["tcgplayer_prices"]
+        
+        # Look for normal market price first
+        normal_prices = tcg_prices.get("normal")
+        if normal_prices and isinstance(normal_prices, dict) and normal_prices.get("market"):
+            pricing_info["averagePrice"] = normal_prices["market"]
+            pricing_info["priceSource"] = "TCGPlayer"
+        # Fallback to normal mid price
+        elif normal_prices and isinstance(normal_prices, dict) and normal_prices.get("mid"):
+            pricing_info["averagePrice"] = normal_prices["mid"]
+            pricing_info["priceSource"] = "TCGPlayer"
+        # Try holofoil market price
+        elif tcg_prices.get("holofoil") and isinstance(tcg_prices["holofoil"], dict) and tcg_prices["holofoil"].get("market"):
+            pricing_info["averagePrice"] = tcg_prices["holofoil"]["market"]
+            pricing_info["priceSource"] = "TCGPlayer"
+        # Try holofoil mid price
+        elif tcg_prices.get("holofoil") and isinstance(tcg_prices["holofoil"], dict) and tcg_prices["holofoil"].get("mid"):
+            pricing_info["averagePrice"] = tcg_prices["holofoil"]["mid"]
+            pricing_info["priceSource"] = "TCGPlayer"
+    
+    # Fallback to CardMarket if TCGPlayer doesn't have price
+    if pricing_info["averagePrice"] is None and card_data.get("cardmarket_prices") and isinstance(card_data["cardmarket_prices"], dict):
+        cm_prices = card_data["cardmarket_prices"]
+        
+        if cm_prices.get("averageSellPrice"):
+            pricing_info["averagePrice"] = cm_prices["averageSellPrice"]
+            pricing_info["priceSource"] = "CardMarket"
+            pricing_info["currency"] = "EUR"
+        elif cm_prices.get("trendPrice"):
+            pricing_info["averagePrice"] = cm_prices["trendPrice"]
+            pricing_info["priceSource"] = "CardMarket"
+            pricing_info["currency"] = "EUR"
+    
+    return pricing_info
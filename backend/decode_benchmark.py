@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Measure scan-path decode cost: legacy full decode vs reduced-resolution decode.
+
+For each sample photo it reports decode time and the size of the bitmap that
+stays resident for the rest of the scan. Without arguments it synthesizes a
+12-megapixel (4032x3024) JPEG, the typical modern phone photo.
+
+Usage:
+    python decode_benchmark.py [photo.jpg ...] [--repeat 10]
+"""
+
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from image_decode import decode_for_scan
+
+
+def legacy_decode(contents):
+    """What scan_card did before: verify, reopen, decode at full resolution."""
+    img = Image.open(BytesIO(contents))
+    img.verify()
+    img = Image.open(BytesIO(contents))
+    return img.convert("RGB")
+
+
+def synthetic_phone_photo(width=4032, height=3024, quality=90):
+    """Smooth gradients plus noise, so JPEG size is realistic (a few MB)."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 255 // (width + height))], axis=-1)
+    noise = rng.integers(-20, 20, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def measure(decode, contents, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        img = decode(contents)
+        timings.append((time.perf_counter() - start) * 1000)
+    bitmap_bytes = img.size[0] * img.size[1] * len(img.getbands())
+    return float(np.median(timings)), img.size, bitmap_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("photos", nargs="*", help="Sample photos (default: synthetic 12 MP JPEG)")
+    parser.add_argument("--repeat", type=int, default=10, help="Decodes per measurement")
+    args = parser.parse_args()
+
+    samples = [(path, open(path, "rb").read()) for path in args.photos]
+    if not samples:
+        samples = [("synthetic-12MP.jpg", synthetic_phone_photo())]
+
+    print(f"{'photo':<28}{'method':<10}{'size':>12}{'median ms':>12}{'bitmap MB':>12}")
+    for name, contents in samples:
+        for method, decode in (("legacy", legacy_decode), ("reduced", decode_for_scan)):
+            median_ms, size, bitmap_bytes = measure(decode, contents, args.repeat)
+            print(f"{name[-27:]:<28}{method:<10}{f'{size[0]}x{size[1]}':>12}{median_ms:>12.1f}{bitmap_bytes / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Identification accuracy vs. latency across scan-pipeline configurations.
+
+Builds a reproducible query set from catalog images with camera-style
+augmentations (perspective, blur, glare, JPEG compression, sleeves, off-centre
+crops on a background) and runs every query through the scan pipeline
+(decode_for_scan + embedding_image_search, or the perceptual-hash engine) under
+each configuration. Reports top-1/top-10 accuracy, latency, throughput and peak
+memory per configuration, marks the Pareto-optimal ones (no other configuration
+is both more accurate and faster), and writes everything as JSON.
+
+OCR re-ranking is not part of the evaluation (it needs the external OCR
+service). Query embeddings are never cached on disk, so every query pays for
+its own inference.
+
+Usage:
+    python eval_accuracy.py [--samples 200] [--variants 2] [--seed 0]
+                            [--configs accurate global-only fast ...]
+                            [--query-dir eval_queries] [--rebuild]
+                            [--output eval_results.json]
+
+The perceptual-hash fast mode against CLIP is the "fast" vs "accurate" pair:
+    python eval_accuracy.py --configs accurate fast
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+import requests
+import torch
+from PIL import Image, ImageFilter, ImageOps
+
+import image_similarity
+from card_detection import single_card_crop
+from image_decode import SCAN_DECODE_MIN_SIDE, decode_for_scan
+from image_similarity import embedding_image_search, get_card_index, load_image_urls, phash_image_similarity
+
+card_db_file = "card_names.csv"
+
+# Each configuration only overrides what differs from production
+CONFIGURATIONS = {
+    "accurate": {},
+    "coarse-50": {"coarse_candidates": 50},
+    "coarse-20": {"coarse_candidates": 20},
+    "global-only": {"regions": False},
+    "decode-480": {"decode_min_side": 480},
+    "decode-360-global-only": {"decode_min_side": 360, "regions": False},
+    "single-thread": {"torch_threads": 1},
+    "fast": {"engine": "fast"},
+}
+DEFAULT_CONFIGURATION = {
+    "engine": "clip",
+    "regions": True,
+    "coarse_candidates": image_similarity.COARSE_CANDIDATES,
+    "decode_min_side": SCAN_DECODE_MIN_SIDE,
+    "torch_threads": None,
+}
+
+
+def _perspective_coefficients(source, target):
+    """Coefficients for Image.transform(PERSPECTIVE) mapping target corners back to source corners."""
+    matrix = []
+    for (x, y), (u, v) in zip(target, source):
+        matrix.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        matrix.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+    return np.linalg.solve(np.array(matrix, dtype=np.float64), np.array(source, dtype=np.float64).reshape(8))
+
+
+def augment(card, rng):
+    """
+    One hand-held phone photo of the card: optional sleeve, placed off-centre on
+    a background, perspective tilt, glare, blur and JPEG compression.
+
+    Returns:
+        tuple: (encoded JPEG bytes, dict of the applied augmentation parameters)
+    """
+    card = card.convert("RGB")
+    params = {}
+
+    if rng.random() < 0.5:
+        # Penny sleeve: a light border plus a faint milky overlay
+        border = max(4, card.size[0] // 40)
+        card = ImageOps.expand(card, border=border, fill=(225, 228, 232))
+        card = Image.blend(card, Image.new("RGB", card.size, (255, 255, 255)), rng.uniform(0.03, 0.1))
+        params["sleeve"] = True
+
+    width, height = card.size
+    canvas_width, canvas_height = int(width * rng.uniform(1.1, 1.4)), int(height * rng.uniform(1.1, 1.4))
+    background = np.full((canvas_height, canvas_width, 3), [rng.randint(20, 200) for _ in range(3)], dtype=np.int16)
+    background += np.random.default_rng(rng.randint(0, 2**31)).integers(-15, 15, background.shape, dtype=np.int16)
+    canvas = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8))
+    offset = (rng.randint(0, canvas_width - width), rng.randint(0, canvas_height - height))
+    canvas.paste(card, offset)
+    params["offset"] = [offset[0] / canvas_width, offset[1] / canvas_height]
+
+    # Perspective: jitter each corner by up to 6% of the canvas
+    jitter = rng.uniform(0.0, 0.06)
+    corners = [(0, 0), (canvas_width, 0), (canvas_width, canvas_height), (0, canvas_height)]
+    moved = [(x + rng.uniform(-jitter, jitter) * canvas_width, y + rng.uniform(-jitter, jitter) * canvas_height)
+             for x, y in corners]
+    canvas = canvas.transform(canvas.size, Image.Transform.PERSPECTIVE, _perspective_coefficients(moved, corners),
+                              Image.Resampling.BILINEAR)
+    params["perspective"] = round(jitter, 4)
+
+    if rng.random() < 0.5:
+        # Glare: a soft overexposed ellipse somewhere on the card
+        pixels = np.asarray(canvas, dtype=np.float32)
+        yy, xx = np.mgrid[0:canvas_height, 0:canvas_width]
+        cx, cy = rng.uniform(0.2, 0.8) * canvas_width, rng.uniform(0.2, 0.8) * canvas_height
+        radius = rng.uniform(0.1, 0.3) * min(canvas_width, canvas_height)
+        strength = rng.uniform(0.3, 0.8)
+        glare = strength * 255 * np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * radius ** 2))
+        canvas = Image.fromarray(np.clip(pixels + glare[..., None], 0, 255).astype(np.uint8))
+        params["glare"] = round(strength, 3)
+
+    blur = rng.uniform(0.0, 2.0)
+    canvas = canvas.filter(ImageFilter.GaussianBlur(blur))
+    params["blur"] = round(blur, 3)
+
+    quality = rng.randint(40, 90)
+    buffer = BytesIO()
+    canvas.save(buffer, format="JPEG", quality=quality)
+    params["jpeg_quality"] = quality
+    return buffer.getvalue(), params
+
+
+def build_query_set(query_dir, samples, variants, seed):
+    """Download sampled catalog images and write augmented variants plus a manifest."""
+    index = get_card_index()
+    image_urls = load_image_urls(card_db_file)
+
+    rng = random.Random(seed)
+    card_ids = sorted(card_id for card_id in set(index.card_ids) if card_id in image_urls)
+    sample_ids = rng.sample(card_ids, min(samples, len(card_ids)))
+
+    os.makedirs(query_dir, exist_ok=True)
+    queries = []
+    for card_id in sample_ids:
+        try:
+            response = requests.get(image_urls[card_id], timeout=10)
+            response.raise_for_status()
+            card = Image.open(BytesIO(response.content))
+            card.load()
+        except Exception as e:
+            print(f"Skipping {card_id}: {e}")
+            continue
+        for variant in range(variants):
+            contents, params = augment(card, rng)
+            file_name = f"{card_id}-{variant}.jpg"
+            with open(os.path.join(query_dir, file_name), "wb") as f:
+                f.write(contents)
+            queries.append({"file": file_name, "card_id": card_id, "augmentations": params})
+
+    manifest = {"samples": samples, "variants": variants, "seed": seed, "queries": queries}
+    with open(os.path.join(query_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_query_set(query_dir, samples, variants, seed, rebuild):
+    manifest_path = os.path.join(query_dir, "manifest.json")
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if (manifest["samples"], manifest["variants"], manifest["seed"]) == (samples, variants, seed):
+            return manifest
+    return build_query_set(query_dir, samples, variants, seed)
+
+
+@contextmanager
+def applied(config):
+    """Temporarily switch module-level pipeline settings to a configuration."""
+    saved = (image_similarity.COARSE_CANDIDATES, image_similarity.rerank_with_regions, torch.get_num_threads())
+    try:
+        image_similarity.COARSE_CANDIDATES = config["coarse_candidates"]
+        if not config["regions"]:
+            image_similarity.rerank_with_regions = lambda *args: None
+        if config["torch_threads"]:
+            torch.set_num_threads(config["torch_threads"])
+        yield
+    finally:
+        image_similarity.COARSE_CANDIDATES, image_similarity.rerank_with_regions = saved[:2]
+        torch.set_num_threads(saved[2])
+
+
+def identify(contents, config):
+    img = decode_for_scan(contents, config["decode_min_side"])
+    if config["engine"] == "fast":
+        return phash_image_similarity(img, top_k=10)
+    return [card_id for card_id, _ in embedding_image_search(img, top_k=10, card_image=lambda: single_card_crop(img))]
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter (Linux); harmless no-op elsewhere."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def evaluate(name, config, queries, query_dir):
+    contents = [open(os.path.join(query_dir, query["file"]), "rb").read() for query in queries]
+    peak_is_per_config = reset_peak_rss()
+
+    with applied(config):
+        identify(contents[0], config)  # warm-up: model load, index load, first-call allocations
+        latencies, top1, top10 = [], 0, 0
+        by_augmentation = {}
+        started = time.perf_counter()
+        for query, data in zip(queries, contents):
+            start = time.perf_counter()
+            ranked = identify(data, config)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hit1 = bool(ranked) and ranked[0] == query["card_id"]
+            top1 += hit1
+            top10 += query["card_id"] in ranked[:10]
+            for augmentation in query["augmentations"]:
+                if augmentation in ("sleeve", "glare"):
+                    stats = by_augmentation.setdefault(augmentation, [0, 0])
+                    stats[0] += hit1
+                    stats[1] += 1
+        elapsed = time.perf_counter() - started
+
+    count = len(queries)
+    return {
+        "config": name,
+        "settings": config,
+        "queries": count,
+        "top1_accuracy": top1 / count,
+        "top10_accuracy": top10 / count,
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "throughput_qps": count / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_is_per_config": peak_is_per_config,
+        "top1_by_augmentation": {key: hits / total for key, (hits, total) in by_augmentation.items()},
+    }
+
+
+def mark_pareto(results):
+    """A configuration is Pareto-optimal if none is at least as accurate and as fast, and better in one."""
+    for result in results:
+        result["pareto"] = not any(
+            other["top1_accuracy"] >= result["top1_accuracy"] and other["latency_p50_ms"] <= result["latency_p50_ms"]
+            and (other["top1_accuracy"] > result["top1_accuracy"] or other["latency_p50_ms"] < result["latency_p50_ms"])
+            for other in results if other is not result
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200, help="Catalog cards in the query set")
+    parser.add_argument("--variants", type=int, default=2, help="Augmented photos per card")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for sampling and augmentation")
+    parser.add_argument("--configs", nargs="*", choices=sorted(CONFIGURATIONS), help="Configurations to run (default: all)")
+    parser.add_argument("--query-dir", default="eval_queries", help="Where the query set is cached")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate the query set even if cached")
+    parser.add_argument("--output", default="eval_results.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    manifest = load_query_set(args.query_dir, args.samples, args.variants, args.seed, args.rebuild)
+    queries = manifest["queries"]
+    if not queries:
+        raise SystemExit("Query set is empty (no catalog images could be downloaded).")
+    print(f"{len(queries)} queries from {len(set(q['card_id'] for q in queries))} cards")
+
+    results = []
+    for name in args.configs or CONFIGURATIONS:
+        config = {**DEFAULT_CONFIGURATION, **CONFIGURATIONS[name]}
+        print(f"Evaluating {name}...")
+        results.append(evaluate(name, config, queries, args.query_dir))
+    mark_pareto(results)
+
+    print(f"\n{'configuration':<24}{'top-1':>8}{'top-10':>8}{'p50 ms':>10}{'p95 ms':>10}{'qps':>8}{'RSS MB':>9}  pareto")
+    for result in sorted(results, key=lambda r: r["latency_p50_ms"]):
+        print(f"{result['config']:<24}{result['top1_accuracy']:>8.3f}{result['top10_accuracy']:>8.3f}"
+              f"{result['latency_p50_ms']:>10.1f}{result['latency_p95_ms']:>10.1f}{result['throughput_qps']:>8.2f}"
+              f"{result['peak_rss_mb']:>9.0f}  {'*' if result['pareto'] else ''}")
+
+    with open(args.output, "w") as f:
+        json.dump({"query_set": {k: manifest[k] for k in ("samples", "variants", "seed")}, "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+In-memory fuzzy index for matching noisy OCR text to catalog cards.
+
+Card names are indexed by character trigrams (inverted index of NumPy arrays),
+and card numbers by exact "number" and "number/printedTotal" keys. A query
+such as "Charizard 4/102 ... Fire Spin" is scored with a single bincount over
+the trigram postings plus dictionary lookups for the parsed card number, so it
+maps OCR output to a ranked set of candidate card IDs without touching SQLite.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'pokemon_cards.db'
+
+# A name must share at least this fraction of its trigrams with the OCR text
+MIN_NAME_SCORE = 0.6
+# How many distinct names to keep before number bonuses are applied
+MAX_NAME_CANDIDATES = 25
+# Score bonuses for card-number evidence parsed from "4/102"-style text
+NUMBER_BONUS = 0.5
+NUMBER_AND_TOTAL_BONUS = 1.0
+
+# Collector numbers: optional letter prefix (TG, SWSH, SV...), digits, optional suffix.
+# O/I/l are accepted as digits because OCR confuses them inside numbers.
+_CARD_NUMBER_PATTERN = re.compile(
+    r"\b([A-Za-z]{0,4}[0-9OoIl]{1,3}[a-z]?)\s*/\s*([A-Za-z]{0,4}[0-9OoIl]{1,3})\b"
+)
+_DIGIT_CONFUSIONS = str.maketrans({"O": "0", "o": "0", "I": "1", "l": "1"})
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and collapse everything non-alphanumeric to single spaces."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def text_trigrams(normalized: str) -> set:
+    """Character trigrams of a normalized string, padded so word edges count."""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def normalize_card_number(number) -> str:
+    """Canonical form of a collector number: upper-case, no leading zeros on the digits."""
+    if number is None:
+        return ""
+    number = str(number).strip().upper()
+    match = re.fullmatch(r"([A-Z]*)0*(\d+)([A-Z]?)", number)
+    if match:
+        return f"{match.group(1)}{match.group(2)}{match.group(3)}"
+    return number
+
+
+def parse_card_numbers(text: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    Extract (number, printedTotal) pairs from OCR text, e.g. "4/102" -> ("4", 102).
+    printedTotal is None when the denominator is not a plain integer (e.g. "TG05/TG30").
+    """
+    pairs = []
+    for raw_number, raw_total in _CARD_NUMBER_PATTERN.findall(text):
+        number = normalize_card_number(_fix_digits(raw_number))
+        total_text = _fix_digits(raw_total)
+        total = int(total_text) if total_text.isdigit() else None
+        pairs.append((number, total))
+    return pairs
+
+
+def _fix_digits(token: str) -> str:
+    """Map OCR letter/digit confusions in the numeric part of a token."""
+    prefix = re.match(r"[A-Za-z]*", token).group(0)
+    # Leading letters are a legitimate prefix unless they are the whole token
+    if prefix and len(prefix) < len(token) and prefix not in ("O", "o", "I", "l"):
+        return prefix + token[len(prefix):].translate(_DIGIT_CONFUSIONS)
+    return token.translate(_DIGIT_CONFUSIONS)
+
+
+class FuzzyCardIndex:
+    """Trigram name index plus exact card-number lookup tables."""
+
+    def __init__(self, rows: Iterable[Tuple[str, str, Optional[str], Optional[int]]]):
+        """
+        Args:
+            rows: (card_id, name, number, set_printedTotal) tuples
+        """
+        self.card_ids: List[str] = []
+        card_name_ids: List[int] = []
+        name_to_id: Dict[str, int] = {}
+        self.number_index: Dict[str, List[int]] = {}
+        self.number_total_index: Dict[Tuple[str, int], List[int]] = {}
+
+        for card_id, name, number, printed_total in rows:
+            card_position = len(self.card_ids)
+            self.card_ids.append(card_id)
+
+            normalized_name = normalize_text(name or "")
+            name_id = name_to_id.setdefault(normalized_name, len(name_to_id))
+            card_name_ids.append(name_id)
+
+            number_key = normalize_card_number(number)
+            if number_key:
+                self.number_index.setdefault(number_key, []).append(card_position)
+                if printed_total is not None:
+                    try:
+                        total_key = (number_key, int(printed_total))
+                    except (TypeError, ValueError):
+                        continue
+                    self.number_total_index.setdefault(total_key, []).append(card_position)
+
+        # Names are deduplicated: ~19k cards share a few thousand names
+        self.names = [None] * len(name_to_id)
+        for normalized_name, name_id in name_to_id.items():
+            self.names[name_id] = normalized_name
+
+        postings: Dict[str, List[int]] = {}
+        self.name_trigram_counts = np.zeros(len(self.names), dtype=np.float32)
+        for name_id, normalized_name in enumerate(self.names):
+            grams = text_trigrams(normalized_name) if normalized_name else set()
+            self.name_trigram_counts[name_id] = max(len(grams), 1)
+            for gram in grams:
+                postings.setdefault(gram, []).append(name_id)
+        self.trigram_postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        name_ids = np.array(card_name_ids, dtype=np.int32)
+        order = np.argsort(name_ids, kind="stable")
+        boundaries = np.searchsorted(name_ids[order], np.arange(len(self.names) + 1))
+        self.cards_by_name = [order[boundaries[i]:boundaries[i + 1]] for i in range(len(self.names))]
+
+    @classmethod
+    def from_database(cls, db_path: str = DB_PATH) -> "FuzzyCardIndex":
+        """Build the index from the pokemon_cards table."""
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, name, number, set_printedTotal FROM pokemon_cards")
+            return cls(cursor.fetchall())
+        finally:
+            cursor.close()
+            conn.close()
+
+    def __len__(self) -> int:
+        return len(self.card_ids)
+
+    def name_scores(self, text: str) -> np.ndarray:
+        """
+        Fraction of each name's trigrams that occur in the text (0..1 per distinct name).
+        Containment rather than similarity, because OCR text holds much more than the name.
+        """
+        grams = text_trigrams(normalize_text(text))
+        postings = [self.trigram_postings[gram] for gram in grams if gram in self.trigram_postings]
+        if not postings:
+            return np.zeros(len(self.names), dtype=np.float32)
+        hits = np.bincount(np.concatenate(postings), minlength=len(self.names))
+        return hits / self.name_trigram_counts
+
+    def match(self, text: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        Rank catalog cards against OCR text.
+
+        Args:
+            text: Raw OCR output
+            limit: Maximum number of candidates to return
+
+        Returns:
+            List of (card_id, score) sorted best first; empty if nothing plausible matched
+        """
+        if not text or not self.card_ids:
+            return []
+
+        card_scores: Dict[int, float] = {}
+
+        scores = self.name_scores(text)
+        plausible = np.flatnonzero(scores >= MIN_NAME_SCORE)
+        if len(plausible) > MAX_NAME_CANDIDATES:
+            # Prefer higher containment, then longer names ("Mewtwo" over "Mew")
+            keys = scores[plausible] + self.name_trigram_counts[plausible] * 1e-3
+            plausible = plausible[np.argpartition(-keys, MAX_NAME_CANDIDATES)[:MAX_NAME_CANDIDATES]]
+        for name_id in plausible:
+            # Small length term breaks ties between fully-contained names
+            name_score = float(scores[name_id]) + float(self.name_trigram_counts[name_id]) * 1e-3
+            for card_position in self.cards_by_name[name_id]:
+                card_scores[int(card_position)] = name_score
+
+        for number, total in parse_card_numbers(text):
+            for card_position in self.number_index.get(number, ()):
+                if card_position in card_scores:
+                    card_scores[card_position] += NUMBER_BONUS
+            if total is not None:
+                for card_position in self.number_total_index.get((number, total), ()):
+                    # Number and set size together are strong evidence even if the name was garbled
+                    card_scores[card_position] = card_scores.get(card_position, 0.0) + NUMBER_AND_TOTAL_BONUS
+
+        ranked = sorted(card_scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.card_ids[position], round(score, 4)) for position, score in ranked]
+
+
+def rerank_with_ocr(card_ids: List[str], ocr_candidates: List[Tuple[str, float]],
+                    min_score: float = NUMBER_AND_TOTAL_BONUS) -> List[str]:
+    """
+    Re-rank embedding matches using OCR evidence.
+    Cards whose OCR score reaches min_score move to the front (best OCR score first);
+    everything else keeps its embedding order.
+    """
+    ocr_scores = {card_id: score for card_id, score in ocr_candidates if score >= min_score}
+    if not ocr_scores:
+        return card_ids
+    return sorted(
+        card_ids,
+        key=lambda card_id: -ocr_scores.get(card_id, 0.0)
+    )
+
+
+_index: Optional[FuzzyCardIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_fuzzy_card_index() -> FuzzyCardIndex:
+    """Build the process-wide fuzzy index on first use and return it afterwards."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FuzzyCardIndex.from_database()
+                logger.info(f"Built fuzzy card index over {len(_index)} cards")
+    return _index
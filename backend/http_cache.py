@@ -0,0 +1,71 @@
+"""
+HTTP conditional-request helpers for the Pokemon Card Scanner API.
+Builds ETag / Last-Modified validators and answers 304 Not Modified
+so repeat views of unchanged cards and libraries skip the payload.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from the given version parts (ids, revisions, timestamps)."""
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def sqlite_timestamp_to_http_date(timestamp: Optional[str]) -> Optional[str]:
+    """
+    Convert a SQLite datetime('now') string (UTC, 'YYYY-MM-DD HH:MM:SS')
+    into an RFC 7231 HTTP date. Returns None if it cannot be parsed.
+    """
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return format_datetime(parsed.astimezone(timezone.utc), usegmt=True)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against our ETag (weak comparison)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    bare_etag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in candidates:
+        bare_candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        if bare_candidate == bare_etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, last_modified: Optional[str] = None, private: bool = False) -> dict:
+    """Validator headers to attach to both 200 and 304 responses."""
+    headers = {
+        "ETag": etag,
+        # Clients may keep the payload but must revalidate before reuse
+        "Cache-Control": "private, no-cache" if private else "public, no-cache",
+    }
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if private:
+        headers["Vary"] = "Cookie, Authorization"
+    return headers
+
+
+def not_modified_response(headers: dict) -> Response:
+    """Empty 304 response carrying the same validators."""
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,156 @@
+"""
+Upload reading and reduced-resolution decoding for the scan path.
+
+Phone photos are 12+ megapixels but CLIP only ever sees a 224x224 crop. This
+module enforces byte and pixel limits before anything is decoded, validates the
+upload from its header alone, and asks libjpeg for a DCT-scaled (1/2, 1/4, 1/8)
+decode so a full-resolution bitmap is never materialized just to be thrown away.
+
+Starlette spools a multipart body before the endpoint runs, so the byte limit is
+also applied to the request itself by UploadSizeLimitMiddleware.
+"""
+
+import os
+from io import BytesIO
+from typing import Dict
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from PIL import Image, ImageOps
+
+# Hard limits, checked before decoding
+MAX_UPLOAD_BYTES = int(os.getenv("SCAN_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("SCAN_MAX_IMAGE_PIXELS", str(50_000_000)))
+# preprocess_image keeps the central 80% and resizes to 224, and region crops are
+# smaller still, so ~720px on the short side keeps full detail for every consumer
+SCAN_DECODE_MIN_SIDE = int(os.getenv("SCAN_DECODE_MIN_SIDE", "720"))
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "MPO", "BMP", "GIF", "TIFF"}
+
+UPLOAD_READ_CHUNK = 64 * 1024
+# Room for multipart boundaries, part headers and form fields on top of the image bytes
+UPLOAD_BODY_SLACK = 1024 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware capping the request body of the upload routes (path -> max bytes).
+
+    A declared Content-Length over the limit is refused with 413 before anything is
+    read; a chunked body is counted as it streams in and fails with 413 once it
+    crosses the limit. Other routes pass through untouched.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    declared_size = int(value)
+                except ValueError:
+                    break
+                if declared_size > limit:
+                    response = JSONResponse({"detail": f"Request body exceeds {limit} bytes"}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def read_upload_limited(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Read an upload in chunks, failing with 413 as soon as it exceeds max_bytes
+    instead of buffering an arbitrarily large body first.
+    """
+    declared_size = getattr(upload, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Empty image file")
+    return b"".join(chunks)
+
+
+def open_validated(contents: bytes) -> Image.Image:
+    """
+    Open an image and validate it from the header only (format and dimensions).
+    Nothing is decoded yet. The pixel limit is checked here rather than through
+    PIL's process-wide Image.MAX_IMAGE_PIXELS, which would also apply to catalog images.
+    """
+    try:
+        img = Image.open(BytesIO(contents))
+    except Image.DecompressionBombError as e:
+        raise HTTPException(status_code=413, detail=f"Image too large: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+    if img.format not in ALLOWED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported image format: {img.format}")
+    width, height = img.size
+    if width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="Invalid image dimensions")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_IMAGE_PIXELS} pixels")
+    return img
+
+
+def decode_for_scan(contents: bytes, min_side: int = SCAN_DECODE_MIN_SIDE) -> Image.Image:
+    """
+    Decode an upload at the lowest resolution that still covers min_side pixels
+    on the short side, upright per EXIF orientation.
+
+    Args:
+        contents: Encoded image bytes
+        min_side: Minimum short-side length needed downstream
+
+    Returns:
+        PIL.Image.Image: Loaded RGB image
+    """
+    img = open_validated(contents)
+
+    if img.format in ("JPEG", "MPO"):
+        # DCT-domain downscale: libjpeg decodes straight to 1/2, 1/4 or 1/8 size
+        img.draft("RGB", (min_side, min_side))
+
+    try:
+        img.load()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+    # Non-JPEG formats decode at full size; shrink before any further processing
+    bound = min_side * 2
+    if min(img.size) > bound:
+        img.thumbnail((bound * img.size[0] // min(img.size), bound * img.size[1] // min(img.size)),
+                      Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    img = ImageOps.exif_transpose(img)
+    return img if img.mode == "RGB" else img.convert("RGB")
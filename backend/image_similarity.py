@@ -9,29 +9,82 @@ from transformers import CLIPProcessor, CLIPModel
 import hashlib
 import pickle
 import pandas as pd
+import threading
+import time
 from pathlib import Path
+from card_attributes import CardAttributeIndex
+from perceptual_hash import dhash, hamming_distances
+from index_format import (SIDE_STAMP_SUFFIX, IndexFormatError, convert_legacy_index, read_header, read_index,
+                          side_file_matches, write_index, write_side_stamp)
+from metrics import CARD_INDEX_RELOADS, EMBEDDING_CACHE_LOOKUPS, time_stage
 
 # Create cache directory
 CACHE_DIR = Path("embedding_cache")
 CACHE_DIR.mkdir(exist_ok=True)
 
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+# Bump whenever preprocess_image changes: an index built under another version is refused
+PREPROCESSING_VERSION = 1
+# How often the API checks the index files for a rebuilt index (0 disables the watcher)
+INDEX_WATCH_SECONDS = float(os.getenv("INDEX_WATCH_SECONDS", "10"))
+
+# Card regions used for fine re-ranking, as (left, top, right, bottom) fractions
+# of the full card image. Order defines the second axis of region_embeddings.npy.
+REGION_BOXES = {
+    "artwork": (0.08, 0.10, 0.92, 0.55),
+    "name_bar": (0.04, 0.02, 0.96, 0.12),
+    "set_number": (0.00, 0.86, 1.00, 1.00),
+}
+# Stage-two score = weighted sum of global and per-region cosine similarities
+GLOBAL_WEIGHT = 0.4
+REGION_WEIGHTS = {"artwork": 0.3, "name_bar": 0.15, "set_number": 0.15}
+# Stage one keeps this many global-index candidates for region re-ranking
+COARSE_CANDIDATES = 100
+# Region re-ranking only runs when the two best global scores are closer than this
+REGION_RERANK_MARGIN = float(os.getenv("REGION_RERANK_MARGIN", "0.03"))
+# Filters matching at least this fraction of the catalog are scored with a full
+# scan and then selected; narrower filters gather and score only matching rows
+DENSE_FILTER_FRACTION = 0.2
+# Fast (degraded) mode: 16x16 dHash = 256 bits = 4 uint64 words per card
+PHASH_SIZE = 16
+PHASH_WORDS = PHASH_SIZE * PHASH_SIZE // 64
+
 class ImageEmbeddingModel:
     """Singleton class to manage CLIP model and processor."""
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
             # Force CPU to save memory
-            cls._instance.device = torch.device("cpu")
+            device = torch.device("cpu")
             # Use smaller model for memory efficiency
-            cls._instance.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(cls._instance.device)
-            cls._instance.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", use_fast=False)
-            cls._instance.cache_dir = CACHE_DIR
-            cls._instance.embedding_file = os.path.join(cls._instance.cache_dir, "embeddings.npy")
-            cls._instance.metadata_file = os.path.join(cls._instance.cache_dir, "image_metadata.json")
+            model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(device)
+            processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME, use_fast=False)
+            cls._instance = cls.from_model(model, processor, CLIP_MODEL_NAME, device)
         return cls._instance
 
+    @classmethod
+    def from_model(cls, model, processor, model_name, device, cache_dir=CACHE_DIR):
+        """
+        Build an instance around an already-loaded model and processor, with the
+        index file paths under cache_dir. Does not touch the singleton.
+        """
+        instance = object.__new__(cls)
+        instance.device = device
+        instance.model_name = model_name
+        instance.model = model
+        instance.processor = processor
+        instance.cache_dir = cache_dir
+        # Single-file versioned index (index_format.py); preferred over the .npy + .json pair
+        instance.index_file = os.path.join(cache_dir, "card_index.bin")
+        instance.embedding_file = os.path.join(cache_dir, "embeddings.npy")
+        instance.metadata_file = os.path.join(cache_dir, "image_metadata.json")
+        # Row-aligned with embeddings.npy: (N, len(REGION_BOXES), D) float16
+        instance.region_embedding_file = os.path.join(cache_dir, "region_embeddings.npy")
+        # Row-aligned with embeddings.npy: (N, PHASH_WORDS) uint64 256-bit dHashes
+        instance.phash_file = os.path.join(cache_dir, "phash_index.npy")
+        return instance
+
 def preprocess_image(image):
     """
     Preprocess image for CLIP: crop borders, resize, and sharpen.
@@ -62,13 +115,15 @@ def preprocess_image(image):
     
     return image
 
-def get_image_embedding(image_content, use_cache=True):
+def get_image_embedding(image_content, use_cache=False):
     """
     Get image embedding using CLIP model locally with optional caching.
 
     Args:
         image_content (PIL.Image.Image): Input image as a PIL Image object.
-        use_cache (bool): Whether to use caching for embeddings.
+        use_cache (bool): Whether to use the on-disk pickle cache keyed by pixel hash.
+            Only catalog builds, which re-embed the same images, should set it; query
+            photos and camera frames never repeat exactly and would only grow the cache.
 
     Returns:
         numpy.ndarray: Normalized 1D embedding (768D for CLIP), or None if invalid.
@@ -83,9 +138,10 @@ def get_image_embedding(image_content, use_cache=True):
         device = clip.device
 
         if use_cache:
-            img_bytes = BytesIO()
-            image_content.save(img_bytes, format="PNG")
-            cache_key = hashlib.sha256(img_bytes.getvalue()).hexdigest()
+            # Hash the decoded pixels directly; PNG-encoding the image just to key the cache was costly
+            pixel_hash = hashlib.sha256(f"{image_content.mode}{image_content.size}".encode())
+            pixel_hash.update(image_content.tobytes())
+            cache_key = pixel_hash.hexdigest()
             cache_path = os.path.join(clip.cache_dir, f"{cache_key}.pkl")
 
             if os.path.exists(cache_path):
@@ -94,12 +150,15 @@ def get_image_embedding(image_content, use_cache=True):
                     if np.any(np.isnan(embedding)) or np.any(np.isinf(embedding)):
                         os.remove(cache_path)
                     else:
+                        EMBEDDING_CACHE_LOOKUPS.inc("hit")
                         return embedding
+            EMBEDDING_CACHE_LOOKUPS.inc("miss")
 
-        image = preprocess_image(image_content)
-        inputs = processor(images=image, return_tensors="pt", padding=True).to(device)
+        with time_stage("preprocess"):
+            image = preprocess_image(image_content)
+            inputs = processor(images=image, return_tensors="pt", padding=True).to(device)
 
-        with torch.no_grad():
+        with time_stage("inference"), torch.no_grad():
             image_features = model.get_image_features(**inputs)
 
         norm = image_features.norm(dim=1, keepdim=True)
@@ -123,50 +182,515 @@ def get_image_embedding(image_content, use_cache=True):
         print(f"Error computing embedding: {e}")
         return None
 
-def embedding_image_similarity(image_path):
+def get_image_embeddings(images):
     """
-    Perform similarity search to find the top 10 matching card IDs using NumPy.
+    Embed several images with one batched CLIP forward pass (no embedding cache).
 
     Args:
-        image_path (str): Path to the query image (local path or URL).
+        images (list of PIL.Image.Image): Input images.
 
     Returns:
-        list: Top 10 matching card IDs from the database.
+        list: Normalized 1D float32 embedding per image, or None where invalid.
+    """
+    if not images:
+        return []
+    try:
+        clip = ImageEmbeddingModel()
+        with time_stage("preprocess"):
+            inputs = clip.processor(images=[preprocess_image(image) for image in images],
+                                    return_tensors="pt", padding=True).to(clip.device)
+
+        with time_stage("inference"), torch.no_grad():
+            features = clip.model.get_image_features(**inputs)
+
+        embeddings = (features / features.norm(dim=1, keepdim=True)).cpu().numpy().astype(np.float32)
+        # Zero-norm rows come out as NaN and are rejected here with the rest
+        return [embedding if np.all(np.isfinite(embedding)) else None for embedding in embeddings]
+
+    except Exception as e:
+        print(f"Error computing batch embeddings: {e}")
+        return [None] * len(images)
+
+def get_text_embeddings(texts):
+    """
+    Embed text with CLIP's text tower into the same space as the image embeddings.
+
+    Args:
+        texts (list of str): Input texts (truncated to CLIP's 77-token context).
+
+    Returns:
+        list: Normalized 1D float32 embedding per text, or None where invalid.
+    """
+    if not texts:
+        return []
+    try:
+        clip = ImageEmbeddingModel()
+        inputs = clip.processor(text=list(texts), return_tensors="pt", padding=True,
+                                truncation=True).to(clip.device)
+
+        with time_stage("text_inference"), torch.no_grad():
+            features = clip.model.get_text_features(**inputs)
+
+        embeddings = (features / features.norm(dim=1, keepdim=True)).cpu().numpy().astype(np.float32)
+        return [embedding if np.all(np.isfinite(embedding)) else None for embedding in embeddings]
+
+    except Exception as e:
+        print(f"Error computing text embeddings: {e}")
+        return [None] * len(texts)
+
+def preprocess_region(image, box):
+    """
+    Crop a card region and prepare it for CLIP.
+
+    Args:
+        image (PIL.Image.Image): Full card image (no border crop).
+        box (tuple): (left, top, right, bottom) as fractions of the image size.
+
+    Returns:
+        PIL.Image.Image: 224x224 sharpened region crop.
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    left, top, right, bottom = box
+    region = image.crop((left * width, top * height, right * width, bottom * height))
+    region = region.resize((224, 224), Image.Resampling.LANCZOS)
+    return ImageEnhance.Sharpness(region).enhance(1.5)
+
+def get_region_embeddings(image_content):
+    """
+    Embed every region in REGION_BOXES with one batched CLIP forward pass.
+
+    Args:
+        image_content (PIL.Image.Image): Full card image.
+
+    Returns:
+        numpy.ndarray: (len(REGION_BOXES), D) normalized float32 embeddings, or None if invalid.
+    """
+    return get_region_embeddings_batch([image_content])[0]
+
+def get_region_embeddings_batch(images):
+    """
+    Embed every region of several images with one batched CLIP forward pass.
+
+    Args:
+        images (list of PIL.Image.Image): Full card images.
+
+    Returns:
+        list: (len(REGION_BOXES), D) normalized float32 embeddings per image, or None where invalid.
+    """
+    if not images:
+        return []
+    try:
+        clip = ImageEmbeddingModel()
+        regions = [preprocess_region(image, box) for image in images for box in REGION_BOXES.values()]
+        inputs = clip.processor(images=regions, return_tensors="pt", padding=True).to(clip.device)
+
+        with torch.no_grad():
+            features = clip.model.get_image_features(**inputs)
+
+        with np.errstate(all='ignore'):
+            features = features.cpu().numpy().astype(np.float32)
+            embeddings = features / np.linalg.norm(features, axis=1, keepdims=True)
+        embeddings = embeddings.reshape(len(images), len(REGION_BOXES), -1)
+        valid = [bool(np.all(np.isfinite(image_regions))) for image_regions in embeddings]
+        if not all(valid):
+            print(f"Warning: {valid.count(False)} invalid region embeddings (zero-norm or NaN/inf), skipping.")
+        return [image_regions if ok else None for image_regions, ok in zip(embeddings, valid)]
+
+    except Exception as e:
+        print(f"Error computing region embeddings: {e}")
+        return [None] * len(images)
+
+def needs_region_rerank(candidate_scores):
+    """Whether the coarse ranking is a near-tie: the two best global scores are within REGION_RERANK_MARGIN."""
+    if len(candidate_scores) < 2:
+        return False
+    runner_up, best = np.partition(candidate_scores, len(candidate_scores) - 2)[-2:]
+    return best - runner_up < REGION_RERANK_MARGIN
+
+def region_rerank_available(index=None):
+    """
+    Whether rerank_with_regions has region data to use, so callers can skip
+    computing query regions (get_region_embeddings_batch) when it does not.
     """
     clip = ImageEmbeddingModel()
-    embedding_file = clip.embedding_file
-    print(f"Embedding file: {embedding_file}")
-    metadata_file = clip.metadata_file
-    print(f"Metadata file: {metadata_file}")
+    if not os.path.exists(clip.region_embedding_file):
+        return False
+    return index is None or index.side_file_usable(clip.region_embedding_file)
 
-    if not os.path.exists(embedding_file) or not os.path.exists(metadata_file):
-        raise FileNotFoundError("Embeddings or metadata file not found.")
+def rerank_with_regions(img, candidate_rows, global_scores, index=None, query_regions=None):
+    """
+    Stage two: re-rank coarse candidates with precomputed region embeddings.
+    Only the candidate rows are read from the memory-mapped region file, so the
+    cost is bounded by COARSE_CANDIDATES rather than the catalog size.
 
-    # Load embeddings in chunks to save memory
-    embeddings = np.load(embedding_file, mmap_mode='r').astype('float32')
-    with open(metadata_file, 'r') as f:
-        image_metadata = json.load(f)
+    Args:
+        img (PIL.Image.Image): Query image.
+        candidate_rows (numpy.ndarray): Row numbers in embeddings.npy from stage one.
+        global_scores (numpy.ndarray): Global cosine similarity of each candidate.
+        index (CardEmbeddingIndex, optional): Index the candidates came from; the
+            region file must be stamped for it.
+        query_regions (numpy.ndarray, optional): Precomputed region embeddings of img
+            (e.g. from get_region_embeddings_batch); skips the CLIP pass for them.
 
-    if len(embeddings) != len(image_metadata):
-        raise ValueError("Mismatch between number of embeddings and metadata entries.")
-
-    # Filter out invalid embeddings (process in chunks)
-    # Each embedding is 512D float32 = 2KB, so 100 embeddings = 200KB
-    chunk_size = 100
-    valid_indices = []
-    for i in range(0, len(embeddings), chunk_size):
-        end_idx = min(i + chunk_size, len(embeddings))
-        chunk = embeddings[i:end_idx]
-        valid_mask = ~np.any(np.isnan(chunk) | np.isinf(chunk), axis=1)
-        valid_indices.extend([j for j in range(i, end_idx) if valid_mask[j - i]])
-    
-    if len(valid_indices) != len(embeddings):
-        print(f"Warning: {len(embeddings) - len(valid_indices)} invalid embeddings found, filtering them out.")
-        embeddings = embeddings[valid_indices]
-        image_metadata = [image_metadata[i] for i in valid_indices]
+    Returns:
+        numpy.ndarray: Combined score per candidate, or None if region data is unavailable.
+    """
+    clip = ImageEmbeddingModel()
+    if not os.path.exists(clip.region_embedding_file):
+        return None
+    if index is not None and not index.side_file_usable(clip.region_embedding_file):
+        return None
+
+    region_index = np.load(clip.region_embedding_file, mmap_mode='r')
+    if region_index.ndim != 3 or region_index.shape[1] != len(REGION_BOXES):
+        print("Warning: Region embeddings have an unexpected shape, skipping re-rank.")
+        return None
+    if len(region_index) <= candidate_rows.max(initial=-1):
+        print("Warning: Region embeddings do not cover the embedding index, skipping re-rank.")
+        return None
+
+    if query_regions is None:
+        query_regions = get_region_embeddings(img)
+    if query_regions is None:
+        return None
+
+    # Sorted row order keeps the mmap reads sequential
+    order = np.argsort(candidate_rows)
+    candidate_regions = np.asarray(region_index[candidate_rows[order]], dtype=np.float32)
+    if candidate_regions.shape[2] != query_regions.shape[1]:
+        return None
+
+    # (candidates, regions): per-region cosine similarity
+    region_scores = np.empty((len(candidate_rows), len(REGION_BOXES)), dtype=np.float32)
+    region_scores[order] = np.einsum('crd,rd->cr', candidate_regions, query_regions)
+    region_scores = np.nan_to_num(region_scores, nan=-1.0, posinf=1.0, neginf=-1.0)
+
+    weights = np.array([REGION_WEIGHTS[name] for name in REGION_BOXES], dtype=np.float32)
+    return GLOBAL_WEIGHT * global_scores + region_scores @ weights
+
+class CardEmbeddingIndex:
+    """
+    The catalog embedding matrix and its card IDs.
+    Invalid (NaN/inf) rows are dropped at load (packed indexes drop them at build);
+    source_rows keeps each row's position in embeddings.npy for row-aligned side files.
+    """
+
+    def __init__(self, embeddings, card_ids, source_rows, header=None):
+        self.embeddings = embeddings
+        self.card_ids = card_ids
+        self.source_rows = source_rows
+        # index_format header of a packed index; empty for the legacy .npy + .json pair
+        self.header = header or {}
+        self._attributes = None
+        self._phashes = None
+        # Side file path -> (file signature, usable with this index)
+        self._side_files = {}
+        self._attributes_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, embedding_file, metadata_file):
+        """Load and validate embeddings.npy + image_metadata.json."""
+        if not os.path.exists(embedding_file) or not os.path.exists(metadata_file):
+            raise FileNotFoundError("Embeddings or metadata file not found.")
+
+        # Memory-mapped read-only: a clean float32 matrix is used straight from the page
+        # cache, so every worker process on the host shares one physical copy
+        embeddings = np.load(embedding_file, mmap_mode='r')
+        with open(metadata_file, 'r') as f:
+            image_metadata = json.load(f)
+
+        if len(embeddings) != len(image_metadata):
+            raise ValueError("Mismatch between number of embeddings and metadata entries.")
+
+        source_rows = np.arange(len(embeddings))
+        valid_mask = np.all(np.isfinite(embeddings), axis=1)
+        if not np.all(valid_mask):
+            print(f"Warning: {int(np.sum(~valid_mask))} invalid embeddings found, filtering them out.")
+            embeddings = embeddings[valid_mask]
+            image_metadata = [meta for meta, valid in zip(image_metadata, valid_mask) if valid]
+            source_rows = source_rows[valid_mask]
+        if embeddings.dtype != np.float32:
+            embeddings = embeddings.astype(np.float32)
+
+        card_ids = [meta["card_id"] for meta in image_metadata]
+        return cls(np.ascontiguousarray(embeddings), card_ids, source_rows)
+
+    @classmethod
+    def load_packed(cls, index_file, model_name=None, preprocessing_version=PREPROCESSING_VERSION):
+        """
+        Map a card_index.bin (one open, checksum verified). Refuses an index built by
+        another model or preprocessing version, whose vectors would not be comparable.
+        """
+        header, embeddings, source_rows, card_ids = read_index(index_file)
+        if model_name is not None and header["model"] != model_name:
+            raise IndexFormatError(f"Index was built with {header['model']!r}, running {model_name!r}")
+        if header["preprocessing_version"] != preprocessing_version:
+            raise IndexFormatError(f"Index was built with preprocessing v{header['preprocessing_version']}, "
+                                   f"running v{preprocessing_version}")
+        if not header["normalized"]:
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return cls(embeddings, card_ids, source_rows, header)
+
+    def __len__(self):
+        return len(self.card_ids)
+
+    def describe(self):
+        """Summary for the admin endpoint: rows, dimension and the packed header if any."""
+        return {"rows": len(self), "dim": int(self.embeddings.shape[1]), "packed": bool(self.header), **self.header}
+
+    @property
+    def attributes(self):
+        """Columnar set/supertype/type/regulation-mark bitmasks, built on first use."""
+        if self._attributes is None:
+            with self._attributes_lock:
+                if self._attributes is None:
+                    self._attributes = CardAttributeIndex.from_database(self.card_ids)
+        return self._attributes
+
+    def side_file_usable(self, path):
+        """
+        Whether a row-aligned side file (region embeddings, perceptual hashes) was built
+        for this index: a packed index requires the file's stamp to carry its checksum.
+        The legacy pair has no checksum, so only the callers' row-count checks apply.
+        """
+        checksum = self.header.get("checksum")
+        if not checksum:
+            return True
+        signature = _files_signature((path, path + SIDE_STAMP_SUFFIX))
+        checked = self._side_files.get(path)
+        if checked is None or checked[0] != signature:
+            usable = side_file_matches(path, checksum)
+            if not usable:
+                print(f"Warning: {os.path.basename(path)} is not stamped for the live embedding index, ignoring it.")
+            self._side_files[path] = checked = (signature, usable)
+        return checked[1]
+
+    @property
+    def phashes(self):
+        """
+        (N, PHASH_WORDS) uint64 perceptual hashes aligned with this index's rows,
+        or None if phash_index.npy has not been built (or not for this index).
+        """
+        if self._phashes is None:
+            with self._attributes_lock:
+                if self._phashes is None:
+                    clip = ImageEmbeddingModel()
+                    if not os.path.exists(clip.phash_file) or not self.side_file_usable(clip.phash_file):
+                        return None
+                    phashes = np.load(clip.phash_file)
+                    if phashes.ndim != 2 or phashes.shape[1] != PHASH_WORDS or len(phashes) <= self.source_rows.max(initial=-1):
+                        print("Warning: phash index does not match embeddings, fast mode disabled.")
+                        return None
+                    self._phashes = np.ascontiguousarray(phashes[self.source_rows].astype(np.uint64))
+        return self._phashes
+
+    def similarities(self, query_embedding, rows=None):
+        """
+        Cosine similarity of the query against all rows, or only the given rows.
+
+        Args:
+            query_embedding (numpy.ndarray): Normalized (D,) query vector.
+            rows (numpy.ndarray, optional): Row subset to score (e.g. from a metadata filter).
+
+        Returns:
+            numpy.ndarray: One clipped similarity per scored row.
+        """
+        with np.errstate(all='ignore'):
+            if rows is None:
+                similarities = self.embeddings @ query_embedding
+            elif len(rows) >= len(self.card_ids) * DENSE_FILTER_FRACTION:
+                # Broad filter: gathering most rows costs more than a full contiguous scan
+                similarities = (self.embeddings @ query_embedding)[rows]
+            else:
+                # Narrow filter: only the matching rows are read and scored
+                similarities = self.embeddings[rows] @ query_embedding
+        similarities = np.nan_to_num(similarities, nan=-1.0, posinf=1.0, neginf=-1.0)
+        return np.clip(similarities, -1.0, 1.0)
+
+    def coarse_candidates(self, query_embedding, rows=None, count=None):
+        """
+        Stage one of embedding_image_search: the best rows by global similarity
+        (partial sort, so in no particular order).
+
+        Args:
+            query_embedding (numpy.ndarray): Normalized (D,) query vector.
+            rows (numpy.ndarray, optional): Row subset to score (e.g. from a metadata filter).
+            count (int, optional): Candidates to keep (default: COARSE_CANDIDATES).
+
+        Returns:
+            tuple: (index rows, similarities) of the candidates; both empty if nothing was scored.
+        """
+        similarities = self.similarities(query_embedding, rows)
+        if len(similarities) == 0:
+            return np.empty(0, dtype=np.int64), similarities
+        # Map positions in the (possibly filtered) score vector back to index rows
+        positions = rows if rows is not None else np.arange(len(similarities))
+        count = min(COARSE_CANDIDATES if count is None else count, len(similarities))
+        candidates = np.argpartition(-similarities, count - 1)[:count]
+        return positions[candidates], similarities[candidates]
+
+
+_card_index = None
+_card_index_signature = None
+_card_index_lock = threading.Lock()
+_index_watcher = None
+_index_watcher_stop = threading.Event()
+# Called with no arguments after reload_card_index swaps in a new index
+_index_reload_callbacks = []
+
+def _card_index_files():
+    """The files the index is loaded from: card_index.bin if built, else the legacy pair."""
+    clip = ImageEmbeddingModel()
+    if os.path.exists(clip.index_file):
+        return (clip.index_file,)
+    return (clip.embedding_file, clip.metadata_file)
+
+def _watched_files(files):
+    """Index files plus the side files and stamps a reload re-validates."""
+    clip = ImageEmbeddingModel()
+    side_files = (clip.region_embedding_file, clip.phash_file)
+    return tuple(files) + side_files + tuple(path + SIDE_STAMP_SUFFIX for path in side_files)
+
+def _files_signature(files):
+    """Identity of the files on disk; a rename-into-place changes the inode even with the same mtime."""
+    signature = []
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((path, None))
+            continue
+        signature.append((path, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def _load_card_index(files):
+    if len(files) == 1:
+        return CardEmbeddingIndex.load_packed(files[0], ImageEmbeddingModel().model_name)
+    return CardEmbeddingIndex.load(*files)
+
+def get_card_index():
+    """
+    Process-wide CardEmbeddingIndex, loaded on first use. A rebuilt index is
+    swapped in by reload_card_index(), never loaded on the query path.
+    """
+    global _card_index, _card_index_signature
+    index = _card_index
+    if index is None:
+        with _card_index_lock:
+            if _card_index is None:
+                files = _card_index_files()
+                signature = _files_signature(_watched_files(files))
+                _card_index = _load_card_index(files)
+                _card_index_signature = signature
+            index = _card_index
+    return index
+
+def loaded_card_index():
+    """The live index, or None if nothing has loaded it yet (does not trigger a load)."""
+    return _card_index
+
+def on_card_index_reload(callback):
+    """Register callback() to run whenever a new index is swapped in, e.g. to drop results cached from the old one."""
+    _index_reload_callbacks.append(callback)
+
+def reload_card_index(force=False):
+    """
+    Double-buffered reload: the rebuilt index is loaded and warmed (attribute
+    bitmasks, perceptual hashes) next to the live one, then the reference is
+    swapped. Scans already running keep the index they started with, so none are
+    dropped. If the new files fail to load, the live index stays in place.
 
+    Args:
+        force (bool): Reload even if the files look unchanged.
+
+    Returns:
+        dict: reloaded (False if the files were unchanged), seconds, index (describe())
+
+    Raises:
+        FileNotFoundError, ValueError (IndexFormatError): The new files are unusable.
+    """
+    global _card_index, _card_index_signature
+    with _card_index_lock:
+        files = _card_index_files()
+        signature = _files_signature(_watched_files(files))
+        if not force and _card_index is not None and signature == _card_index_signature:
+            return {"reloaded": False, "seconds": 0.0, "index": _card_index.describe()}
+        start = time.perf_counter()
+        try:
+            index = _load_card_index(files)
+            index.attributes
+            index.phashes
+        except Exception:
+            CARD_INDEX_RELOADS.inc("failed")
+            raise
+        _card_index, _card_index_signature = index, signature
+        CARD_INDEX_RELOADS.inc("success")
+    for callback in _index_reload_callbacks:
+        callback()
+    return {"reloaded": True, "seconds": round(time.perf_counter() - start, 3), "index": index.describe()}
+
+def _watch_card_index(interval):
+    failed_signature = None
+    while not _index_watcher_stop.wait(interval):
+        if _card_index is None:
+            # Nothing loaded yet; the first query loads whatever is on disk
+            continue
+        signature = _files_signature(_watched_files(_card_index_files()))
+        if signature in (_card_index_signature, failed_signature):
+            continue
+        try:
+            result = reload_card_index()
+        except Exception as e:
+            # Retried once the files change again (e.g. the second half of a legacy pair lands)
+            failed_signature = signature
+            print(f"Warning: rebuilt embedding index not loaded, keeping the current one: {e}")
+            continue
+        failed_signature = None
+        if result["reloaded"]:
+            print(f"Reloaded embedding index: {result['index']['rows']} rows in {result['seconds']}s")
+
+def start_index_watcher(interval=INDEX_WATCH_SECONDS):
+    """Hot-reload the index when its files change (idempotent); call from the app lifespan."""
+    global _index_watcher
+    if _index_watcher is not None or interval <= 0:
+        return
+    _index_watcher_stop.clear()
+    _index_watcher = threading.Thread(target=_watch_card_index, args=(interval,), name="index-watcher", daemon=True)
+    _index_watcher.start()
+
+def stop_index_watcher(timeout=30.0):
+    global _index_watcher
+    _index_watcher_stop.set()
+    if _index_watcher is not None:
+        _index_watcher.join(timeout)
+        _index_watcher = None
+
+def embedding_image_search(image_path, filters=None, top_k=10, query_embedding=None, card_image=None):
+    """
+    Similarity search returning the top matches with their scores.
+
+    Args:
+        image_path (str or PIL.Image.Image): Path to the query image (local path or URL),
+            or an already-decoded image (the scan path passes one to avoid re-decoding).
+        filters (dict, optional): Metadata filters, e.g. {"set_id": ["base1"], "supertype": ["Trainer"]}.
+            Values within a field are OR-ed, fields are AND-ed. Only matching rows are scored.
+        top_k (int): Number of matches to return.
+        query_embedding (numpy.ndarray, optional): Precomputed global embedding of the
+            image (e.g. from get_image_embeddings); skips the CLIP pass for it.
+        card_image (PIL.Image.Image or callable, optional): The query card rectified
+            upright (a card_detection crop), or a function returning it or None, called
+            only when it is needed. Region boxes are fractions of a full card, so
+            without one the region re-rank is skipped.
+
+    Returns:
+        list: (card_id, score) tuples, best first. Scores are cosine similarities,
+            or the weighted global + region score when the candidates were re-ranked.
+    """
     try:
-        if image_path.startswith(('http://', 'https://')):
+        if isinstance(image_path, Image.Image):
+            img = image_path
+        elif image_path.startswith(('http://', 'https://')):
             response = requests.get(image_path, timeout=10)
             response.raise_for_status()
             img = Image.open(BytesIO(response.content))
@@ -177,41 +701,99 @@ def embedding_image_similarity(image_path):
             img.verify()
             img = Image.open(image_path)
 
-        query_embedding = get_image_embedding(img)
+        if query_embedding is None:
+            query_embedding = get_image_embedding(img)
         if query_embedding is None:
             raise ValueError("Invalid query embedding (zero-norm or NaN/inf).")
-        query_embedding = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
 
     except (requests.RequestException, ValueError, Exception) as e:
         raise RuntimeError(f"Error processing query image {image_path}: {e}")
 
-    if query_embedding.shape[1] != embeddings.shape[1]:
-        raise ValueError(f"Query embedding dimension {query_embedding.shape[1]} does not match database embeddings {embeddings.shape[1]}.")
+    return embedding_image_search_batch([query_embedding], [filters], top_k, [card_image])[0]
 
-    # Compute similarities in chunks to save memory
-    # Each embedding is 512D float32 = 2KB, so 100 embeddings = 200KB
-    chunk_size = 100
-    all_similarities = []
-    
-    with np.errstate(all='ignore'):
-        for i in range(0, len(embeddings), chunk_size):
-            end_idx = min(i + chunk_size, len(embeddings))
-            chunk = embeddings[i:end_idx]
-            chunk_similarities = np.dot(chunk, query_embedding.T).flatten()
-            chunk_similarities = np.nan_to_num(chunk_similarities, nan=-1.0, posinf=1.0, neginf=-1.0)
-            chunk_similarities = np.clip(chunk_similarities, -1.0, 1.0)
-            all_similarities.extend(chunk_similarities)
-    
-    similarities = np.array(all_similarities)
-    
-    # Find top 10 matches
-    top_10_indices = np.argsort(similarities)[-10:][::-1]
-    top_similarities = similarities[top_10_indices]
-    top_card_ids = [image_metadata[idx]["card_id"] for idx in top_10_indices]
+def embedding_image_search_batch(query_embeddings, filters=None, top_k=10, card_images=None):
+    """
+    embedding_image_search for several already-embedded queries. The region crops
+    of every query that needs a re-rank share one CLIP forward pass.
+
+    Args:
+        query_embeddings (list of numpy.ndarray): Global embedding per query (None is skipped).
+        filters (list of dict, optional): Metadata filters per query.
+        top_k (int): Number of matches to return per query.
+        card_images (list, optional): Card-aligned image (or function returning one) per
+            query, see embedding_image_search.
+
+    Returns:
+        list: Per query, (card_id, score) tuples best first, or None where its embedding was None.
+    """
+    index = get_card_index()
+    filters = filters or [None] * len(query_embeddings)
+    card_images = card_images or [None] * len(query_embeddings)
+
+    # Stage one: cheap top-COARSE_CANDIDATES from the global index (partial sort)
+    coarse = []
+    for query_embedding, query_filters in zip(query_embeddings, filters):
+        if query_embedding is None:
+            coarse.append(None)
+            continue
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        if query_embedding.shape[0] != index.embeddings.shape[1]:
+            raise ValueError(f"Query embedding dimension {query_embedding.shape[0]} does not match database embeddings {index.embeddings.shape[1]}.")
+
+        # Resolve filters to row numbers before scoring so narrower filters mean less work
+        rows = index.attributes.filter_rows(query_filters) if query_filters else None
+        if rows is not None and len(rows) == 0:
+            coarse.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            continue
+        with time_stage("vector_search"):
+            coarse.append(index.coarse_candidates(query_embedding, rows))
+
+    # Stage two: re-rank near-ties with region embeddings, cut from card-aligned images only
+    ambiguous = [i for i, candidates in enumerate(coarse)
+                 if candidates is not None and card_images[i] is not None and needs_region_rerank(candidates[1])]
+    if ambiguous and region_rerank_available(index):
+        with time_stage("region_rerank"):
+            aligned = [(i, card_images[i]() if callable(card_images[i]) else card_images[i]) for i in ambiguous]
+            aligned = [(i, image) for i, image in aligned if image is not None]
+            regions = get_region_embeddings_batch([image for _, image in aligned]) if aligned else []
+            for (i, image), query_regions in zip(aligned, regions):
+                if query_regions is None:
+                    continue
+                candidate_rows, candidate_scores = coarse[i]
+                reranked_scores = rerank_with_regions(image, index.source_rows[candidate_rows], candidate_scores,
+                                                      index, query_regions)
+                if reranked_scores is not None:
+                    coarse[i] = (candidate_rows, reranked_scores)
+
+    # Find top matches
+    results = []
+    for candidates in coarse:
+        if candidates is None:
+            results.append(None)
+            continue
+        candidate_rows, candidate_scores = candidates
+        top_order = np.argsort(-candidate_scores)[:top_k]
+        results.append([(index.card_ids[row], float(score))
+                        for row, score in zip(candidate_rows[top_order], candidate_scores[top_order])])
+    return results
+
+def embedding_image_similarity(image_path, filters=None):
+    """
+    Perform similarity search to find the top 10 matching card IDs using NumPy.
+
+    Args:
+        image_path (str or PIL.Image.Image): Path to the query image (local path or URL),
+            or an already-decoded image.
+        filters (dict, optional): Metadata filters (see embedding_image_search).
+
+    Returns:
+        list: Top 10 matching card IDs from the database.
+    """
+    matches = embedding_image_search(image_path, filters, top_k=10)
+    top_card_ids = [card_id for card_id, _ in matches]
 
     print(f"Top 10 Card IDs:")
-    for i, (idx, sim) in enumerate(zip(top_10_indices, top_similarities), 1):
-        card_id = image_metadata[idx]['card_id']
+    for i, (card_id, sim) in enumerate(matches, 1):
         # Fetch card name from SQLite database
         import sqlite3
         try:
@@ -228,9 +810,43 @@ def embedding_image_similarity(image_path):
 
     return top_card_ids
 
+def phash_image_similarity(img, filters=None, top_k=10):
+    """
+    Fast, CLIP-free identification by 256-bit perceptual hash.
+    Used as a degraded mode under load: one XOR + popcount per catalog row.
+
+    Args:
+        img (PIL.Image.Image): Query image.
+        filters (dict, optional): Same metadata filters as embedding_image_similarity.
+        top_k (int): Number of card IDs to return.
+
+    Returns:
+        list: Top matching card IDs (smallest Hamming distance first).
+    """
+    index = get_card_index()
+    phashes = index.phashes
+    if phashes is None:
+        raise FileNotFoundError("Perceptual hash index not found.")
+
+    rows = index.attributes.filter_rows(filters) if filters else None
+    if rows is not None and len(rows) == 0:
+        return []
+
+    with time_stage("fast_search"):
+        query_hash = dhash(img, PHASH_SIZE)
+        candidates = phashes if rows is None else phashes[rows]
+        distances = hamming_distances(query_hash, candidates)
+        positions = rows if rows is not None else np.arange(len(distances))
+
+        num_results = min(top_k, len(distances))
+        top = np.argpartition(distances, num_results - 1)[:num_results]
+        top = top[np.argsort(distances[top], kind="stable")]
+    return [index.card_ids[idx] for idx in positions[top]]
+
 def create_embeddings(card_db_file):
     """
-    Create embeddings for images in the card database and save to embeddings.npy and image_metadata.json.
+    Create embeddings for images in the card database and save to embeddings.npy and image_metadata.json,
+    plus the packed card_index.bin the API loads.
 
     Args:
         card_db_file (str): Path to CSV file containing card data with 'card image url' and 'card id' columns.
@@ -244,7 +860,17 @@ def create_embeddings(card_db_file):
     image_metadata = []
 
     if os.path.exists(embedding_file):
-        print("Embedding file exists, skipping creation.")
+        if os.path.exists(clip.index_file):
+            print("Embedding file exists, skipping creation.")
+            return
+        # Built before the packed format: pack the existing pair instead of re-embedding,
+        # and stamp the side files that were built row-aligned with it
+        header = convert_legacy_index(embedding_file, metadata_file, clip.index_file, clip.model_name,
+                                      PREPROCESSING_VERSION)
+        print(f"Embedding file exists, packed its {header['count']} rows into {clip.index_file}")
+        for path in (clip.region_embedding_file, clip.phash_file):
+            if os.path.exists(path):
+                stamp_side_file(path)
         return
 
     for index, row in df.iterrows():
@@ -257,7 +883,7 @@ def create_embeddings(card_db_file):
             img.verify()
             img = Image.open(BytesIO(response.content))
 
-            embedding = get_image_embedding(img)
+            embedding = get_image_embedding(img, use_cache=True)
             if embedding is None:
                 print(f"Skipping {image_url}: Invalid embedding.")
                 continue
@@ -285,12 +911,124 @@ def create_embeddings(card_db_file):
             np.save(embedding_file, embeddings)
             with open(metadata_file, 'w') as f:
                 json.dump(image_metadata, f)
+            write_index(clip.index_file, embeddings, [meta["card_id"] for meta in image_metadata],
+                        model=clip.model_name, preprocessing_version=PREPROCESSING_VERSION)
             print(f"Final save: {len(embeddings)} embeddings")
         else:
             print("No valid embeddings generated")
     else:
         print("No embeddings generated")
 
+def load_image_urls(card_db_file):
+    """Card ID -> image URL from a CSV with 'card id' and 'card image url' columns, both stripped."""
+    df = pd.read_csv(card_db_file)
+    return {str(card_id).strip(): str(url).strip() for card_id, url in zip(df["card id"], df["card image url"])}
+
+def stamp_side_file(path):
+    """Stamp a freshly built side file for the card_index.bin on disk, if one exists."""
+    clip = ImageEmbeddingModel()
+    if os.path.exists(clip.index_file):
+        write_side_stamp(path, read_header(clip.index_file)["checksum"])
+
+def create_region_embeddings(card_db_file):
+    """
+    Create region embeddings row-aligned with embeddings.npy and save them to region_embeddings.npy.
+
+    Args:
+        card_db_file (str): Path to CSV file containing card data with 'card image url' and 'card id' columns.
+    """
+    clip = ImageEmbeddingModel()
+    region_file = clip.region_embedding_file
+
+    if os.path.exists(region_file):
+        print("Region embedding file exists, skipping creation.")
+        return
+    if not os.path.exists(clip.metadata_file):
+        print("Global embeddings must be created first.")
+        return
+
+    with open(clip.metadata_file, 'r') as f:
+        image_metadata = json.load(f)
+
+    image_urls = load_image_urls(card_db_file)
+
+    # float16 halves the file; rows that fail stay zero and simply score 0 in stage two
+    region_embeddings = None
+    for row, meta in enumerate(image_metadata):
+        image_url = image_urls.get(meta["card_id"])
+        if image_url is None:
+            print(f"Skipping {meta['card_id']}: no image URL.")
+            continue
+        try:
+            response = requests.get(image_url, timeout=10)
+            response.raise_for_status()
+            img = Image.open(BytesIO(response.content))
+            img.verify()
+            img = Image.open(BytesIO(response.content))
+
+            embeddings = get_region_embeddings(img)
+            if embeddings is None:
+                print(f"Skipping {image_url}: Invalid region embedding.")
+                continue
+            if region_embeddings is None:
+                region_embeddings = np.zeros((len(image_metadata),) + embeddings.shape, dtype=np.float16)
+            region_embeddings[row] = embeddings
+
+        except (requests.RequestException, ValueError, Exception) as e:
+            print(f"Error processing {image_url}: {e}")
+            continue
+
+    if region_embeddings is None:
+        print("No region embeddings generated")
+        return
+    np.save(region_file, region_embeddings)
+    stamp_side_file(region_file)
+    print(f"Final save: {len(region_embeddings)} region embeddings")
+
+def create_phash_index(card_db_file):
+    """
+    Create 256-bit perceptual hashes row-aligned with embeddings.npy and save them to phash_index.npy.
+
+    Args:
+        card_db_file (str): Path to CSV file containing card data with 'card image url' and 'card id' columns.
+    """
+    clip = ImageEmbeddingModel()
+    phash_file = clip.phash_file
+
+    if os.path.exists(phash_file):
+        print("Perceptual hash file exists, skipping creation.")
+        return
+    if not os.path.exists(clip.metadata_file):
+        print("Global embeddings must be created first.")
+        return
+
+    with open(clip.metadata_file, 'r') as f:
+        image_metadata = json.load(f)
+
+    image_urls = load_image_urls(card_db_file)
+
+    # Rows that fail keep an all-zero hash, which is far from any real image
+    phashes = np.zeros((len(image_metadata), PHASH_WORDS), dtype=np.uint64)
+    for row, meta in enumerate(image_metadata):
+        image_url = image_urls.get(meta["card_id"])
+        if image_url is None:
+            print(f"Skipping {meta['card_id']}: no image URL.")
+            continue
+        try:
+            response = requests.get(image_url, timeout=10)
+            response.raise_for_status()
+            img = Image.open(BytesIO(response.content))
+            img.verify()
+            img = Image.open(BytesIO(response.content))
+            phashes[row] = dhash(img, PHASH_SIZE)
+        except (requests.RequestException, ValueError, Exception) as e:
+            print(f"Error processing {image_url}: {e}")
+            continue
+
+    np.save(phash_file, phashes)
+    stamp_side_file(phash_file)
+    print(f"Final save: {len(phashes)} perceptual hashes")
+
 def get_image_similarity(image1_path, image2_path):
     """
     Compute cosine similarity between two images.
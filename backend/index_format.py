@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Single-file, versioned card embedding index (embedding_cache/card_index.bin).
+
+Replaces the embeddings.npy + image_metadata.json pair, which had to be loaded
+and cross-checked separately: the JSON list was parsed in full on every load,
+and nothing recorded which model or preprocessing produced the vectors.
+
+Layout (little-endian, every section 64-byte aligned, one mmap covers it all):
+
+    header       HEADER_SIZE bytes: magic, format version, flags (bit 0 =
+                 rows are unit-normalized), dimension, preprocessing version,
+                 row count, model name, SHA-256 of everything after the header
+    embeddings   count x dimension float32
+    source_rows  count int64: each row's position in the files the side
+                 indexes (region_embeddings.npy, phash_index.npy) are aligned to
+    id_offsets   count + 1 uint32 byte offsets into id_blob
+    id_blob      card IDs, UTF-8, concatenated
+
+Files are written to a temporary name and renamed into place, so a reader or
+the API's index watcher never sees a half-written index.
+
+Each side index carries a stamp, <side file>.stamp.json, recording the checksum
+of the index it was built for and its own size. A packed index ignores side
+files without a matching stamp instead of reading rows that belong to another
+build.
+
+Usage:
+    python index_format.py convert [--embeddings embedding_cache/embeddings.npy]
+                                   [--metadata embedding_cache/image_metadata.json]
+                                   [--output embedding_cache/card_index.bin]
+    python index_format.py info [embedding_cache/card_index.bin]
+    python index_format.py stamp [--index embedding_cache/card_index.bin] SIDE_FILE [SIDE_FILE ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"PKCARDIX"
+FORMAT_VERSION = 1
+FLAG_NORMALIZED = 1
+# magic, format version, flags, dimension, preprocessing version, count, model name, checksum
+HEADER = struct.Struct("<8sHHIIQ64s32s")
+HEADER_SIZE = 128
+SECTION_ALIGNMENT = 64
+CHECKSUM_CHUNK = 16 * 1024 * 1024
+SIDE_STAMP_SUFFIX = ".stamp.json"
+
+
+class IndexFormatError(ValueError):
+    """The file is not a valid card index, or does not match the running model."""
+
+
+def _align(offset: int) -> int:
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+
+def _layout(count: int, dim: int) -> Dict[str, int]:
+    """Byte offset of each section, plus where the ID blob starts."""
+    embeddings = HEADER_SIZE
+    source_rows = _align(embeddings + count * dim * 4)
+    id_offsets = _align(source_rows + count * 8)
+    id_blob = _align(id_offsets + (count + 1) * 4)
+    return {"embeddings": embeddings, "source_rows": source_rows, "id_offsets": id_offsets, "id_blob": id_blob}
+
+
+def write_index(path: str, embeddings: np.ndarray, card_ids: Sequence[str],
+                source_rows: Optional[np.ndarray] = None, model: str = "",
+                preprocessing_version: int = 0, normalized: bool = True) -> Dict[str, Any]:
+    """
+    Write an index file atomically (temporary file + rename).
+
+    Args:
+        embeddings: (count, dim) vectors; must be finite
+        card_ids: Card ID per row
+        source_rows: Row positions in the side-index files (default: 0..count-1)
+        model, preprocessing_version: What produced the vectors; readers refuse a mismatch
+        normalized: Whether the rows are unit-normalized
+
+    Returns:
+        The header as read_header() reports it
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2:
+        raise IndexFormatError(f"Embeddings must be 2-D, got shape {embeddings.shape}")
+    count, dim = embeddings.shape
+    if len(card_ids) != count:
+        raise IndexFormatError(f"{len(card_ids)} card IDs for {count} embeddings")
+    if not np.all(np.isfinite(embeddings)):
+        raise IndexFormatError("Embeddings contain NaN/inf rows")
+    source_rows = np.arange(count, dtype=np.int64) if source_rows is None else np.asarray(source_rows, dtype=np.int64)
+    if len(source_rows) != count:
+        raise IndexFormatError(f"{len(source_rows)} source rows for {count} embeddings")
+    model_bytes = model.encode("utf-8")
+    if len(model_bytes) > 64:
+        raise IndexFormatError(f"Model name too long for the header: {model!r}")
+
+    encoded_ids = [card_id.encode("utf-8") for card_id in card_ids]
+    id_offsets = np.zeros(count + 1, dtype=np.uint32)
+    id_offsets[1:] = np.cumsum([len(card_id) for card_id in encoded_ids], dtype=np.int64)
+    layout = _layout(count, dim)
+    sections = [
+        (layout["embeddings"], embeddings.tobytes()),
+        (layout["source_rows"], source_rows.astype("<i8").tobytes()),
+        (layout["id_offsets"], id_offsets.astype("<u4").tobytes()),
+        (layout["id_blob"], b"".join(encoded_ids)),
+    ]
+
+    checksum = hashlib.sha256()
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(b"\0" * HEADER_SIZE)
+            position = HEADER_SIZE
+            for offset, data in sections:
+                padding = b"\0" * (offset - position)
+                f.write(padding)
+                f.write(data)
+                checksum.update(padding)
+                checksum.update(data)
+                position = offset + len(data)
+            flags = FLAG_NORMALIZED if normalized else 0
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags, dim, preprocessing_version, count,
+                                model_bytes, checksum.digest()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return read_header(path)
+
+
+def _parse_header(data: bytes) -> Dict[str, Any]:
+    if len(data) < HEADER_SIZE:
+        raise IndexFormatError("File is too short for an index header")
+    magic, version, flags, dim, preprocessing_version, count, model, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise IndexFormatError("Not a card index file (bad magic)")
+    if version != FORMAT_VERSION:
+        raise IndexFormatError(f"Unsupported index format version {version} (expected {FORMAT_VERSION})")
+    return {
+        "format_version": version,
+        "model": model.rstrip(b"\0").decode("utf-8"),
+        "preprocessing_version": preprocessing_version,
+        "dim": dim,
+        "count": count,
+        "normalized": bool(flags & FLAG_NORMALIZED),
+        "checksum": checksum.hex(),
+    }
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Parse only the header (no mmap, no checksum)."""
+    with open(path, "rb") as f:
+        return _parse_header(f.read(HEADER_SIZE))
+
+
+def read_index(path: str, verify_checksum: bool = True) -> Tuple[Dict[str, Any], np.ndarray, np.ndarray, List[str]]:
+    """
+    Map an index file and return (header, embeddings, source_rows, card_ids).
+
+    embeddings and source_rows are read-only views of one memory map, so worker
+    processes share their pages through the page cache. Raises IndexFormatError
+    for a truncated, corrupt or unknown file.
+    """
+    if os.path.getsize(path) < HEADER_SIZE:
+        raise IndexFormatError("File is too short for an index header")
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = _parse_header(bytes(data[:HEADER_SIZE]))
+    count, dim = header["count"], header["dim"]
+    layout = _layout(count, dim)
+    if len(data) < layout["id_blob"]:
+        raise IndexFormatError(f"Index is truncated: {len(data)} bytes for {count} x {dim} rows")
+
+    id_offsets = data[layout["id_offsets"]:layout["id_offsets"] + (count + 1) * 4].view("<u4")
+    if len(data) != layout["id_blob"] + int(id_offsets[-1]):
+        raise IndexFormatError("Index size does not match its card ID table")
+    if verify_checksum:
+        checksum = hashlib.sha256()
+        for start in range(HEADER_SIZE, len(data), CHECKSUM_CHUNK):
+            checksum.update(data[start:start + CHECKSUM_CHUNK])
+        if checksum.hexdigest() != header["checksum"]:
+            raise IndexFormatError("Index checksum mismatch (file is corrupt or was modified)")
+
+    embeddings = data[layout["embeddings"]:layout["embeddings"] + count * dim * 4].view("<f4").reshape(count, dim)
+    source_rows = data[layout["source_rows"]:layout["source_rows"] + count * 8].view("<i8")
+    blob = bytes(data[layout["id_blob"]:])
+    offsets = id_offsets.tolist()
+    card_ids = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+    return header, embeddings, source_rows, card_ids
+
+
+def write_side_stamp(side_path: str, index_checksum: str) -> None:
+    """Record that side_path was built for the index with this checksum (temporary file + rename)."""
+    stamp = {"index_checksum": index_checksum, "size": os.path.getsize(side_path)}
+    path = side_path + SIDE_STAMP_SUFFIX
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(stamp, f)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def side_file_matches(side_path: str, index_checksum: str) -> bool:
+    """Whether side_path is stamped for this index checksum and has not been replaced since."""
+    try:
+        with open(side_path + SIDE_STAMP_SUFFIX) as f:
+            stamp = json.load(f)
+        size = os.path.getsize(side_path)
+    except (OSError, ValueError):
+        return False
+    return stamp.get("index_checksum") == index_checksum and stamp.get("size") == size
+
+
+def convert_legacy_index(embedding_file: str, metadata_file: str, output: str, model: str,
+                         preprocessing_version: int) -> Dict[str, Any]:
+    """
+    Pack embeddings.npy + image_metadata.json into one index file. NaN/inf rows are
+    dropped here, at build time; source_rows keeps the side indexes aligned.
+    """
+    embeddings = np.load(embedding_file, mmap_mode="r")
+    with open(metadata_file, "r") as f:
+        image_metadata = json.load(f)
+    if len(embeddings) != len(image_metadata):
+        raise IndexFormatError(f"{len(embeddings)} embeddings but {len(image_metadata)} metadata entries")
+
+    valid = np.all(np.isfinite(embeddings), axis=1)
+    source_rows = np.flatnonzero(valid)
+    if not np.all(valid):
+        print(f"Dropping {int(np.sum(~valid))} invalid embeddings")
+    vectors = np.asarray(embeddings[source_rows], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = bool(np.allclose(norms, 1.0, atol=1e-3))
+    return write_index(output, vectors, [image_metadata[row]["card_id"] for row in source_rows], source_rows,
+                       model, preprocessing_version, normalized)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Pack embeddings.npy + image_metadata.json into one index file")
+    convert.add_argument("--embeddings", default=os.path.join("embedding_cache", "embeddings.npy"))
+    convert.add_argument("--metadata", default=os.path.join("embedding_cache", "image_metadata.json"))
+    convert.add_argument("--output", default=os.path.join("embedding_cache", "card_index.bin"))
+
+    info = commands.add_parser("info", help="Print an index header and verify its checksum")
+    info.add_argument("path", nargs="?", default=os.path.join("embedding_cache", "card_index.bin"))
+
+    stamp = commands.add_parser("stamp", help="Mark side files as built for the current index")
+    stamp.add_argument("side_files", nargs="+", help="e.g. embedding_cache/region_embeddings.npy")
+    stamp.add_argument("--index", default=os.path.join("embedding_cache", "card_index.bin"))
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        # Stamped with the model the API runs, so a mismatched index is refused at load
+        from image_similarity import CLIP_MODEL_NAME, PREPROCESSING_VERSION
+        header = convert_legacy_index(args.embeddings, args.metadata, args.output,
+                                      CLIP_MODEL_NAME, PREPROCESSING_VERSION)
+        print(f"Wrote {header['count']} rows to {args.output}")
+    elif args.command == "stamp":
+        header = read_header(args.index)
+        for side_file in args.side_files:
+            write_side_stamp(side_file, header["checksum"])
+            print(f"Stamped {side_file} for index {header['checksum'][:12]}")
+    else:
+        header, _, _, _ = read_index(args.path)
+        print(json.dumps(header, indent=2))
+
+
+if __name__ == "__main__":
+    main()
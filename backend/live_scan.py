@@ -0,0 +1,206 @@
+"""
+WebSocket live-scan session: continuous camera frames in, identifications out.
+
+Protocol
+    client -> server  binary message: one encoded camera frame (JPEG/PNG/WebP)
+    client -> server  text message:   JSON control, {"type": "reset"} forgets the
+                                      last reported card so it can be reported again
+    server -> client  {"type": "match", "card": {...}, "confidence": ..., "frame": n, "stats": {...}}
+    server -> client  {"type": "searching", "confidence": ..., "frame": n}
+    server -> client  {"type": "busy", "retryAfter": seconds, "frame": n}
+                                      the frame was refused by admission control; the next
+                                      frame is identified even if it looks like this one
+    server -> client  {"type": "error", "detail": "...", "frame": n}
+
+Only the newest frame is ever processed: frames that arrive while inference is
+busy replace the pending one (stale frames are dropped), frames that are
+near-duplicates of the last processed frame are skipped without inference, and
+a match is pushed once per card as soon as confidence crosses the threshold.
+A near-duplicate of a view that was not identified confidently is still
+re-checked every LIVE_SCAN_RETRY_SECONDS, so a card held still in poor focus or
+light gets another chance as the frame improves.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+from admission import AdmissionRejected
+from image_decode import decode_for_scan
+from perceptual_hash import dhash64
+
+logger = logging.getLogger(__name__)
+
+# Top-1 score needed to report a match, and its required lead over the runner-up
+LIVE_SCAN_CONFIDENCE = float(os.getenv("LIVE_SCAN_CONFIDENCE", "0.85"))
+LIVE_SCAN_MIN_MARGIN = float(os.getenv("LIVE_SCAN_MIN_MARGIN", "0.02"))
+# Frames within this many dHash bits of the last processed frame are skipped
+LIVE_SCAN_DUPLICATE_DISTANCE = int(os.getenv("LIVE_SCAN_DUPLICATE_DISTANCE", "4"))
+# A still view without a confident match is identified again after this long
+LIVE_SCAN_RETRY_SECONDS = float(os.getenv("LIVE_SCAN_RETRY_SECONDS", "1.5"))
+LIVE_SCAN_MAX_FRAME_BYTES = int(os.getenv("LIVE_SCAN_MAX_FRAME_BYTES", str(2 * 1024 * 1024)))
+# Live frames are small; decode just enough for the 224px CLIP crop
+LIVE_SCAN_DECODE_MIN_SIDE = int(os.getenv("LIVE_SCAN_DECODE_MIN_SIDE", "480"))
+
+IdentifyFrame = Callable[[Any], Awaitable[List[Tuple[str, float]]]]
+DescribeCard = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def _decode_and_hash(frame: bytes):
+    img = decode_for_scan(frame, LIVE_SCAN_DECODE_MIN_SIDE)
+    return img, dhash64(img)
+
+
+class LiveScanSession:
+    """Drives one live-scan WebSocket connection."""
+
+    def __init__(self, websocket: WebSocket, identify_frame: IdentifyFrame, describe_card: DescribeCard,
+                 confidence_threshold: float = LIVE_SCAN_CONFIDENCE):
+        """
+        Args:
+            websocket: Accepted WebSocket connection
+            identify_frame: Coroutine returning ranked (card_id, score) pairs for a decoded frame
+            describe_card: Coroutine returning the cardData payload for a card ID
+            confidence_threshold: Minimum top-1 score to report a match
+        """
+        self.websocket = websocket
+        self.identify_frame = identify_frame
+        self.describe_card = describe_card
+        self.confidence_threshold = confidence_threshold
+
+        self._pending_frame: Optional[bytes] = None
+        self._frame_ready = asyncio.Event()
+        self._closed = False
+        self._last_hash: Optional[int] = None
+        self._last_processed_at = 0.0
+        # Whether the last processed frame was identified confidently (never retried)
+        self._last_confident = False
+        self._last_reported_card: Optional[str] = None
+        self.stats = {"received": 0, "processed": 0, "dropped": 0, "skipped": 0, "rejected": 0, "matches": 0}
+
+    async def run(self) -> None:
+        receiver = asyncio.create_task(self._receive_frames())
+        try:
+            await self._process_frames()
+        finally:
+            receiver.cancel()
+            logger.info(f"Live scan session closed: {self.stats}")
+
+    async def _receive_frames(self) -> None:
+        """Keep only the newest frame; anything not yet processed is dropped as stale."""
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None:
+                    self._handle_control(message.get("text"))
+                    continue
+                self.stats["received"] += 1
+                if len(frame) > LIVE_SCAN_MAX_FRAME_BYTES:
+                    self.stats["dropped"] += 1
+                    continue
+                if self._pending_frame is not None:
+                    self.stats["dropped"] += 1
+                self._pending_frame = frame
+                self._frame_ready.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            self._frame_ready.set()
+
+    def _handle_control(self, text: Optional[str]) -> None:
+        try:
+            control = json.loads(text or "{}")
+        except json.JSONDecodeError:
+            return
+        if not isinstance(control, dict):
+            return
+        if control.get("type") == "reset":
+            self._last_reported_card = None
+            self._last_hash = None
+
+    async def _process_frames(self) -> None:
+        while True:
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            if self._closed:
+                return
+            frame, self._pending_frame = self._pending_frame, None
+            if frame is None:
+                continue
+            frame_number = self.stats["received"]
+
+            try:
+                img, frame_hash = await asyncio.to_thread(_decode_and_hash, frame)
+            except HTTPException as he:
+                await self._send({"type": "error", "detail": he.detail, "frame": frame_number})
+                continue
+
+            # Camera held still on the same view: nothing new to identify, unless the
+            # view was not identified confidently and is due for another try
+            now = time.monotonic()
+            if (self._last_hash is not None
+                    and bin(frame_hash ^ self._last_hash).count("1") <= LIVE_SCAN_DUPLICATE_DISTANCE
+                    and (self._last_confident or now - self._last_processed_at < LIVE_SCAN_RETRY_SECONDS)):
+                self.stats["skipped"] += 1
+                continue
+            self._last_hash = frame_hash
+            self._last_processed_at = now
+            self._last_confident = False
+
+            try:
+                matches = await self.identify_frame(img)
+            except AdmissionRejected as e:
+                # Not a duplicate of anything identified: let the same view through again
+                self._last_hash = None
+                self.stats["rejected"] += 1
+                await self._send({"type": "busy", "retryAfter": e.retry_after, "frame": frame_number})
+                continue
+            except Exception as e:
+                logger.error(f"Live scan identification failed: {e}")
+                await self._send({"type": "error", "detail": "Identification failed", "frame": frame_number})
+                continue
+            self.stats["processed"] += 1
+            if not matches:
+                continue
+
+            best_card_id, best_score = matches[0]
+            runner_up_score = matches[1][1] if len(matches) > 1 else -1.0
+            confident = (best_score >= self.confidence_threshold
+                         and best_score - runner_up_score >= LIVE_SCAN_MIN_MARGIN)
+
+            self._last_confident = confident
+            if not confident:
+                await self._send({"type": "searching", "confidence": round(best_score, 4), "frame": frame_number})
+                continue
+            if best_card_id == self._last_reported_card:
+                continue
+
+            card = await self.describe_card(best_card_id)
+            if card is None:
+                continue
+            self._last_reported_card = best_card_id
+            self.stats["matches"] += 1
+            await self._send({
+                "type": "match",
+                "card": card,
+                "confidence": round(best_score, 4),
+                "frame": frame_number,
+                "stats": dict(self.stats),
+            })
+
+    async def _send(self, payload: Dict[str, Any]) -> None:
+        if self._closed:
+            return
+        try:
+            await self.websocket.send_json(payload)
+        except (WebSocketDisconnect, RuntimeError):
+            self._closed = True
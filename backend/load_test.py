@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Load generator for the scan, card and library endpoints.
+
+Ramps concurrency step by step and, for each step, reports throughput,
+p50/p95/p99 latency and error rate per endpoint. The whole run is saved as a
+JSON scaling curve, so worker counts and batching settings can be chosen by
+comparing curves rather than by guesswork.
+
+Targets
+    --target asgi       (default) drive api.app in-process through httpx's ASGI
+                        transport; no network, but client and server share a CPU
+    --target localhost  serve api.app with uvicorn on a free local port and
+                        drive it over real HTTP
+    --url URL           drive an already running server; authenticate with
+                        --header "Cookie: sAccessToken=..." for /library
+
+In-process targets replace every SuperTokens verify_session dependency with a
+fixed session for --user-id, and can use the offline stub model (--stub-model).
+They run against a temporary copy of --db, deleted afterwards, so the seeded
+library and every other write never reach the real database.
+Scan requests upload synthetic card-shaped JPEGs from a pool of distinct
+images (or --images photos), so the perceptual-hash scan cache only hits as
+often as the pool repeats.
+
+Usage:
+    python load_test.py [--target asgi|localhost | --url http://host:8000]
+                        [--concurrency 1 2 4 8 16 32] [--duration 10]
+                        [--mix scan=1,card=4,library=2] [--stub-model]
+                        [--output load_test_results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import BytesIO
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+
+API_PREFIX = "/v1/api"
+DEFAULT_MIX = "scan=1,card=4,library=2"
+DEFAULT_USER_ID = "load-test-user"
+FALLBACK_CARD_IDS = ["base1-4", "base1-58", "swsh1-1"]
+
+
+class StubSession:
+    """Stands in for a SuperTokens SessionContainer with a fixed user."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def get_user_id(self):
+        return self.user_id
+
+    def get_handle(self):
+        return f"load-test-{self.user_id}"
+
+    def get_access_token_payload(self):
+        return {"sub": self.user_id}
+
+
+def _iter_routes(routes):
+    for route in routes:
+        yield route
+        # Newer FastAPI keeps included routers as a single lazy entry
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _iter_routes(included.routes)
+
+
+def _iter_dependencies(dependant):
+    for dependency in dependant.dependencies:
+        yield dependency
+        yield from _iter_dependencies(dependency)
+
+
+def stub_sessions(app, user_id):
+    """
+    Override every verify_session() dependency in the app with a fixed session.
+    Each Depends(verify_session()) creates its own callable, so they are found
+    by walking the routes rather than by a single override key.
+    """
+    session = StubSession(user_id)
+
+    async def stub_verify_session():
+        return session
+
+    overridden = 0
+    for route in _iter_routes(app.routes):
+        dependant = getattr(route, "dependant", None)
+        if dependant is None:
+            continue
+        for dependency in _iter_dependencies(dependant):
+            call = dependency.call
+            if getattr(call, "__qualname__", "").startswith("verify_session.") and call not in app.dependency_overrides:
+                app.dependency_overrides[call] = stub_verify_session
+                overridden += 1
+    return overridden
+
+
+def synthetic_card_images(count, seed=0, size=(630, 880)):
+    """Distinct card-shaped JPEGs: coloured frame, 'artwork' box, noise."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        frame_colour = tuple(int(c) for c in rng.integers(0, 256, 3))
+        img = Image.new("RGB", size, frame_colour)
+        draw = ImageDraw.Draw(img)
+        width, height = size
+        draw.rectangle((40, 90, width - 40, height // 2), fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+        for _ in range(12):
+            x0, y0 = int(rng.integers(0, width - 60)), int(rng.integers(0, height - 60))
+            draw.ellipse((x0, y0, x0 + int(rng.integers(20, 120)), y0 + int(rng.integers(20, 120))),
+                         fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+        pixels = np.asarray(img, dtype=np.int16) + rng.integers(-12, 12, size=(height, width, 3))
+        buffer = BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def sample_card_ids(db_path, count=200):
+    """Random catalog IDs for /card/{id}, or a few well-known IDs without a DB."""
+    if not os.path.exists(db_path):
+        return FALLBACK_CARD_IDS
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT id FROM pokemon_cards ORDER BY random() LIMIT ?", (count,)).fetchall()
+    except sqlite3.Error:
+        rows = []
+    finally:
+        conn.close()
+    return [row[0] for row in rows] or FALLBACK_CARD_IDS
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("scan", "card", "library"):
+            raise SystemExit(f"Unknown endpoint in --mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def summarize(samples, duration):
+    """samples: list of (latency_ms, status) for one endpoint in one step."""
+    latencies = [latency for latency, _ in samples]
+    statuses = Counter(str(status) for _, status in samples)
+    errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 400)
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / duration if duration else 0.0,
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "latency_p99_ms": percentile(latencies, 99),
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "status_counts": dict(statuses),
+    }
+
+
+class LoadGenerator:
+    """Closed-loop workers: each sends its next request as soon as the last one finishes."""
+
+    def __init__(self, client, weights, card_ids, scan_images, rng):
+        self.client = client
+        self.endpoints = list(weights)
+        self.weights = [weights[name] for name in self.endpoints]
+        self.card_ids = card_ids
+        self.scan_images = scan_images
+        self.rng = rng
+
+    async def request(self, endpoint):
+        if endpoint == "scan":
+            image = self.rng.choice(self.scan_images)
+            return await self.client.post(f"{API_PREFIX}/scan-card",
+                                          files={"image": ("card.jpg", image, "image/jpeg")})
+        if endpoint == "card":
+            return await self.client.get(f"{API_PREFIX}/card/{self.rng.choice(self.card_ids)}")
+        return await self.client.get(f"{API_PREFIX}/library")
+
+    async def worker(self, deadline, samples):
+        while time.perf_counter() < deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self.request(endpoint)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            samples[endpoint].append(((time.perf_counter() - start) * 1000, status))
+
+    async def run_step(self, concurrency, duration):
+        samples = defaultdict(list)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(deadline, samples) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        step = {
+            "concurrency": concurrency,
+            "duration_s": elapsed,
+            "endpoints": {name: summarize(samples[name], elapsed) for name in self.endpoints if samples[name]},
+            "total": summarize([sample for name in samples for sample in samples[name]], elapsed),
+        }
+        return step
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(app, port):
+    """Serve the app with uvicorn in a background thread; returns the server."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("Local server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+@contextmanager
+def scratch_workdir(db_path):
+    """
+    Run inside a temporary directory holding a copy of db_path (the API opens the
+    relative path 'pokemon_cards.db'), with embedding_cache linked in unchanged.
+    The directory and the copy are deleted on exit.
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="load-test-") as temp_dir:
+        copy = sqlite3.connect(os.path.join(temp_dir, "pokemon_cards.db"))
+        try:
+            if os.path.exists(db_path):
+                source = sqlite3.connect(db_path)
+                try:
+                    source.backup(copy)
+                finally:
+                    source.close()
+        finally:
+            copy.close()
+        if os.path.isdir("embedding_cache"):
+            os.symlink(os.path.abspath("embedding_cache"), os.path.join(temp_dir, "embedding_cache"))
+        os.chdir(temp_dir)
+        try:
+            yield temp_dir
+        finally:
+            os.chdir(previous)
+
+
+def prepare_app(args):
+    """
+    Import the API in-process with stubbed sessions (and optionally the stub model).
+    Call inside scratch_workdir(): the seeded library rows are written to its copy.
+    """
+    if args.stub_model:
+        from stub_model import install_stub_model
+        install_stub_model()
+
+    from api import add_card_to_library, app
+
+    overridden = stub_sessions(app, args.user_id)
+    print(f"Stubbed {overridden} verify_session dependencies for user {args.user_id}")
+    for card_id in args.card_ids[:args.seed_library]:
+        add_card_to_library(args.user_id, card_id)
+    return app
+
+
+async def run_load_test(args, client):
+    rng = random.Random(args.seed)
+    generator = LoadGenerator(client, parse_mix(args.mix), args.card_ids, args.scan_images, rng)
+
+    steps = []
+    print(f"{'conc':>5}{'endpoint':>10}{'req':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err %':>8}")
+    for concurrency in args.concurrency:
+        step = await generator.run_step(concurrency, args.duration)
+        steps.append(step)
+        for name, stats in list(step["endpoints"].items()) + [("total", step["total"])]:
+            print(f"{concurrency:>5}{name:>10}{stats['requests']:>8}{stats['throughput_rps']:>9.1f}"
+                  f"{stats['latency_p50_ms'] or 0:>10.1f}{stats['latency_p95_ms'] or 0:>10.1f}"
+                  f"{stats['latency_p99_ms'] or 0:>10.1f}{stats['error_rate'] * 100:>8.1f}")
+    return steps
+
+
+async def main_async(args):
+    headers = dict(header.split(": ", 1) for header in args.header)
+    timeout = httpx.Timeout(args.timeout)
+    server = None
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, headers=headers, timeout=timeout)
+    else:
+        app = prepare_app(args)
+        if args.target == "localhost":
+            port = free_port()
+            server, _ = start_local_server(app, port)
+            limits = httpx.Limits(max_connections=max(args.concurrency))
+            client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers=headers,
+                                       timeout=timeout, limits=limits)
+        else:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                       headers=headers, timeout=timeout)
+
+    try:
+        return await run_load_test(args, client)
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("asgi", "localhost"), default="asgi", help="In-process target")
+    parser.add_argument("--url", help="Drive an already running server instead")
+    parser.add_argument("--header", action="append", default=[], help="Extra request header, 'Name: value'")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32],
+                        help="Concurrency steps of the ramp")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Relative endpoint weights")
+    parser.add_argument("--images", nargs="*", help="Photos to upload (default: synthetic cards)")
+    parser.add_argument("--image-pool", type=int, default=64, help="Number of distinct synthetic images")
+    parser.add_argument("--db", default="pokemon_cards.db", help="Database to sample card IDs from")
+    parser.add_argument("--user-id", default=DEFAULT_USER_ID, help="User of the stubbed session")
+    parser.add_argument("--seed-library", type=int, default=50, help="Cards to add to the stub user's library")
+    parser.add_argument("--stub-model", action="store_true", help="Use the offline stub model instead of CLIP")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for request mix and images")
+    parser.add_argument("--output", default="load_test_results.json", help="Where to write the scaling curve")
+    args = parser.parse_args()
+
+    args.card_ids = sample_card_ids(args.db)
+    if args.images:
+        args.scan_images = [open(path, "rb").read() for path in args.images]
+    else:
+        args.scan_images = synthetic_card_images(args.image_pool, args.seed)
+
+    if args.url:
+        steps = asyncio.run(main_async(args))
+    else:
+        with scratch_workdir(args.db):
+            steps = asyncio.run(main_async(args))
+
+    results = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "target": args.url or args.target,
+            "mix": parse_mix(args.mix),
+            "model": "stub" if args.stub_model else "server default",
+            "duration_per_step_s": args.duration,
+            "cpu_count": os.cpu_count(),
+            "scan_images": len(args.scan_images),
+        },
+        "steps": steps,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nScaling curve written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
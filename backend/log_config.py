@@ -0,0 +1,190 @@
+"""
+Non-blocking, structured logging for the API process.
+
+Request threads only build a LogRecord and put it on an in-memory queue; a
+background QueueListener thread formats it and does the actual write to stderr.
+So a slow or line-buffered stderr (Docker) never stalls a request.
+
+On top of that:
+- LOG_FORMAT=json emits one JSON object per line (ts, level, logger, msg,
+  request_id, route, and any extra={"fields": {...}} passed at the call site).
+- Per-route sampling: LOG_SAMPLE_RATES="/v1/api/library=0.1,/v1/api/card=0.05"
+  keeps that fraction of requests' INFO/DEBUG records. The decision is made once
+  per request, so a sampled request is logged completely. WARNING and above are
+  always kept.
+- Messages longer than LOG_MAX_MESSAGE_CHARS are truncated before they are
+  queued.
+
+RequestLogContextMiddleware sets the request ID, route and sampling decision in
+context variables. asyncio.to_thread copies them, so records logged from worker
+threads carry the same request context.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+route_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("route", default=None)
+sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("log_sampled", default=True)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """'/v1/api/library=0.1,/v1/api/card=0.05' -> {path prefix: keep fraction}."""
+    rates = {}
+    for part in filter(None, (chunk.strip() for chunk in spec.split(","))):
+        prefix, _, rate = part.rpartition("=")
+        rates[prefix] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def truncate(text: str, limit: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class RequestContextFilter(logging.Filter):
+    """Drops unsampled low-level records and stamps the request context on the rest."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not sampled_var.get():
+            return False
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        return True
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that renders and truncates the message, but leaves formatting to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            # Tracebacks are rendered here: the frames are gone once the caller returns
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+            entry["route"] = record.route
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> None:
+    """
+    Route all logging through a queue to a background writer thread.
+    Safe to call more than once; later calls replace the previous setup.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = TruncatingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork() -> None:
+    """The writer thread does not survive fork(); a child gets a fresh queue and listener."""
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging()
+
+
+atexit.register(shutdown_logging)
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class RequestLogContextMiddleware:
+    """ASGI middleware assigning each request an ID, its route and a sampling decision."""
+
+    def __init__(self, app, sample_rates: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.sample_rates = parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates
+        # Longest prefix wins
+        self._prefixes = sorted(self.sample_rates, key=len, reverse=True)
+
+    def _sample_rate(self, path: str) -> float:
+        for prefix in self._prefixes:
+            if path.startswith(prefix):
+                return self.sample_rates[prefix]
+        return 1.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        tokens = (
+            request_id_var.set(request_id or uuid.uuid4().hex[:16]),
+            route_var.set(scope["path"]),
+            sampled_var.set(random.random() < self._sample_rate(scope["path"])),
+        )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for var, token in zip((request_id_var, route_var, sampled_var), tokens):
+                var.reset(token)
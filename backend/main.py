@@ -3,7 +3,7 @@ import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 import requests
-from image_similarity import get_image_embedding, get_image_similarity, create_embeddings, embedding_image_similarity
+from image_similarity import get_image_embedding, get_image_similarity, create_embeddings, create_region_embeddings, create_phash_index, embedding_image_similarity
 from pokemontcgsdk import Card
 from pokemontcgsdk import Set
 from pokemontcgsdk import Type
@@ -13,6 +13,7 @@ from pokemontcgsdk import Rarity
 from pokemontcgsdk import RestClient
 import os
 from ocr import ocr_image
+from card_search import create_search_index, add_card_to_search_index, remove_card_from_search_index
 import json
 from PIL import Image
 from io import BytesIO
@@ -147,6 +148,7 @@ def create_database_and_table():
         """
         
         cursor.execute(create_table_sql)
+        create_search_index(cursor)
         conn.commit()
         print("Database and table created successfully!")
         
@@ -309,7 +311,10 @@ def insert_card_to_db(card):
         # Use INSERT OR REPLACE for SQLite (equivalent to ON DUPLICATE KEY UPDATE)
         insert_sql = f"INSERT OR REPLACE INTO pokemon_cards ({columns}) VALUES ({placeholders})"
         
+        # Keep the FTS search index in sync: drop the old entry before REPLACE assigns a new rowid
+        remove_card_from_search_index(cursor, card_data['id'])
         cursor.execute(insert_sql, values)
+        add_card_to_search_index(cursor, card_data['id'])
         conn.commit()
         print(f"Card '{card.name}' inserted successfully!")
         
@@ -384,6 +389,16 @@ if __name__ == "__main__":
     print("\nCreating embeddings with card IDs...")
     create_embeddings(card_db_file)
     print("Embeddings created successfully!")
+
+    # Region embeddings for two-stage re-ranking (row-aligned with embeddings.npy)
+    print("\nCreating region embeddings...")
+    create_region_embeddings(card_db_file)
+    print("Region embeddings created successfully!")
+
+    # Perceptual hashes for the CLIP-free fast mode
+    print("\nCreating perceptual hash index...")
+    create_phash_index(card_db_file)
+    print("Perceptual hash index created successfully!")
     
     exit(0)
 
@@ -0,0 +1,188 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Deliberately dependency-free and cheap on the hot path: an observation is a
+bisect over the bucket bounds and three additions under a lock. Values that
+already live elsewhere (cache counters, inference queue depth) are registered
+as callbacks and only read when /metrics is scraped.
+
+Scan stages timed with time_stage():
+    upload_read, decode, preprocess, inference, vector_search, region_rerank,
+    fast_search, ocr_wait, db_fetch, pricing, serialization
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Sequence, Tuple, Union
+
+# Seconds; spans sub-millisecond lookups through multi-second CLIP inference on CPU
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+CallbackValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label tuple."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket (non-cumulative) counts + overflow, then sum and count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labelvalues, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {count}"
+
+
+class Counter:
+    """Monotonic counter, one series per label tuple."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labelvalues, value in snapshot:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose value is read from existing state at scrape time.
+    The callback returns a number, or {label tuple: number} for labelled series.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 callback: Callable[[], CallbackValue], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> Iterable[str]:
+        value = self.callback()
+        series = value if isinstance(value, dict) else {(): value}
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        for labelvalues, series_value in sorted(series.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(series_value)}"
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def callback(self, name: str, documentation: str, metric_type: str,
+                 callback: Callable[[], CallbackValue], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, metric_type, callback, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+SCAN_STAGE_SECONDS = registry.histogram(
+    "scan_stage_duration_seconds", "Time spent in each stage of the scan pipeline.", ["stage"])
+SCAN_REQUEST_SECONDS = registry.histogram(
+    "scan_request_duration_seconds", "End-to-end /scan-card and /scan-cards handler time by outcome and engine.",
+    ["outcome", "engine"])
+EMBEDDING_CACHE_LOOKUPS = registry.counter(
+    "embedding_cache_lookups_total", "On-disk embedding cache lookups (catalog builds only).", ["result"])
+CARD_INDEX_RELOADS = registry.counter(
+    "card_index_reloads_total", "Hot reloads of the embedding index by result.", ["result"])
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the duration of the enclosed block as one observation of a scan stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SCAN_STAGE_SECONDS.observe(time.perf_counter() - start, stage)
@@ -104,6 +104,22 @@ def modify_user_library_table(cursor: sqlite3.Cursor) -> None:
         except Exception as e:
             logger.warning(f"Could not add foreign key constraint: {e}")
 
+def create_library_pagination_support(cursor: sqlite3.Cursor) -> None:
+    """Create the (user_id, added order) index and revision counters used by /library."""
+    # SQLite appends rowid to index entries, so this index also orders by insertion
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_library_user_added
+        ON user_library (user_id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_library_revisions (
+            user_id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+    logger.info("Created user_library pagination index and revision table")
+
 def create_default_user(cursor: sqlite3.Cursor) -> str:
     """Create a default user for existing data migration."""
     default_user_id = "default_user_001"
@@ -150,6 +166,7 @@ def run_migrations() -> None:
         
         # Modify existing tables
         modify_user_library_table(cursor)
+        create_library_pagination_support(cursor)
         
         # Create default user and migrate data
         default_user_id = create_default_user(cursor)
@@ -1,74 +1,228 @@
 import requests
 from PIL import Image
+import asyncio
+import hashlib
 import json
+import logging
 import os
+from collections import OrderedDict
+from typing import Optional
+import httpx
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
+# Load OCR_API_KEY from .env once at import instead of on every call
+load_dotenv()
+
+OCR_SPACE_URL = "https://api.ocr.space/parse/image"
+# Overridable so the client can be pointed at a local stub server
+OCR_API_URL = os.getenv("OCR_API_URL", OCR_SPACE_URL)
+OCR_ENGINE = "2"
+
+# Client tuning (seconds / counts)
+OCR_CONNECT_TIMEOUT = float(os.getenv("OCR_CONNECT_TIMEOUT", "3"))
+OCR_READ_TIMEOUT = float(os.getenv("OCR_READ_TIMEOUT", "10"))
+OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "2"))
+OCR_MAX_CONNECTIONS = int(os.getenv("OCR_MAX_CONNECTIONS", "10"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "512"))
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OCRError(Exception):
+    """Raised when the OCR service cannot produce text for an image."""
+
+
+def parse_ocr_response(result: dict) -> str:
+    """
+    Extract text from an OCR.space JSON response.
+
+    Args:
+        result: Decoded JSON body returned by OCR.space
+
+    Returns:
+        str: All parsed text joined with spaces
+    """
+    if result.get('IsErroredOnProcessing'):
+        raise OCRError(f"OCR processing error: {result.get('ErrorMessage', 'Unknown error')}")
+    # Combine all text from parsed results
+    return ' '.join([text['ParsedText'] for text in result.get('ParsedResults') or []])
 
 
 def ocr_image(image_path):
     """
     Perform OCR on an image using OCR.space API.
-    
+
     Args:
         image_path (str): Path to the image file
-        
+
     Returns:
         str: Extracted text from the image
     """
-    #load OCR_API_KEY from .env
-    load_dotenv()
-    OCR_API_KEY = os.getenv("OCR_API_KEY")
-
-    url = "https://api.ocr.space/parse/image"
-    api_key = OCR_API_KEY
-
-    OCREngine = "2"
-    
-    # Prepare the files and data for the request
-    files = {
-        'file': open(image_path, 'rb')
-    }
+    api_key = os.getenv("OCR_API_KEY")
+
     data = {
         'apikey': api_key,
         'language': 'eng',
         'isOverlayRequired': 'false',
-        'OCREngine': OCREngine
+        'OCREngine': OCR_ENGINE
     }
-    
+
     try:
-        # Make the POST request
-        response = requests.post(url, files=files, data=data)
+        with open(image_path, 'rb') as image_file:
+            # Make the POST request
+            response = requests.post(
+                OCR_API_URL,
+                files={'file': image_file},
+                data=data,
+                timeout=(OCR_CONNECT_TIMEOUT, OCR_READ_TIMEOUT)
+            )
         response.raise_for_status()  # Raise an exception for bad status codes
-        
-        # Parse the JSON response
-        result = response.json()
-        
-        # Extract the text from the response
-        if result['IsErroredOnProcessing']:
-            raise Exception(f"OCR processing error: {result.get('ErrorMessage', 'Unknown error')}")
-            
-        # Combine all text from parsed results
-        extracted_text = ' '.join([text['ParsedText'] for text in result['ParsedResults']])
-        return extracted_text
-        
+        return parse_ocr_response(response.json())
+
     except requests.exceptions.RequestException as e:
-        raise Exception(f"API request failed: {str(e)}")
-    finally:
-        # Ensure the file is closed
-        files['file'].close()
+        raise OCRError(f"API request failed: {str(e)}")
+
 
+class AsyncOCRClient:
+    """
+    Non-blocking OCR.space client for the request path.
 
+    Keeps one pooled httpx.AsyncClient for its lifetime, applies connect/read
+    timeouts, retries transient failures with exponential backoff, and caches
+    results by SHA-256 of the image bytes so re-scans of the same upload are free.
+    """
 
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        endpoint: str = OCR_API_URL,
+        max_retries: int = OCR_MAX_RETRIES,
+        cache_size: int = OCR_CACHE_SIZE,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Args:
+            api_key: OCR.space API key (defaults to the OCR_API_KEY env var)
+            endpoint: OCR endpoint URL; point at a local stub for testing
+            max_retries: Extra attempts after the first failure
+            cache_size: Number of results kept in the in-memory LRU cache
+            transport: Optional httpx transport (e.g. httpx.MockTransport in tests)
+        """
+        self.api_key = api_key if api_key is not None else os.getenv("OCR_API_KEY")
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self.cache_size = cache_size
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """OCR is only attempted when an API key is configured."""
+        return bool(self.api_key)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(OCR_READ_TIMEOUT, connect=OCR_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=OCR_MAX_CONNECTIONS,
+                    max_keepalive_connections=OCR_MAX_CONNECTIONS
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        text = self._cache.get(key)
+        if text is None:
+            self.cache_misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        return text
+
+    def _cache_put(self, key: str, text: str) -> None:
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def ocr_bytes(self, image_bytes: bytes, filename: str = "card.jpg") -> str:
+        """
+        OCR an in-memory image.
+
+        Args:
+            image_bytes: Encoded image (JPEG/PNG)
+            filename: Upload filename; OCR.space uses its extension to detect the format
+
+        Returns:
+            str: Extracted text
+        """
+        cache_key = hashlib.sha256(image_bytes).hexdigest()
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        data = {
+            'apikey': self.api_key or '',
+            'language': 'eng',
+            'isOverlayRequired': 'false',
+            'OCREngine': OCR_ENGINE
+        }
+        client = self._get_client()
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(0.2 * (2 ** (attempt - 1)))
+            try:
+                response = await client.post(
+                    self.endpoint,
+                    data=data,
+                    files={'file': (filename, image_bytes)}
+                )
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    last_error = OCRError(f"OCR service returned HTTP {response.status_code}")
+                    continue
+                response.raise_for_status()
+                text = parse_ocr_response(response.json())
+                self._cache_put(cache_key, text)
+                return text
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = e
+                logger.warning(f"OCR attempt {attempt + 1} failed: {e}")
+            except (httpx.HTTPStatusError, json.JSONDecodeError) as e:
+                # Client errors and malformed bodies will not improve on retry
+                raise OCRError(f"API request failed: {str(e)}")
+
+        raise OCRError(f"API request failed after {self.max_retries + 1} attempts: {last_error}")
+
+    async def aclose(self) -> None:
+        """Close the pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_ocr_client: Optional[AsyncOCRClient] = None
+
+
+def get_ocr_client() -> AsyncOCRClient:
+    """Process-wide OCR client (one connection pool per worker)."""
+    global _ocr_client
+    if _ocr_client is None:
+        _ocr_client = AsyncOCRClient()
+    return _ocr_client
 
 
 if __name__ == "__main__":
     image_path = "/Users/yksoni/Downloads/pokemon4.jpeg"
     text = ocr_image(image_path)
     print(text)
-
-
-
-
-
-
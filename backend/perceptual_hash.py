@@ -0,0 +1,75 @@
+"""
+Perceptual hashing (dHash) for card images.
+
+A dHash compares each pixel of a tiny grayscale thumbnail with its right
+neighbour, so it survives re-encoding, small exposure changes and slight camera
+motion. Hashes are packed into uint64 words so Hamming distance against many
+hashes is one XOR plus a vectorized popcount.
+"""
+
+import numpy as np
+from PIL import Image
+
+# Same border crop preprocess_image applies before CLIP, so the hash sees what CLIP sees
+HASH_BORDER_CROP = 0.1
+
+
+def dhash_bits(image, hash_size=8, border_crop=HASH_BORDER_CROP):
+    """
+    Difference hash as a flat boolean array of hash_size * hash_size bits.
+
+    Args:
+        image (PIL.Image.Image): Input image.
+        hash_size (int): Grid size; 8 -> 64 bits, 16 -> 256 bits.
+        border_crop (float): Fraction cropped from each edge before hashing.
+
+    Returns:
+        numpy.ndarray: Boolean bit array.
+    """
+    gray = image.convert("L")
+    if border_crop:
+        width, height = gray.size
+        gray = gray.crop((width * border_crop, height * border_crop,
+                          width * (1 - border_crop), height * (1 - border_crop)))
+    # BOX filter averages whole source areas: cheap and stable for tiny thumbnails
+    thumbnail = gray.resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+
+
+def pack_bits(bits):
+    """Pack a boolean bit array (length multiple of 64) into big-endian uint64 words."""
+    return np.packbits(bits).view(">u8").astype(np.uint64)
+
+
+def dhash(image, hash_size=8, border_crop=HASH_BORDER_CROP):
+    """
+    Difference hash packed into uint64 words (1 word for 64 bits, 4 words for 256 bits).
+
+    Returns:
+        numpy.ndarray: uint64 array of length hash_size * hash_size // 64.
+    """
+    return pack_bits(dhash_bits(image, hash_size, border_crop))
+
+
+def dhash64(image, border_crop=HASH_BORDER_CROP):
+    """64-bit difference hash as a Python int (convenient as a cache key)."""
+    return int(dhash(image, 8, border_crop)[0])
+
+
+def hamming_distances(query_words, hash_matrix):
+    """
+    Hamming distance between one packed hash and many.
+
+    Args:
+        query_words (numpy.ndarray): (W,) uint64 query hash.
+        hash_matrix (numpy.ndarray): (N, W) or (N,) uint64 hashes.
+
+    Returns:
+        numpy.ndarray: (N,) distances in bits.
+    """
+    xor = np.bitwise_xor(hash_matrix, query_words)
+    distances = np.bitwise_count(xor)
+    if distances.ndim > 1:
+        distances = distances.sum(axis=1, dtype=np.int32)
+    return distances
@@ -0,0 +1,216 @@
+"""
+Opt-in sampling profiler for production requests.
+
+Scan work runs in worker threads (asyncio.to_thread), where cProfile on the
+request's own thread would see nothing. So a sampler thread instead walks the
+stacks of all threads every few milliseconds and counts them in folded form
+("thread;module:function;..." count), which flamegraph.pl, speedscope and
+inferno read directly.
+
+On-demand: with PROFILING_TOKEN set, a request carrying the
+"X-Profile: <token>" header is sampled at PROFILE_REQUEST_HZ while it runs (the
+token is never read from the query string, which ends up in access logs). The
+profile is written to PROFILE_DIR, and its file name is returned in the
+X-Profile-File response header. One request is profiled at a time, and samples
+cover the whole process during that window.
+
+Continuous: PROFILE_CONTINUOUS_HZ > 0 keeps a low-rate sampler aggregating hot
+stacks across all requests; GET /debug/profile (same token) returns them. nginx
+only proxies /v1/api and /auth, and the backend port is not published, so the
+endpoint is only reachable from poke-network (http://backend:8000/debug/profile).
+
+With PROFILING_TOKEN unset nothing is installed and requests pay no overhead.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_REQUEST_HZ = float(os.getenv("PROFILE_REQUEST_HZ", "500"))
+PROFILE_CONTINUOUS_HZ = float(os.getenv("PROFILE_CONTINUOUS_HZ", "0"))
+# Deeper stacks are truncated at the root end; the hot leaves are what matter
+PROFILE_MAX_DEPTH = 128
+
+# Top frames of threads that are parked, not working; sampling them only adds noise
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILING_TOKEN)
+
+
+def token_matches(candidate: Optional[str]) -> bool:
+    """Constant-time check of an admin profiling token."""
+    return bool(PROFILING_TOKEN) and candidate is not None and hmac.compare_digest(candidate, PROFILING_TOKEN)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+def fold_stack(frame, thread_name: str) -> Optional[str]:
+    """Collapse one thread's stack into 'thread;root;...;leaf', or None if it is idle."""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples every thread's Python stack at a fixed rate into folded-stack counts."""
+
+    def __init__(self, hz: float):
+        self.interval = 1.0 / hz
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            folded = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or names.get(thread_id) == "stack-sampler":
+                    continue
+                stack = fold_stack(frame, names.get(thread_id, str(thread_id)))
+                if stack is not None:
+                    folded.append(stack)
+            with self._lock:
+                self.stacks.update(folded)
+                self.samples += 1
+
+    def folded(self, reset: bool = False) -> str:
+        """Folded-stack text, hottest stacks first."""
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+def write_profile(name: str, folded: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, "w") as f:
+        f.write(folded)
+    return path
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling single requests on demand.
+    Unprofiled requests cost one header lookup.
+    """
+
+    # The continuous-profile endpoint shares the token header but is not itself profiled
+    EXCLUDED_PATHS = {"/debug/profile"}
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.EXCLUDED_PATHS or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_header(send, b"x-profile", b"busy"))
+            return
+
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        route = scope["path"].strip("/").replace("/", "_") or "root"
+        file_name = f"{stamp}-{scope['method'].lower()}-{route}.folded"
+        sampler = StackSampler(PROFILE_REQUEST_HZ).start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, self._with_header(send, b"x-profile-file", file_name.encode()))
+        finally:
+            # Joining the sampler thread blocks for up to one interval; keep it off the event loop
+            try:
+                await asyncio.to_thread(sampler.stop)
+            finally:
+                self._busy.release()
+            path = await asyncio.to_thread(write_profile, file_name, sampler.folded())
+            logger.info(f"Profiled {scope['method']} {scope['path']} in {time.perf_counter() - start:.3f}s "
+                        f"({sampler.samples} samples) -> {path}")
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return token_matches(value.decode("latin-1"))
+        return False
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(name, value)]}
+            await send(message)
+        return send_with_header
+
+
+_continuous_sampler: Optional[StackSampler] = None
+
+
+def start_continuous_profiler() -> Optional[StackSampler]:
+    """Start the low-rate process-wide sampler if PROFILE_CONTINUOUS_HZ is set."""
+    global _continuous_sampler
+    if _continuous_sampler is None and profiling_enabled() and PROFILE_CONTINUOUS_HZ > 0:
+        _continuous_sampler = StackSampler(PROFILE_CONTINUOUS_HZ).start()
+        logger.info(f"Continuous profiler sampling at {PROFILE_CONTINUOUS_HZ} Hz")
+    return _continuous_sampler
+
+
+def stop_continuous_profiler() -> None:
+    global _continuous_sampler
+    if _continuous_sampler is not None:
+        _continuous_sampler.stop()
+        _continuous_sampler = None
+
+
+def continuous_profile(reset: bool = False) -> Optional[Dict[str, object]]:
+    """Aggregated folded stacks from the continuous sampler, or None if it is not running."""
+    if _continuous_sampler is None:
+        return None
+    samples = _continuous_sampler.samples
+    return {"samples": samples, "folded": _continuous_sampler.folded(reset)}
@@ -0,0 +1,129 @@
+"""
+Near-duplicate scan cache keyed by perceptual hash.
+
+Users often re-scan the same card from almost identical camera frames. Query
+embeddings are not cached (frames never repeat byte for byte), so this cache
+stores the top-k result of a scan under the frame's 64-bit dHash and answers any
+later frame whose hash is within a small Hamming radius, until the entry's TTL
+expires.
+
+The cache is shared across users, and cards share their frame layout, so photos
+of two different cards can land a few bits apart. Near (non-exact) matches
+therefore use a tight radius and are only served from entries whose scan was
+unambiguous (stored with near_matches=True); other entries answer exact hashes only.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Defaults are overridable from the environment
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "1024"))
+SCAN_CACHE_TTL_SECONDS = float(os.getenv("SCAN_CACHE_TTL_SECONDS", "120"))
+SCAN_CACHE_MAX_DISTANCE = int(os.getenv("SCAN_CACHE_MAX_DISTANCE", "2"))
+# Top-1 lead over the runner-up a scan needs before near-duplicate frames may reuse it
+SCAN_CACHE_MIN_MARGIN = float(os.getenv("SCAN_CACHE_MIN_MARGIN", "0.02"))
+
+
+class PerceptualHashCache:
+    """
+    Bounded TTL cache searched by Hamming distance.
+
+    Entries live in fixed-size NumPy slot arrays, so a lookup is one vectorized
+    XOR + popcount over at most `capacity` hashes. When full, the oldest slot is
+    overwritten (FIFO), which matches how re-scan bursts age out.
+    """
+
+    def __init__(self, capacity: int = SCAN_CACHE_SIZE, ttl_seconds: float = SCAN_CACHE_TTL_SECONDS,
+                 max_distance: int = SCAN_CACHE_MAX_DISTANCE):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._expires_at = np.zeros(capacity, dtype=np.float64)  # 0 = empty slot
+        self._near_matches = np.zeros(capacity, dtype=bool)
+        self._scopes: List[Optional[str]] = [None] * capacity
+        self._values: List[Any] = [None] * capacity
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: int, scope: str = "") -> Optional[Any]:
+        """
+        Return the cached value of the nearest live entry within max_distance;
+        an entry stored with near_matches=False only answers its exact hash.
+
+        Args:
+            image_hash: 64-bit dHash of the query frame
+            scope: Extra exact-match key (e.g. active search filters)
+        """
+        now = time.monotonic()
+        with self._lock:
+            live = self._expires_at > now
+            if np.any(live):
+                distances = np.bitwise_count(self._hashes ^ np.uint64(image_hash)).astype(np.int32)
+                distances[~live] = 65
+                # Nearest first; scope mismatches are rare so walking a few is cheap
+                for slot in np.argsort(distances, kind="stable"):
+                    if distances[slot] > self.max_distance:
+                        break
+                    if distances[slot] > 0 and not self._near_matches[slot]:
+                        continue
+                    if self._scopes[slot] == scope:
+                        self.hits += 1
+                        return self._values[slot]
+            self.misses += 1
+            return None
+
+    def put(self, image_hash: int, value: Any, scope: str = "", near_matches: bool = True) -> None:
+        """
+        Store a value for this frame hash, overwriting the oldest slot when full.
+
+        Args:
+            near_matches: Also serve it to frames within max_distance, not only to this exact hash
+        """
+        now = time.monotonic()
+        with self._lock:
+            slot = self._next_slot
+            if self._expires_at[slot] > now:
+                self.evictions += 1
+            self._hashes[slot] = np.uint64(image_hash)
+            self._expires_at[slot] = now + self.ttl_seconds
+            self._near_matches[slot] = near_matches
+            self._scopes[slot] = scope
+            self._values[slot] = value
+            self._next_slot = (slot + 1) % self.capacity
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at[:] = 0
+            self._values = [None] * self.capacity
+            self._scopes = [None] * self.capacity
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": int(np.count_nonzero(self._expires_at > time.monotonic())),
+                "capacity": self.capacity,
+            }
+
+
+def filters_scope(filters: Optional[Dict[str, List[str]]]) -> str:
+    """Stable cache scope string for a set of search filters."""
+    if not filters:
+        return ""
+    return "&".join(f"{field}={','.join(sorted(values))}" for field, values in sorted(filters.items()))
+
+
+scan_result_cache = PerceptualHashCache()
@@ -0,0 +1,469 @@
+"""
+Asynchronous bulk scan jobs.
+
+A job is a set of uploaded images scanned in the background instead of one
+/scan-card request per photo. Jobs and their results are persisted in SQLite
+(scan_jobs, scan_job_items) and the images themselves in a spool directory
+(SCAN_JOB_SPOOL_DIR/<job id>/<image index>), so a restart picks up where it
+left off without keeping image bytes in the card database. Clients poll
+GET /scan-jobs/{id} or stream per-image results over server-sent events.
+
+Background worker threads (SCAN_JOB_WORKERS per API process) claim up to
+SCAN_JOB_BATCH_SIZE pending images at a time, across jobs, and embed them with
+one batched CLIP forward pass; the region crops used for re-ranking share a
+second batched pass. Each image is then searched with its job's filters. A
+batch runs on a background admission slot (see admission.py), which is only
+granted while no interactive scan is waiting and a slot stays free for them,
+so bulk imports only use otherwise idle capacity.
+
+With auto_add, the confident matches of a finished job go into the owner's
+user_library in one transaction. Confident means the top-1 score is at least
+SCAN_JOB_CONFIDENCE and leads the runner-up by SCAN_JOB_MIN_MARGIN.
+
+Claims are made in an IMMEDIATE transaction, so several serve.py workers can
+share the tables. An image claimed longer than SCAN_JOB_STALE_SECONDS ago (its
+worker died) is claimed again. A batch whose scan raises is retried one image at
+a time, and images that still fail are marked failed with the error; if
+recording the results fails, the batch is put back in the queue at once.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from admission import scan_admission
+from image_decode import decode_for_scan
+from card_detection import single_card_crop
+from image_similarity import embedding_image_search_batch, get_image_embeddings
+from live_scan import LIVE_SCAN_CONFIDENCE, LIVE_SCAN_MIN_MARGIN
+from metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "1"))
+SCAN_JOB_BATCH_SIZE = int(os.getenv("SCAN_JOB_BATCH_SIZE", "16"))
+SCAN_JOB_MAX_IMAGES = int(os.getenv("SCAN_JOB_MAX_IMAGES", "500"))
+SCAN_JOB_MAX_BYTES = int(os.getenv("SCAN_JOB_MAX_BYTES", str(200 * 1024 * 1024)))
+SCAN_JOB_SPOOL_DIR = os.getenv("SCAN_JOB_SPOOL_DIR", "scan_job_spool")
+SCAN_JOB_STALE_SECONDS = float(os.getenv("SCAN_JOB_STALE_SECONDS", "600"))
+SCAN_JOB_CONFIDENCE = float(os.getenv("SCAN_JOB_CONFIDENCE", str(LIVE_SCAN_CONFIDENCE)))
+SCAN_JOB_MIN_MARGIN = float(os.getenv("SCAN_JOB_MIN_MARGIN", str(LIVE_SCAN_MIN_MARGIN)))
+# Idle workers re-check for new images this often
+SCAN_JOB_POLL_SECONDS = float(os.getenv("SCAN_JOB_POLL_SECONDS", "1.0"))
+# Candidates stored per image (the first one is the match)
+SCAN_JOB_TOP_K = 5
+
+DB_PATH = 'pokemon_cards.db'
+
+SCAN_JOB_IMAGES = metrics_registry.counter(
+    "scan_job_images_total", "Bulk scan job images processed by result.", ["result"])
+SCAN_JOB_BATCH_SECONDS = metrics_registry.histogram(
+    "scan_job_batch_duration_seconds", "Time to decode, embed and search one bulk scan batch.")
+
+
+def _connect() -> sqlite3.Connection:
+    # Claims and finalization from several processes wait on each other's write locks
+    return sqlite3.connect(DB_PATH, timeout=30)
+
+
+def ensure_scan_job_tables() -> None:
+    conn = _connect()
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                total INTEGER NOT NULL,
+                auto_add INTEGER NOT NULL DEFAULT 0,
+                filters TEXT,
+                added_to_library INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                finished_at TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_jobs_user ON scan_jobs (user_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_job_items (
+                job_id TEXT NOT NULL,
+                item_index INTEGER NOT NULL,
+                filename TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                image_path TEXT,
+                claimed_at REAL,
+                card_id TEXT,
+                score REAL,
+                margin REAL,
+                confident INTEGER,
+                candidates TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, item_index)
+            )
+        ''')
+        # Claims scan pending images in submission order
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_job_items_status ON scan_job_items (status)')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def spool_image(job_id: str, item_index: int, contents: bytes) -> str:
+    """Write one job image to the spool directory; returns its path."""
+    job_dir = os.path.join(SCAN_JOB_SPOOL_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    path = os.path.join(job_dir, str(item_index))
+    with open(path, "wb") as f:
+        f.write(contents)
+    return path
+
+
+def discard_spool(job_id: str) -> None:
+    """Delete a job's spooled images (after it finished, or if creating it failed)."""
+    shutil.rmtree(os.path.join(SCAN_JOB_SPOOL_DIR, job_id), ignore_errors=True)
+
+
+def create_job(job_id: str, user_id: str, images: List[tuple], filters: Optional[Dict[str, List[str]]] = None,
+               auto_add: bool = False) -> str:
+    """
+    Persist a job whose images are already spooled.
+
+    Args:
+        job_id: ID from new_job_id() the images were spooled under
+        user_id: Owner of the job
+        images: (filename, spooled image path) per image
+        filters: Metadata filters applied to every image's search
+        auto_add: Add confident matches to the owner's library when the job finishes
+
+    Returns:
+        str: Job ID
+    """
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT INTO scan_jobs (id, user_id, total, auto_add, filters) VALUES (?, ?, ?, ?, ?)',
+                (job_id, user_id, len(images), int(auto_add), json.dumps(filters or {}))
+            )
+            conn.executemany(
+                'INSERT INTO scan_job_items (job_id, item_index, filename, image_path) VALUES (?, ?, ?, ?)',
+                [(job_id, index, filename, path) for index, (filename, path) in enumerate(images)]
+            )
+    finally:
+        conn.close()
+    _work_available.set()
+    return job_id
+
+
+def _item_result(row) -> Dict[str, Any]:
+    item_index, filename, status, card_id, score, margin, confident, candidates, error = row
+    result = {"index": item_index, "filename": filename, "status": status}
+    if status == "done":
+        result.update({
+            "card_id": card_id,
+            "score": score,
+            "margin": margin,
+            "confident": bool(confident),
+            "candidates": json.loads(candidates) if candidates else [],
+        })
+    elif status == "failed":
+        result["error"] = error
+    return result
+
+
+def get_job(job_id: str, user_id: str, after_index: int = -1) -> Optional[Dict[str, Any]]:
+    """
+    Job summary plus its item results with index > after_index, or None if the
+    job does not exist or belongs to another user.
+    """
+    conn = _connect()
+    try:
+        job = conn.execute(
+            'SELECT id, status, total, auto_add, added_to_library, created_at, finished_at '
+            'FROM scan_jobs WHERE id = ? AND user_id = ?',
+            (job_id, user_id)
+        ).fetchone()
+        if job is None:
+            return None
+        counts = dict(conn.execute(
+            'SELECT status, COUNT(*) FROM scan_job_items WHERE job_id = ? GROUP BY status', (job_id,)
+        ).fetchall())
+        items = conn.execute(
+            'SELECT item_index, filename, status, card_id, score, margin, confident, candidates, error '
+            'FROM scan_job_items WHERE job_id = ? AND item_index > ? ORDER BY item_index',
+            (job_id, after_index)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        "job_id": job[0],
+        "status": job[1],
+        "total": job[2],
+        "completed": counts.get("done", 0) + counts.get("failed", 0),
+        "failed": counts.get("failed", 0),
+        "auto_add": bool(job[3]),
+        "added_to_library": job[4],
+        "created_at": job[5],
+        "finished_at": job[6],
+        "items": [_item_result(row) for row in items],
+    }
+
+
+def _claim_batch(conn: sqlite3.Connection, batch_size: int) -> List[tuple]:
+    """Atomically mark up to batch_size images as running; returns (job_id, index, image path, filters)."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('''
+            SELECT i.job_id, i.item_index, i.image_path, j.filters
+            FROM scan_job_items i JOIN scan_jobs j ON j.id = i.job_id
+            WHERE i.status = 'pending' OR (i.status = 'running' AND i.claimed_at < ?)
+            ORDER BY j.created_at, i.job_id, i.item_index
+            LIMIT ?
+        ''', (now - SCAN_JOB_STALE_SECONDS, batch_size)).fetchall()
+        conn.executemany(
+            "UPDATE scan_job_items SET status = 'running', claimed_at = ? WHERE job_id = ? AND item_index = ?",
+            [(now, job_id, item_index) for job_id, item_index, _, _ in rows]
+        )
+        conn.executemany(
+            "UPDATE scan_jobs SET status = 'running' WHERE id = ? AND status = 'queued'",
+            [(job_id,) for job_id in {row[0] for row in rows}]
+        )
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return rows
+
+
+def _scan_batch(rows: List[tuple]) -> List[tuple]:
+    """Decode, batch-embed and search claimed images; returns one UPDATE parameter tuple per image."""
+    updates = []
+    decoded = []
+    for job_id, item_index, image_path, _ in rows:
+        try:
+            with open(image_path, "rb") as f:
+                decoded.append(decode_for_scan(f.read()))
+        except OSError:
+            updates.append(("failed", None, None, None, None, None, "Image is no longer available", job_id, item_index))
+            decoded.append(None)
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            updates.append(("failed", None, None, None, None, None, str(detail), job_id, item_index))
+            decoded.append(None)
+
+    valid = [i for i, img in enumerate(decoded) if img is not None]
+    images = [decoded[i] for i in valid]
+    embeddings = get_image_embeddings(images)
+    # Uploads are whole photos: a card is only detected (for the region re-rank) on a near-tie
+    results = embedding_image_search_batch(
+        embeddings, [json.loads(rows[i][3] or "{}") or None for i in valid], SCAN_JOB_TOP_K,
+        [lambda img=img: single_card_crop(img) for img in images])
+    for i, matches in zip(valid, results):
+        job_id, item_index, _, _ = rows[i]
+        if matches is None:
+            updates.append(("failed", None, None, None, None, None, "Invalid image embedding", job_id, item_index))
+            continue
+        if not matches:
+            updates.append(("failed", None, None, None, None, None, "No matching cards found", job_id, item_index))
+            continue
+        score = matches[0][1]
+        margin = score - matches[1][1] if len(matches) > 1 else score
+        confident = score >= SCAN_JOB_CONFIDENCE and margin >= SCAN_JOB_MIN_MARGIN
+        updates.append(("done", matches[0][0], score, margin, int(confident),
+                        json.dumps([card_id for card_id, _ in matches]), None, job_id, item_index))
+    return updates
+
+
+def _scan_rows(rows: List[tuple]) -> List[tuple]:
+    """_scan_batch, retrying a failed batch one image at a time so an error only fails the images that cause it."""
+    try:
+        return _scan_batch(rows)
+    except Exception as e:
+        if len(rows) > 1:
+            logger.warning(f"Scan job batch failed ({e}), retrying its {len(rows)} images one at a time")
+            return [update for row in rows for update in _scan_rows([row])]
+        logger.exception("Scan job image failed")
+        job_id, item_index, _, _ = rows[0]
+        return [("failed", None, None, None, None, None, f"Scan failed: {e}", job_id, item_index)]
+
+
+def _release_claims(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """Put claimed images that were not recorded back in the queue, instead of waiting for SCAN_JOB_STALE_SECONDS."""
+    try:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            "UPDATE scan_job_items SET status = 'pending', claimed_at = NULL "
+            "WHERE job_id = ? AND item_index = ? AND status = 'running'",
+            [(job_id, item_index) for job_id, item_index, _, _ in rows]
+        )
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        logger.exception("Could not release claimed scan job images; they are reclaimed once stale")
+
+
+def _finish_jobs(conn: sqlite3.Connection, job_ids) -> None:
+    """Close jobs with no images left, adding confident matches to the library where requested."""
+    for job_id in job_ids:
+        with conn:
+            finished = conn.execute('''
+                UPDATE scan_jobs SET status = 'done', finished_at = datetime('now')
+                WHERE id = ? AND status != 'done' AND NOT EXISTS (
+                    SELECT 1 FROM scan_job_items WHERE job_id = ? AND status IN ('pending', 'running'))
+            ''', (job_id, job_id)).rowcount
+            if not finished:
+                continue
+            user_id, auto_add = conn.execute('SELECT user_id, auto_add FROM scan_jobs WHERE id = ?', (job_id,)).fetchone()
+            added = _add_confident_to_library(conn, job_id, user_id) if auto_add else 0
+        discard_spool(job_id)
+        logger.info(f"Scan job {job_id} finished", extra={"fields": {"job_id": job_id, "library_added": added}})
+
+
+def _add_confident_to_library(conn: sqlite3.Connection, job_id: str, user_id: str) -> int:
+    """Insert the job's confident matches into user_library inside the caller's transaction."""
+    card_ids = [row[0] for row in conn.execute(
+        "SELECT DISTINCT card_id FROM scan_job_items WHERE job_id = ? AND status = 'done' AND confident = 1",
+        (job_id,)
+    ).fetchall()]
+    added = 0
+    for card_id in card_ids:
+        added += conn.execute(
+            'INSERT OR IGNORE INTO user_library (user_id, card_id) VALUES (?, ?)', (user_id, card_id)
+        ).rowcount
+    if added:
+        # Same revision bump as /library/add, so library ETags change
+        conn.execute('''
+            INSERT INTO user_library_revisions (user_id, revision, updated_at)
+            VALUES (?, 1, datetime('now'))
+            ON CONFLICT(user_id) DO UPDATE SET
+                revision = revision + 1,
+                updated_at = datetime('now')
+        ''', (user_id,))
+    conn.execute('UPDATE scan_jobs SET added_to_library = ? WHERE id = ?', (added, job_id))
+    return added
+
+
+def process_next_batch(batch_size: int = SCAN_JOB_BATCH_SIZE) -> int:
+    """Claim, scan and record one batch. Returns the number of images processed."""
+    conn = _connect()
+    conn.isolation_level = None  # transactions are managed explicitly
+    try:
+        rows = _claim_batch(conn, batch_size)
+        if not rows:
+            return 0
+        try:
+            start = time.perf_counter()
+            updates = _scan_rows(rows)
+            SCAN_JOB_BATCH_SECONDS.observe(time.perf_counter() - start)
+
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                UPDATE scan_job_items
+                SET status = ?, card_id = ?, score = ?, margin = ?, confident = ?, candidates = ?, error = ?,
+                    image_path = NULL
+                WHERE job_id = ? AND item_index = ?
+            ''', updates)
+            conn.execute('COMMIT')
+        except BaseException:
+            _release_claims(conn, rows)
+            raise
+        for _, _, image_path, _ in rows:
+            try:
+                os.remove(image_path)
+            except OSError:
+                pass
+        for update in updates:
+            SCAN_JOB_IMAGES.inc(update[0])
+
+        conn.isolation_level = ''
+        _finish_jobs(conn, {row[0] for row in rows})
+        return len(rows)
+    finally:
+        conn.close()
+
+
+_work_available = threading.Event()
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+# The API's event loop, which owns scan_admission; None outside the API (no slot needed)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _try_acquire_slot() -> bool:
+    return scan_admission.try_acquire_background()
+
+
+def _release_slot() -> None:
+    _loop.call_soon_threadsafe(scan_admission.release_background)
+
+
+def _acquire_slot() -> bool:
+    """Take a background admission slot from a worker thread; False if none is idle."""
+    if _loop is None:
+        return True
+    future = asyncio.run_coroutine_threadsafe(_try_acquire_slot(), _loop)
+    try:
+        return future.result(timeout=1.0)
+    except concurrent.futures.TimeoutError:
+        # Loop busy or shutting down: if the acquire still runs later, hand the slot straight back
+        future.add_done_callback(lambda f: f.cancelled() or not f.result() or _release_slot())
+        future.cancel()
+        return False
+
+
+def _worker_loop() -> None:
+    while not _stop.is_set():
+        # Bulk work only runs on a slot no interactive scan is waiting for
+        if not _acquire_slot():
+            _stop.wait(0.05)
+            continue
+        try:
+            processed = process_next_batch()
+        except Exception:
+            logger.exception("Scan job batch failed")
+            processed = 0
+        finally:
+            if _loop is not None:
+                _release_slot()
+        if not processed:
+            _work_available.wait(SCAN_JOB_POLL_SECONDS)
+            _work_available.clear()
+
+
+def start_scan_job_workers(count: int = SCAN_JOB_WORKERS) -> None:
+    """Start the background worker threads (idempotent); call from the app lifespan."""
+    global _loop
+    if _workers or count <= 0:
+        return
+    try:
+        _loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _loop = None
+    _stop.clear()
+    for i in range(count):
+        thread = threading.Thread(target=_worker_loop, name=f"scan-job-worker-{i}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+
+
+def stop_scan_job_workers(timeout: float = 30.0) -> None:
+    """Let running batches finish and stop the workers; unfinished images resume on next start."""
+    _stop.set()
+    _work_available.set()
+    for thread in _workers:
+        thread.join(timeout)
+    _workers.clear()
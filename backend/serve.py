@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Pre-fork multi-worker server for the API.
+
+The parent process imports the app, loads the CLIP weights, the embedding
+index (memory-mapped), its attribute bitmasks, the perceptual-hash index and
+the fuzzy name index, and then freezes the garbage collector. Only after that
+does it fork the workers. Each worker serves the same listening socket with its
+own uvicorn event loop. The model and index pages are shared copy-on-write, and
+gc.freeze() keeps the collector from touching them, so adding workers adds CPU
+capacity without multiplying RSS. Use worker_memory.py to check per-worker
+unique memory.
+
+No inference runs in the parent, so torch's thread pools are first created
+inside each worker (forking after they exist is unsafe). Each worker gets
+--threads-per-worker torch threads, by default the CPU count divided by the
+worker count.
+
+Caches (scan results, OCR responses) and /metrics counters are per worker.
+Each worker also runs its own index watcher, so a rebuilt card_index.bin is
+swapped in by every worker within INDEX_WATCH_SECONDS, without a restart.
+
+Usage:
+    python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+                    [--threads-per-worker N] [--pid-file serve.pid]
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger("serve")
+
+# A worker that dies sooner than this after starting is restarted after a pause
+RESTART_BACKOFF_SECONDS = 1.0
+
+
+def preload():
+    """Import the app and load every large read-only structure before forking."""
+    import api
+    from fuzzy_card_index import get_fuzzy_card_index
+    from image_similarity import ImageEmbeddingModel, get_card_index
+
+    # Import-time setup threads (library table, search index) must finish before fork
+    for thread in threading.enumerate():
+        if thread is not threading.main_thread() and not thread.daemon:
+            thread.join()
+
+    ImageEmbeddingModel()
+    try:
+        index = get_card_index()
+        index.attributes
+        index.phashes
+    except FileNotFoundError as e:
+        logger.warning(f"Embedding index not preloaded: {e}")
+    get_fuzzy_card_index()
+
+    # Move everything allocated so far out of the collector's reach: collections in
+    # the workers would otherwise write to these objects' headers and un-share their pages
+    gc.collect()
+    gc.freeze()
+    return api.app
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, threads):
+    """Worker body, runs in the forked child and never returns."""
+    import torch
+    import uvicorn
+    from log_config import shutdown_logging
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    torch.set_num_threads(threads)
+
+    config = uvicorn.Config(app, log_config=None, lifespan="on")
+    server = uvicorn.Server(config)
+    exit_code = 0
+    try:
+        server.run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker crashed")
+        exit_code = 1
+    finally:
+        # os._exit skips atexit, so flush queued log records explicitly
+        shutdown_logging()
+        os._exit(exit_code)
+
+
+def spawn(app, sock, threads):
+    pid = os.fork()
+    if pid == 0:
+        run_worker(app, sock, threads)
+    logger.info(f"Started worker {pid}")
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "2")), help="Worker processes")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address")
+    parser.add_argument("--port", type=int, default=8000, help="Bind port")
+    parser.add_argument("--threads-per-worker", type=int, help="torch threads per worker (default: CPUs / workers)")
+    parser.add_argument("--pid-file", help="Write the parent PID here (for worker_memory.py)")
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    sock = bind_socket(args.host, args.port)
+    app = preload()
+    if args.pid_file:
+        with open(args.pid_file, "w") as f:
+            f.write(str(os.getpid()))
+
+    logger.info(f"Forking {args.workers} workers with {threads} torch threads each on {args.host}:{args.port}")
+    workers = {spawn(app, sock, threads): time.monotonic() for _ in range(args.workers)}
+
+    shutting_down = False
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or shutting_down:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if time.monotonic() - started < RESTART_BACKOFF_SECONDS:
+            time.sleep(RESTART_BACKOFF_SECONDS)
+        workers[spawn(app, sock, threads)] = time.monotonic()
+
+    if args.pid_file and os.path.exists(args.pid_file):
+        os.remove(args.pid_file)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
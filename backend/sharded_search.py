@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Sharded scatter-gather search over partitions of the card embedding index.
+
+The catalog index can be split into shards, by set series or by a hash of the
+card ID. Each shard is an ordinary embeddings.npy + image_metadata.json pair,
+so CardEmbeddingIndex loads it unchanged. Each metadata entry also records the
+card's row in the full index ("source_row"), so region re-ranking can still run
+on the merged candidates. shards.json and each shard's shard.json record the
+checksum of the card_index.bin the shards were cut from; the coordinator passes
+it on, and the merged candidates are only region re-ranked when the local
+region_embeddings.npy is stamped for that same index.
+
+A shard is searched in-process (LocalShard) or over HTTP (RemoteShard)
+against a shard server started with `serve`. ShardCoordinator sends the query
+embedding to every shard at once and waits up to a deadline. It merges the
+per-shard top-k and reports which shards timed out or failed, so a slow or
+missing shard degrades the result instead of failing the scan.
+
+The API switches to sharded search when SEARCH_SHARDS is set, as a
+comma-separated list of shard server URLs and/or local:<shard dir> entries.
+
+Usage:
+    python sharded_search.py build --by hash --shards 4 [--output embedding_cache/shards]
+    python sharded_search.py build --by series
+    python sharded_search.py serve --shard-dir embedding_cache/shards/shard-0 --port 9101
+    python sharded_search.py local-cluster [--shards-dir embedding_cache/shards] [--base-port 9100]
+"""
+
+import argparse
+import asyncio
+import base64
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+
+import image_similarity
+from image_similarity import (CACHE_DIR, CardEmbeddingIndex, ImageEmbeddingModel, get_image_embedding,
+                              needs_region_rerank, rerank_with_regions)
+from index_format import read_header, side_file_matches
+from metrics import registry as metrics_registry, time_stage
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SHARDS = os.getenv("SEARCH_SHARDS", "")
+SEARCH_SHARD_DEADLINE_SECONDS = float(os.getenv("SEARCH_SHARD_DEADLINE_SECONDS", "0.5"))
+SHARDS_DIR = os.path.join(CACHE_DIR, "shards")
+MANIFEST_FILE = "shards.json"
+SHARD_METADATA_FILE = "shard.json"
+
+SHARD_REQUESTS = metrics_registry.counter(
+    "search_shard_requests_total", "Scatter-gather shard queries by shard and result.", ["shard", "result"])
+
+
+def encode_embedding(embedding: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_embedding(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+
+# -- building -----------------------------------------------------------------
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "unknown"
+
+
+def shard_assignments(card_ids: Sequence[str], by: str, num_shards: int = 4,
+                      db_path: str = "pokemon_cards.db") -> List[str]:
+    """Shard name for each card: crc32(card_id) % num_shards, or the card's set series."""
+    if by == "hash":
+        return [f"shard-{zlib.crc32(card_id.encode()) % num_shards}" for card_id in card_ids]
+    if by == "series":
+        conn = sqlite3.connect(db_path)
+        try:
+            series = dict(conn.execute("SELECT id, set_series FROM pokemon_cards").fetchall())
+        finally:
+            conn.close()
+        return [f"series-{_slug(series.get(card_id) or 'unknown')}" for card_id in card_ids]
+    raise ValueError(f"Unknown partitioning: {by}")
+
+
+def build_shards(embedding_file: str, metadata_file: str, output_dir: str, by: str, num_shards: int = 4,
+                 index_file: Optional[str] = None) -> Dict:
+    """
+    Split the full index into shard directories plus a shards.json manifest.
+
+    Args:
+        index_file: The card_index.bin built alongside embedding_file; its checksum is
+            recorded so region re-ranking can check its side files against the shards.
+    """
+    embeddings = np.load(embedding_file, mmap_mode="r")
+    with open(metadata_file, "r") as f:
+        image_metadata = json.load(f)
+    if len(embeddings) != len(image_metadata):
+        raise ValueError("Mismatch between number of embeddings and metadata entries.")
+    index_checksum = None
+    if index_file and os.path.exists(index_file):
+        index_checksum = read_header(index_file)["checksum"]
+    else:
+        print("Warning: no packed index to record, sharded search will not region re-rank these shards.")
+
+    assignments = shard_assignments([meta["card_id"] for meta in image_metadata], by, num_shards)
+    manifest = {"partitioning": by, "source_rows": len(embeddings), "index_checksum": index_checksum, "shards": []}
+    for name in sorted(set(assignments)):
+        rows = np.array([row for row, shard in enumerate(assignments) if shard == name])
+        shard_dir = os.path.join(output_dir, name)
+        os.makedirs(shard_dir, exist_ok=True)
+        np.save(os.path.join(shard_dir, "embeddings.npy"), np.asarray(embeddings[rows], dtype=np.float32))
+        with open(os.path.join(shard_dir, "image_metadata.json"), "w") as f:
+            json.dump([{**image_metadata[row], "source_row": int(row)} for row in rows], f)
+        with open(os.path.join(shard_dir, SHARD_METADATA_FILE), "w") as f:
+            json.dump({"name": name, "index_checksum": index_checksum}, f)
+        manifest["shards"].append({"name": name, "path": name, "rows": int(len(rows))})
+        print(f"{name}: {len(rows)} rows")
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# -- searching one shard --------------------------------------------------------
+
+class ShardSearcher:
+    """Top-k cosine search over one shard directory."""
+
+    def __init__(self, shard_dir: str):
+        self.name = os.path.basename(os.path.normpath(shard_dir))
+        metadata_file = os.path.join(shard_dir, "image_metadata.json")
+        self.index = CardEmbeddingIndex.load(os.path.join(shard_dir, "embeddings.npy"), metadata_file)
+        with open(metadata_file, "r") as f:
+            all_source_rows = np.array([meta["source_row"] for meta in json.load(f)])
+        # Row of each (valid) shard entry in the full, unsharded index
+        self.global_rows = all_source_rows[self.index.source_rows]
+        # Checksum of the full index the shard was cut from (None if unknown)
+        self.index_checksum = None
+        shard_metadata_file = os.path.join(shard_dir, SHARD_METADATA_FILE)
+        if os.path.exists(shard_metadata_file):
+            with open(shard_metadata_file, "r") as f:
+                self.index_checksum = json.load(f).get("index_checksum")
+
+    def search(self, query_embedding: np.ndarray, top_k: int, filters: Optional[Dict[str, List[str]]] = None) -> List[list]:
+        """[card_id, score, row in the full index] for the shard's top_k matches, best first."""
+        rows = self.index.attributes.filter_rows(filters) if filters else None
+        if rows is not None and len(rows) == 0:
+            return []
+        similarities = self.index.similarities(query_embedding, rows)
+        if len(similarities) == 0:
+            return []
+        positions = rows if rows is not None else np.arange(len(similarities))
+        k = min(top_k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [[self.index.card_ids[row], float(similarities[i]), int(self.global_rows[row])]
+                for i, row in zip(top, positions[top])]
+
+
+def create_shard_app(shard_dir: str):
+    """Minimal FastAPI app serving one shard."""
+    from fastapi import Body, FastAPI
+
+    searcher = ShardSearcher(shard_dir)
+    app = FastAPI(title=f"Card index shard {searcher.name}")
+
+    @app.post("/search")
+    async def search(embedding: str = Body(...), top_k: int = Body(100), filters: Optional[Dict[str, List[str]]] = Body(None)):
+        matches = await asyncio.to_thread(searcher.search, decode_embedding(embedding), top_k, filters)
+        return {"shard": searcher.name, "rows": len(searcher.index), "index_checksum": searcher.index_checksum,
+                "matches": matches}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "shard": searcher.name, "rows": len(searcher.index),
+                "index_checksum": searcher.index_checksum}
+
+    return app
+
+
+# -- scatter-gather -------------------------------------------------------------
+
+class LocalShard:
+    """A shard searched in this process, on a worker thread."""
+
+    def __init__(self, shard_dir: str):
+        self.searcher = ShardSearcher(shard_dir)
+        self.name = self.searcher.name
+
+    async def search(self, query_embedding, top_k, filters):
+        matches = await asyncio.to_thread(self.searcher.search, query_embedding, top_k, filters)
+        return {"matches": matches, "index_checksum": self.searcher.index_checksum}
+
+    async def aclose(self):
+        pass
+
+
+class RemoteShard:
+    """A shard behind a shard server; transport can be injected (e.g. httpx.ASGITransport)."""
+
+    def __init__(self, url: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.name = url
+        self._client = httpx.AsyncClient(base_url=url, transport=transport, timeout=None)
+
+    async def search(self, query_embedding, top_k, filters):
+        response = await self._client.post("/search", json={
+            "embedding": encode_embedding(query_embedding), "top_k": top_k, "filters": filters,
+        })
+        response.raise_for_status()
+        answer = response.json()
+        return {"matches": answer["matches"], "index_checksum": answer.get("index_checksum")}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class ShardCoordinator:
+    """Fans a query out to all shards and merges whatever answers within the deadline."""
+
+    def __init__(self, shards: Sequence, deadline_seconds: float = SEARCH_SHARD_DEADLINE_SECONDS):
+        if not shards:
+            raise ValueError("ShardCoordinator needs at least one shard")
+        self.shards = list(shards)
+        self.deadline_seconds = deadline_seconds
+
+    @classmethod
+    def from_spec(cls, spec: str, deadline_seconds: float = SEARCH_SHARD_DEADLINE_SECONDS) -> "ShardCoordinator":
+        """'http://10.0.0.5:9101,local:embedding_cache/shards/shard-1' -> coordinator."""
+        shards = []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            shards.append(LocalShard(entry[len("local:"):]) if entry.startswith("local:") else RemoteShard(entry))
+        return cls(shards, deadline_seconds)
+
+    async def search(self, query_embedding: np.ndarray, top_k: int,
+                     filters: Optional[Dict[str, List[str]]] = None) -> Dict:
+        """
+        Returns:
+            dict: matches ([card_id, score, source_row], best first, merged across shards),
+                failed_shards (names that timed out or errored), partial (True if any did),
+                index_checksum (of the full index every answering shard was cut from, or
+                None if unknown or the shards disagree)
+        """
+        tasks = {asyncio.create_task(shard.search(query_embedding, top_k, filters)): shard for shard in self.shards}
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline_seconds)
+
+        per_shard, failed, checksums = [], [], set()
+        for task in pending:
+            task.cancel()
+            failed.append(tasks[task].name)
+            SHARD_REQUESTS.inc(tasks[task].name, "timeout")
+        for task in done:
+            shard = tasks[task]
+            if task.exception() is not None:
+                logger.warning(f"Shard {shard.name} failed: {task.exception()}")
+                failed.append(shard.name)
+                SHARD_REQUESTS.inc(shard.name, "error")
+                continue
+            per_shard.append(task.result()["matches"])
+            checksums.add(task.result()["index_checksum"])
+            SHARD_REQUESTS.inc(shard.name, "ok")
+
+        if failed:
+            logger.warning(f"Partial search result, missing shards: {failed}")
+        # Each shard list is already sorted, so the global top_k is a k-way merge
+        merged = heapq.merge(*per_shard, key=lambda match: -match[1])
+        if len(checksums) > 1:
+            logger.warning(f"Shards were cut from different indexes: {sorted(map(str, checksums))}")
+        return {"matches": [match for _, match in zip(range(top_k), merged)],
+                "failed_shards": failed, "partial": bool(failed),
+                "index_checksum": checksums.pop() if len(checksums) == 1 else None}
+
+    async def aclose(self):
+        await asyncio.gather(*(shard.aclose() for shard in self.shards))
+
+
+_coordinator: Optional[ShardCoordinator] = None
+
+
+def get_shard_coordinator() -> Optional[ShardCoordinator]:
+    """Process-wide coordinator built from SEARCH_SHARDS, or None when search is not sharded."""
+    global _coordinator
+    if _coordinator is None and SEARCH_SHARDS:
+        _coordinator = ShardCoordinator.from_spec(SEARCH_SHARDS)
+    return _coordinator
+
+
+def _regions_match(index_checksum: Optional[str]) -> bool:
+    """Whether the local region embeddings are stamped for the full index with this checksum."""
+    return index_checksum is not None and side_file_matches(ImageEmbeddingModel().region_embedding_file,
+                                                            index_checksum)
+
+
+async def sharded_image_search(img, filters=None, top_k=10, coordinator: Optional[ShardCoordinator] = None,
+                               query_embedding=None, card_image=None) -> Dict:
+    """
+    embedding_image_search over the shards: embed locally (unless query_embedding is
+    given), gather COARSE_CANDIDATES from the shards, then re-rank a near-tie among
+    the merged candidates with region embeddings here, cut from card_image (see
+    embedding_image_search). The re-rank is skipped unless region_embeddings.npy is
+    stamped for the index the shards were cut from, since it is read by source row.
+
+    Returns:
+        dict: matches ((card_id, score) tuples, best first), failed_shards, partial
+    """
+    coordinator = coordinator or get_shard_coordinator()
+    if query_embedding is None:
+        query_embedding = await asyncio.to_thread(get_image_embedding, img)
+    if query_embedding is None:
+        raise RuntimeError("Invalid query embedding (zero-norm or NaN/inf).")
+
+    with time_stage("vector_search"):
+        result = await coordinator.search(np.asarray(query_embedding, dtype=np.float32).reshape(-1),
+                                          image_similarity.COARSE_CANDIDATES, filters)
+    matches = result["matches"]
+    if matches:
+        candidate_rows = np.array([row for _, _, row in matches])
+        candidate_scores = np.array([score for _, score, _ in matches], dtype=np.float32)
+        if (card_image is not None and needs_region_rerank(candidate_scores)
+                and _regions_match(result["index_checksum"])):
+            with time_stage("region_rerank"):
+                if callable(card_image):
+                    card_image = await asyncio.to_thread(card_image)
+                if card_image is not None:
+                    reranked_scores = await asyncio.to_thread(rerank_with_regions, card_image, candidate_rows,
+                                                              candidate_scores)
+                    if reranked_scores is not None:
+                        candidate_scores = reranked_scores
+        order = np.argsort(-candidate_scores)[:top_k]
+        matches = [(matches[i][0], float(candidate_scores[i])) for i in order]
+    return {"matches": matches, "failed_shards": result["failed_shards"], "partial": result["partial"]}
+
+
+# -- CLI ------------------------------------------------------------------------
+
+def run_local_cluster(shards_dir: str, base_port: int) -> None:
+    """Start one shard server process per shard in the manifest, until interrupted."""
+    with open(os.path.join(shards_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    processes, urls = [], []
+    for offset, shard in enumerate(manifest["shards"]):
+        port = base_port + offset
+        processes.append(subprocess.Popen([sys.executable, __file__, "serve", "--port", str(port),
+                                           "--shard-dir", os.path.join(shards_dir, shard["path"])]))
+        urls.append(f"http://127.0.0.1:{port}")
+    print(f"SEARCH_SHARDS={','.join(urls)}")
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Partition the full index into shards")
+    build.add_argument("--by", choices=("hash", "series"), default="hash", help="Partitioning scheme")
+    build.add_argument("--shards", type=int, default=4, help="Shard count for hash partitioning")
+    build.add_argument("--output", default=SHARDS_DIR, help="Directory for shard subdirectories")
+
+    serve = commands.add_parser("serve", help="Serve one shard over HTTP")
+    serve.add_argument("--shard-dir", required=True, help="Shard directory to serve")
+    serve.add_argument("--host", default="127.0.0.1", help="Bind address")
+    serve.add_argument("--port", type=int, default=9101, help="Bind port")
+
+    cluster = commands.add_parser("local-cluster", help="Run a shard server per shard on localhost")
+    cluster.add_argument("--shards-dir", default=SHARDS_DIR, help="Directory containing shards.json")
+    cluster.add_argument("--base-port", type=int, default=9100, help="Port of the first shard server")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_shards(os.path.join(CACHE_DIR, "embeddings.npy"), os.path.join(CACHE_DIR, "image_metadata.json"),
+                     args.output, args.by, args.shards, os.path.join(CACHE_DIR, "card_index.bin"))
+    elif args.command == "serve":
+        import uvicorn
+        uvicorn.run(create_shard_app(args.shard_dir), host=args.host, port=args.port, log_config=None)
+    else:
+        run_local_cluster(args.shards_dir, args.base_port)
+
+
+if __name__ == "__main__":
+    main()
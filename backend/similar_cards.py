@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Precomputed "similar cards" graph: each catalog card's top-k nearest catalog neighbours.
+
+Reprints and alternate-art versions of a card sit right next to it in CLIP
+space, so finding them needs no photo and no per-request vector search. `build`
+scores the whole catalog against itself once, offline, with blocked matrix
+multiplication (block_size x N similarities in memory at a time). It keeps
+each row's top k and writes embedding_cache/similar_cards.npz:
+
+    card_ids        (N,) card ID per row
+    neighbours      (N, k) int32 rows of the k most similar cards, best first
+    scores          (N, k) float16 cosine similarities
+    index_checksum  checksum of the card_index.bin it was built from ("" for the legacy pair)
+
+The file carries its own card IDs, so serving it needs neither the embedding
+index nor CLIP: a lookup is one dict read plus a slice. The API reloads the
+file when a rebuilt one is renamed into place.
+
+Usage:
+    python similar_cards.py build [--k 20] [--block-size 512] [--output embedding_cache/similar_cards.npz]
+"""
+
+import argparse
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from image_similarity import CACHE_DIR, get_card_index
+
+SIMILAR_CARDS_FILE = os.path.join(CACHE_DIR, "similar_cards.npz")
+SIMILAR_CARDS_K = 20
+# Catalog rows scored per matrix product; memory is block size x catalog size float32
+SIMILAR_CARDS_BLOCK_SIZE = 512
+
+
+def compute_neighbours(embeddings: np.ndarray, k: int = SIMILAR_CARDS_K,
+                       block_size: int = SIMILAR_CARDS_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k neighbours of every row among the other rows.
+
+    Args:
+        embeddings: (N, D) unit-normalized vectors
+        k: Neighbours per row (capped at N - 1)
+        block_size: Rows scored per matrix product
+
+    Returns:
+        (neighbours, scores): (N, k) int32 row numbers and float16 similarities, best first
+    """
+    count = len(embeddings)
+    k = max(0, min(k, count - 1))
+    neighbours = np.empty((count, k), dtype=np.int32)
+    scores = np.empty((count, k), dtype=np.float16)
+    if k == 0:
+        return neighbours, scores
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    for start in range(0, count, block_size):
+        block = matrix[start:start + block_size]
+        rows = np.arange(start, start + len(block))
+        similarities = block @ matrix.T
+        # A card is not its own neighbour
+        similarities[np.arange(len(block)), rows] = -np.inf
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        neighbours[rows] = np.take_along_axis(top, order, axis=1)
+        scores[rows] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbours, scores
+
+
+class SimilarCardGraph:
+    """The precomputed neighbour table with a card ID -> row map."""
+
+    def __init__(self, card_ids: Sequence[str], neighbours: np.ndarray, scores: np.ndarray,
+                 index_checksum: str = "", version: str = ""):
+        self.card_ids = list(card_ids)
+        self.neighbours = neighbours
+        self.scores = scores
+        self.index_checksum = index_checksum
+        # Changes whenever the file is rebuilt; used in ETags
+        self.version = version
+        self._rows: Dict[str, int] = {}
+        for row, card_id in enumerate(self.card_ids):
+            self._rows.setdefault(card_id, row)
+
+    @classmethod
+    def load(cls, path: str = SIMILAR_CARDS_FILE, version: str = "") -> "SimilarCardGraph":
+        """Read a file written by build_similar_cards()."""
+        with np.load(path) as data:
+            card_ids = data["card_ids"].tolist()
+            neighbours, scores = data["neighbours"], data["scores"]
+            if neighbours.shape != scores.shape or len(neighbours) != len(card_ids):
+                raise ValueError("Similar cards file is inconsistent (row counts differ).")
+            return cls(card_ids, neighbours, scores, str(data["index_checksum"]), version)
+
+    def __len__(self):
+        return len(self.card_ids)
+
+    @property
+    def k(self) -> int:
+        return self.neighbours.shape[1]
+
+    def similar(self, card_id: str, limit: Optional[int] = None) -> Optional[List[Tuple[str, float]]]:
+        """(card_id, score) neighbours best first, or None if the card is not in the graph."""
+        row = self._rows.get(card_id)
+        if row is None:
+            return None
+        limit = self.k if limit is None else min(limit, self.k)
+        return [(self.card_ids[neighbour], float(score))
+                for neighbour, score in zip(self.neighbours[row, :limit], self.scores[row, :limit])]
+
+
+_graph = None
+_graph_signature = None
+_graph_lock = threading.Lock()
+
+
+def get_similar_card_graph(path: str = SIMILAR_CARDS_FILE) -> SimilarCardGraph:
+    """
+    Process-wide SimilarCardGraph, reloaded when the file on disk is replaced.
+    Raises FileNotFoundError until the graph has been built.
+    """
+    global _graph, _graph_signature
+    stat = os.stat(path)
+    signature = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if _graph is None or signature != _graph_signature:
+        with _graph_lock:
+            if _graph is None or signature != _graph_signature:
+                _graph = SimilarCardGraph.load(path, f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+                _graph_signature = signature
+    return _graph
+
+
+def build_similar_cards(output: str = SIMILAR_CARDS_FILE, k: int = SIMILAR_CARDS_K,
+                        block_size: int = SIMILAR_CARDS_BLOCK_SIZE) -> SimilarCardGraph:
+    """Compute the graph from the current embedding index and write it atomically."""
+    index = get_card_index()
+    neighbours, scores = compute_neighbours(index.embeddings, k, block_size)
+    index_checksum = index.header.get("checksum", "")
+
+    temp_path = f"{output}.tmp-{os.getpid()}"
+    try:
+        # Through a file object so np.savez does not append its own .npz suffix
+        with open(temp_path, "wb") as f:
+            np.savez(f, card_ids=np.array(index.card_ids), neighbours=neighbours, scores=scores,
+                     index_checksum=np.array(index_checksum))
+        os.replace(temp_path, output)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return SimilarCardGraph(index.card_ids, neighbours, scores, index_checksum)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Compute every card's nearest neighbours")
+    build.add_argument("--k", type=int, default=SIMILAR_CARDS_K, help="Neighbours kept per card")
+    build.add_argument("--block-size", type=int, default=SIMILAR_CARDS_BLOCK_SIZE, help="Rows per matrix product")
+    build.add_argument("--output", default=SIMILAR_CARDS_FILE, help="Output .npz file")
+
+    args = parser.parse_args()
+    graph = build_similar_cards(args.output, args.k, args.block_size)
+    print(f"Wrote {graph.k} neighbours for {len(graph)} cards to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
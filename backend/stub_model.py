@@ -0,0 +1,72 @@
+"""
+Offline stand-in for the CLIP model, for benchmarks and load tests.
+
+install_stub_model() fills the ImageEmbeddingModel singleton with a tiny
+deterministic model and processor, so the full scan pipeline runs without
+downloading weights and in a fraction of the real inference time. Embeddings
+are a fixed random projection of pooled pixels, so they still depend on the
+image content (useful for cache and ranking plumbing, not for accuracy).
+"""
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from image_similarity import CACHE_DIR, ImageEmbeddingModel
+
+EMBEDDING_DIM = 512
+# CLIP's own normalization constants, so stub inputs match real ones
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+
+class _BatchFeature(dict):
+    """Minimal BatchFeature: a dict of tensors with .to(device)."""
+
+    def to(self, device):
+        return _BatchFeature({key: value.to(device) for key, value in self.items()})
+
+
+class StubCLIPProcessor:
+    """Resize + normalize like CLIPProcessor, without tokenizer or downloads."""
+
+    def __call__(self, images=None, return_tensors="pt", padding=True, **kwargs):
+        if not isinstance(images, (list, tuple)):
+            images = [images]
+        arrays = []
+        for image in images:
+            image = image.convert("RGB")
+            if image.size != (224, 224):
+                image = image.resize((224, 224))
+            pixels = (np.asarray(image, dtype=np.float32) / 255.0 - CLIP_MEAN) / CLIP_STD
+            arrays.append(pixels.transpose(2, 0, 1))
+        return _BatchFeature({"pixel_values": torch.from_numpy(np.stack(arrays))})
+
+
+class StubCLIPModel(torch.nn.Module):
+    """Deterministic random projection of 16x16 pooled pixels to EMBEDDING_DIM."""
+
+    def __init__(self, dim=EMBEDDING_DIM, seed=0):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.projection = torch.randn(3 * 16 * 16, dim, generator=generator)
+
+    def get_image_features(self, pixel_values=None, **kwargs):
+        pooled = F.adaptive_avg_pool2d(pixel_values, 16).flatten(1)
+        return pooled @ self.projection
+
+
+def install_stub_model(cache_dir=CACHE_DIR):
+    """
+    Replace the ImageEmbeddingModel singleton with the stub model.
+
+    Args:
+        cache_dir: Directory holding embeddings.npy and friends (default: embedding_cache)
+
+    Returns:
+        ImageEmbeddingModel: The installed singleton.
+    """
+    clip = ImageEmbeddingModel.from_model(StubCLIPModel(), StubCLIPProcessor(), "stub", torch.device("cpu"),
+                                          cache_dir)
+    ImageEmbeddingModel._instance = clip
+    return clip
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_clients_are_admitted_round_robin():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=8, max_queued_per_client=4, max_wait_seconds=5)
+        order = []
+
+        async def scan(client, number):
+            async with controller.slot(client):
+                order.append(f"{client}{number}")
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(scan("a", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(scan("b", i)) for i in range(2)]
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["a0", "a1", "b0", "a2", "b1"]
+
+
+def test_client_queue_limit_rejects_with_retry_after():
+    async def main():
+        controller = AdmissionController(max_concurrency=1, max_queue=8, max_queued_per_client=1, max_wait_seconds=5)
+        release = asyncio.Event()
+
+        async def scan():
+            async with controller.slot("a"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(scan()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await scan()
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert rejected.retry_after >= 1
+
+
+def test_background_work_keeps_a_slot_free_and_never_jumps_the_queue():
+    async def main():
+        controller = AdmissionController(max_concurrency=2, max_queue=8, max_queued_per_client=4,
+                                         max_wait_seconds=5, background_reserve=1)
+        assert controller.try_acquire_background()
+        # The reserved slot is left for interactive scans
+        assert not controller.try_acquire_background()
+        admitted = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def scan(client):
+            async with controller.slot(client):
+                admitted.set()
+                await finish.wait()
+
+        first = asyncio.create_task(scan("a"))
+        await admitted.wait()
+        admitted.clear()
+        second = asyncio.create_task(scan("b"))
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        # A waiting scan blocks background work even once a slot frees up
+        controller.release_background()
+        await admitted.wait()
+        assert not controller.try_acquire_background()
+        finish.set()
+        await asyncio.gather(first, second)
+        return controller.try_acquire_background()
+
+    assert asyncio.run(main())
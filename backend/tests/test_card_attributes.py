@@ -0,0 +1,64 @@
+import json
+import sqlite3
+
+import pytest
+
+from card_attributes import CardAttributeIndex
+
+# Index rows are in this order; "gone-1" has no pokemon_cards row
+CARD_IDS = ["base1-4", "base1-58", "base1-88", "sv1-1", "sv1-2", "gone-1"]
+CARDS = [
+    ("base1-4", "base1", "Pokémon", ["Fire"], None),
+    ("base1-58", "base1", "Pokémon", ["Lightning"], None),
+    ("base1-88", "base1", "Trainer", None, None),
+    ("sv1-1", "sv1", "Pokémon", ["Grass", "Darkness"], "G"),
+    ("sv1-2", "sv1", "Pokémon", ["Fire"], "G"),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "pokemon_cards.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pokemon_cards (id TEXT PRIMARY KEY, set_id TEXT, supertype TEXT, types TEXT,
+                                    regulationMark TEXT)
+    """)
+    conn.executemany("INSERT INTO pokemon_cards VALUES (?, ?, ?, ?, ?)",
+                     [(card_id, set_id, supertype, json.dumps(types) if types else None, mark)
+                      for card_id, set_id, supertype, types, mark in CARDS])
+    conn.commit()
+    conn.close()
+    return CardAttributeIndex.from_database(CARD_IDS, path)
+
+
+def matching(index, **filters):
+    rows = index.filter_rows(filters)
+    return None if rows is None else [CARD_IDS[row] for row in rows]
+
+
+def test_values_within_a_field_are_ored(index):
+    assert matching(index, set_id=["base1", "SV1"]) == CARD_IDS[:5]
+    assert matching(index, types=["fire", "grass"]) == ["base1-4", "sv1-1", "sv1-2"]
+
+
+def test_fields_are_anded(index):
+    assert matching(index, set_id=["sv1"], types=["Fire"]) == ["sv1-2"]
+    assert matching(index, set_id=["base1"], supertype=["pokémon"], types=["Fire", "Lightning"]) == [
+        "base1-4", "base1-58"]
+    assert matching(index, regulation_mark=["G"], types=["Darkness"]) == ["sv1-1"]
+
+
+def test_unknown_value_matches_nothing(index):
+    assert matching(index, set_id=["base1"], types=["Water"]) == []
+
+
+def test_empty_filters_are_inactive(index):
+    assert matching(index) is None
+    assert matching(index, set_id=[], types=None) is None
+    assert matching(index, set_id=[""], types=["Fire"]) == ["base1-4", "sv1-2"]
+
+
+def test_unknown_field_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.filter_mask({"rarity": ["Rare"]})
@@ -0,0 +1,72 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from card_detection import DETECT_CROP_SIZE, detect_card_quads, detect_cards, single_card_crop
+
+BACKGROUND = (30, 30, 30)
+CARD_SIZE = (252, 352)
+
+
+def draw_card(draw, x, y, fill=(230, 200, 60), outline=None):
+    """A card-shaped block with an art box, like a catalog card's layout."""
+    width, height = CARD_SIZE
+    draw.rectangle((x, y, x + width - 1, y + height - 1), fill=fill, outline=outline, width=3)
+    draw.rectangle((x + 20, y + 40, x + width - 21, y + 190), fill=(90, 140, 200))
+
+
+def centres(quads):
+    return [tuple(np.round(quad.mean(axis=0))) for quad in quads]
+
+
+def test_tilted_card_corners_are_found():
+    image = Image.new("RGB", (900, 900), BACKGROUND)
+    corners = [(300, 150), (540, 190), (480, 530), (240, 490)]
+    ImageDraw.Draw(image).polygon(corners, fill=(230, 200, 60))
+
+    quads = detect_card_quads(image)
+    assert len(quads) == 1
+    # Clockwise from top-left, within a few pixels of the drawn corners
+    assert np.abs(quads[0] - np.array(corners)).max() < 8
+    assert single_card_crop(image).size == DETECT_CROP_SIZE
+
+
+def test_separate_cards_are_returned_in_reading_order():
+    image = Image.new("RGB", (1000, 700), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw_card(draw, 600, 170)
+    draw_card(draw, 100, 150)
+
+    detections = detect_cards(image)
+    assert len(detections) == 2
+    assert np.allclose(centres([quad for quad, _ in detections]), [(225, 325), (725, 345)], atol=8)
+    assert all(crop.size == DETECT_CROP_SIZE for _, crop in detections)
+    # Art boxes are part of their card, and two cards are not a single card
+    assert single_card_crop(image) is None
+
+
+def test_touching_binder_cards_are_split_into_a_grid():
+    image = Image.new("RGB", (900, 1000), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    fills = [(230, 200, 60), (200, 80, 70), (90, 170, 90), (170, 120, 200)]
+    for cell, fill in enumerate(fills):
+        row, col = divmod(cell, 2)
+        draw_card(draw, 150 + col * CARD_SIZE[0], 120 + row * CARD_SIZE[1], fill, outline=(250, 250, 250))
+
+    expected = [(276, 296), (528, 296), (276, 648), (528, 648)]
+    found = centres(detect_card_quads(image))
+    assert len(found) == 4
+    assert np.allclose(found, expected, atol=8)
+
+
+def test_max_cards_limits_detections():
+    image = Image.new("RGB", (1000, 700), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw_card(draw, 100, 150)
+    draw_card(draw, 600, 170)
+    assert len(detect_cards(image, max_cards=1)) == 1
+
+
+def test_blank_photo_has_no_cards():
+    image = Image.new("RGB", (500, 500), BACKGROUND)
+    assert detect_card_quads(image) == []
+    assert single_card_crop(image) is None
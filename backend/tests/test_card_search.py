@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+import pytest
+
+import card_search
+from card_search import (FTS_TABLE, add_card_to_search_index, ensure_search_index, remove_card_from_search_index,
+                         search_cards)
+
+CARDS = [
+    ("base1-58", "Pikachu", "58", "Base", "Mitsuhiro Arita", [{"name": "Thunder Jolt"}], []),
+    ("base1-4", "Charizard", "4", "Base", "Mitsuhiro Arita", [{"name": "Fire Spin"}], [{"name": "Energy Burn"}]),
+    ("xy1-10", "Chespin", "10", "XY", "Kagemaru Himeno", [{"name": "Vine Whip"}], []),
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "pokemon_cards.db")
+    monkeypatch.setattr(card_search, "DB_PATH", path)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pokemon_cards (
+            id TEXT PRIMARY KEY, name TEXT NOT NULL, number TEXT, set_name TEXT, image_small TEXT,
+            artist TEXT, attacks TEXT, abilities TEXT
+        )
+    """)
+    for card_id, name, number, set_name, artist, attacks, abilities in CARDS:
+        conn.execute("INSERT INTO pokemon_cards VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (card_id, name, number, set_name, f"https://images.example/{card_id}.png", artist,
+                      json.dumps(attacks), json.dumps(abilities)))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def renumber_rowids(conn):
+    """What a VACUUM may do to a table with a TEXT primary key."""
+    conn.execute("UPDATE pokemon_cards SET rowid = rowid + 1000")
+    conn.commit()
+
+
+def fts_card_ids(conn):
+    return sorted(row[0] for row in conn.execute(f"SELECT card_id FROM {FTS_TABLE}"))
+
+
+def test_search_finds_cards_by_prefix_and_attack(db):
+    ensure_search_index()
+    assert [card["id"] for card in search_cards("chari")] == ["base1-4"]
+    assert [card["id"] for card in search_cards("thunder")] == ["base1-58"]
+
+
+def test_results_follow_card_ids_after_rowids_are_renumbered(db):
+    ensure_search_index()
+    renumber_rowids(db)
+    assert [card["id"] for card in search_cards("pikachu")] == ["base1-58"]
+
+
+def test_startup_rebuilds_when_counts_differ(db):
+    ensure_search_index()
+    db.execute("INSERT INTO pokemon_cards (id, name, set_name) VALUES ('sv1-1', 'Sprigatito', 'Scarlet')")
+    db.commit()
+    ensure_search_index()
+    assert [card["id"] for card in search_cards("sprig")] == ["sv1-1"]
+
+
+def test_startup_rebuilds_when_an_entry_names_a_removed_card(db):
+    ensure_search_index()
+    db.execute("UPDATE pokemon_cards SET id = 'base1-4a' WHERE id = 'base1-4'")
+    db.commit()
+    assert not card_search.search_index_in_sync(db.cursor())
+    ensure_search_index()
+    assert fts_card_ids(db) == ["base1-4a", "base1-58", "xy1-10"]
+
+
+def test_remove_and_readd_after_rowids_are_renumbered(db):
+    ensure_search_index()
+    renumber_rowids(db)
+    cursor = db.cursor()
+    remove_card_from_search_index(cursor, "base1-4")
+    add_card_to_search_index(cursor, "base1-4")
+    db.commit()
+    assert fts_card_ids(db) == ["base1-4", "base1-58", "xy1-10"]
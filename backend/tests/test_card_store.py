@@ -0,0 +1,28 @@
+import sqlite3
+
+import pytest
+
+from card_store import get_card_updated_at
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # card_store opens pokemon_cards.db relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect("pokemon_cards.db")
+    yield conn
+    conn.close()
+
+
+def test_updated_at_distinguishes_missing_cards(db):
+    db.execute("CREATE TABLE pokemon_cards (id TEXT PRIMARY KEY, updated_at TEXT)")
+    db.execute("INSERT INTO pokemon_cards VALUES ('base1-4', '2024-05-01 10:00:00'), ('base1-58', NULL)")
+    db.commit()
+    assert get_card_updated_at("base1-4") == "2024-05-01 10:00:00"
+    assert get_card_updated_at("base1-58") == ""
+    assert get_card_updated_at("xy1-1") is None
+
+
+def test_database_error_is_not_reported_as_a_missing_card(db):
+    with pytest.raises(sqlite3.Error):
+        get_card_updated_at("base1-4")
@@ -0,0 +1,46 @@
+from fuzzy_card_index import FuzzyCardIndex, parse_card_numbers, rerank_with_ocr
+
+CARDS = [
+    ("base1-4", "Charizard", "4", 102),
+    ("base2-4", "Charizard", "4", 64),
+    ("base1-10", "Mewtwo", "10", 102),
+    ("base1-58", "Pikachu", "58", 102),
+    ("sv3pt5-151", "Mew", "151", 165),
+    ("base1-60", "Flabébé", "060", 102),
+]
+
+
+def card_ids(matches):
+    return [card_id for card_id, _ in matches]
+
+
+def test_garbled_name_is_recalled_from_trigrams():
+    index = FuzzyCardIndex(CARDS)
+    assert card_ids(index.match("Pikachv  HP 40  Thunder Jolt")) == ["base1-58"]
+    assert set(card_ids(index.match("Charizord Fire Spin"))) == {"base1-4", "base2-4"}
+    assert card_ids(index.match("flabebe")) == ["base1-60"]
+
+
+def test_longer_contained_name_ranks_first():
+    assert card_ids(FuzzyCardIndex(CARDS).match("Mewtwo Psychic"))[0] == "base1-10"
+
+
+def test_number_and_total_pick_the_printing():
+    index = FuzzyCardIndex(CARDS)
+    assert card_ids(index.match("Charizard 4/102"))[0] == "base1-4"
+    assert card_ids(index.match("Charizard 4/64"))[0] == "base2-4"
+    # The number and set size identify the card even when the name is unreadable
+    assert card_ids(index.match("~~ 58/102 ~~")) == ["base1-58"]
+    # Leading zeros and OCR letter confusions in the number are normalized
+    assert card_ids(index.match("Flabebe O6O/1O2"))[0] == "base1-60"
+
+
+def test_parse_card_numbers():
+    assert parse_card_numbers("Charizard 4 / 102 and TG05/TG30") == [("4", 102), ("TG5", None)]
+
+
+def test_rerank_moves_only_confident_ocr_matches_forward():
+    embedding_order = ["base2-4", "base1-4", "base1-58"]
+    assert rerank_with_ocr(embedding_order, [("base1-4", 1.5), ("base1-58", 0.9)]) == [
+        "base1-4", "base2-4", "base1-58"]
+    assert rerank_with_ocr(embedding_order, [("base1-58", 0.9)]) == embedding_order
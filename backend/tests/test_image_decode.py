@@ -0,0 +1,72 @@
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import image_decode
+from image_decode import UploadSizeLimitMiddleware, open_validated
+
+
+def make_client(limit):
+    app = FastAPI()
+    calls = []
+
+    @app.post("/upload")
+    async def upload(image: UploadFile):
+        calls.append(image.filename)
+        return {"size": len(await image.read())}
+
+    @app.post("/other")
+    async def other(image: UploadFile):
+        return {"size": len(await image.read())}
+
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/upload": limit})
+    return TestClient(app), calls
+
+
+def test_small_upload_passes():
+    client, calls = make_client(10_000)
+    response = client.post("/upload", files={"image": ("a.jpg", b"x" * 100, "image/jpeg")})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+    assert calls == ["a.jpg"]
+
+
+def test_declared_length_over_limit_is_refused_before_the_endpoint():
+    client, calls = make_client(10_000)
+    response = client.post("/upload", files={"image": ("a.jpg", b"x" * 20_000, "image/jpeg")})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_chunked_body_over_limit_is_refused():
+    client, calls = make_client(10_000)
+
+    def chunks():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.jpg\"\r\n\r\n"
+        for _ in range(10):
+            yield b"x" * 4096
+        yield b"\r\n--b--\r\n"
+
+    response = client.post("/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_unlisted_routes_are_not_limited():
+    client, _ = make_client(10_000)
+    response = client.post("/other", files={"image": ("a.jpg", b"x" * 20_000, "image/jpeg")})
+    assert response.status_code == 200
+
+
+def test_pixel_limit_is_local_to_open_validated(monkeypatch):
+    buffer = BytesIO()
+    Image.new("RGB", (100, 100)).save(buffer, format="PNG")
+    monkeypatch.setattr(image_decode, "MAX_IMAGE_PIXELS", 5_000)
+
+    with pytest.raises(HTTPException) as excinfo:
+        open_validated(buffer.getvalue())
+    assert excinfo.value.status_code == 413
+    assert Image.MAX_IMAGE_PIXELS != image_decode.MAX_IMAGE_PIXELS
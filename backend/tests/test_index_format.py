@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from index_format import IndexFormatError, read_index, side_file_matches, write_index, write_side_stamp
+
+
+def build_index(path, count=3, dim=4, seed=0):
+    embeddings = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return write_index(str(path), embeddings, [f"card-{i}" for i in range(count)], model="test")
+
+
+def test_round_trip(tmp_path):
+    header = build_index(tmp_path / "card_index.bin")
+    read_header, embeddings, source_rows, card_ids = read_index(str(tmp_path / "card_index.bin"))
+    assert read_header == header
+    assert embeddings.shape == (3, 4)
+    assert source_rows.tolist() == [0, 1, 2]
+    assert card_ids == ["card-0", "card-1", "card-2"]
+
+
+def test_corrupt_index_is_refused(tmp_path):
+    path = tmp_path / "card_index.bin"
+    build_index(path)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(IndexFormatError):
+        read_index(str(path))
+
+
+def test_side_file_stamp_ties_it_to_one_index(tmp_path):
+    side_file = tmp_path / "phash_index.npy"
+    np.save(side_file, np.zeros((3, 4), dtype=np.uint64))
+    first = build_index(tmp_path / "first.bin", seed=0)["checksum"]
+    second = build_index(tmp_path / "second.bin", seed=1)["checksum"]
+
+    assert not side_file_matches(str(side_file), first)
+    write_side_stamp(str(side_file), first)
+    assert side_file_matches(str(side_file), first)
+    assert not side_file_matches(str(side_file), second)
+
+    # Rebuilding the side file without restamping invalidates the stamp
+    np.save(side_file, np.zeros((5, 4), dtype=np.uint64))
+    assert not side_file_matches(str(side_file), first)
@@ -0,0 +1,143 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from admission import AdmissionRejected
+from live_scan import LiveScanSession
+
+
+class FakeWebSocket:
+    """Feeds queued messages to the session and records what it sends."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send_json(self, payload):
+        self.sent.append(payload)
+
+    def send_frame(self, frame):
+        self.incoming.put_nowait({"type": "websocket.receive", "bytes": frame})
+
+    def send_text(self, text):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": text})
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+
+
+def encode_frame(seed):
+    pixels = np.random.default_rng(seed).integers(0, 255, (64, 48, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).resize((240, 320)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run_session(script, identify):
+    async def describe(card_id):
+        return {"id": card_id}
+
+    async def main():
+        websocket = FakeWebSocket()
+        session = LiveScanSession(websocket, identify, describe)
+        task = asyncio.create_task(session.run())
+        await script(websocket, session)
+        websocket.disconnect()
+        await asyncio.wait_for(task, 2.0)
+        return websocket, session
+
+    return asyncio.run(main())
+
+
+def test_rejected_frame_sends_busy_and_retries_same_view():
+    calls = []
+
+    async def identify(img):
+        calls.append(img)
+        if len(calls) == 1:
+            raise AdmissionRejected(503, "queue_full", 3)
+        return [("base1-4", 0.95), ("base1-5", 0.5)]
+
+    frame = encode_frame(0)
+
+    async def script(websocket, session):
+        websocket.send_frame(frame)
+        await until(lambda: len(websocket.sent) == 1)
+        websocket.send_frame(frame)
+        await until(lambda: len(websocket.sent) == 2)
+
+    websocket, session = run_session(script, identify)
+    assert websocket.sent[0] == {"type": "busy", "retryAfter": 3, "frame": 1}
+    assert websocket.sent[1]["type"] == "match"
+    assert session.stats["rejected"] == 1
+
+
+def test_non_object_control_message_is_ignored():
+    async def identify(img):
+        return [("base1-4", 0.95), ("base1-5", 0.5)]
+
+    async def script(websocket, session):
+        websocket.send_text("[1, 2]")
+        websocket.send_text('"reset"')
+        websocket.send_frame(encode_frame(0))
+        await until(lambda: len(websocket.sent) == 1)
+
+    websocket, _ = run_session(script, identify)
+    assert websocket.sent[0]["type"] == "match"
+
+
+def test_still_uncertain_view_is_retried_after_timeout(monkeypatch):
+    monkeypatch.setattr("live_scan.LIVE_SCAN_RETRY_SECONDS", 0.2)
+    calls = []
+
+    async def identify(img):
+        calls.append(img)
+        return [("base1-4", 0.5), ("base1-5", 0.4)]
+
+    frame = encode_frame(0)
+
+    async def script(websocket, session):
+        websocket.send_frame(frame)
+        await until(lambda: len(websocket.sent) == 1)
+        # Within the retry interval the same view is a skipped duplicate
+        websocket.send_frame(frame)
+        await until(lambda: session.stats["skipped"] == 1)
+        await asyncio.sleep(0.25)
+        websocket.send_frame(frame)
+        await until(lambda: len(websocket.sent) == 2)
+
+    websocket, session = run_session(script, identify)
+    assert [message["type"] for message in websocket.sent] == ["searching", "searching"]
+    assert len(calls) == 2
+
+
+def test_still_confident_view_is_not_retried(monkeypatch):
+    monkeypatch.setattr("live_scan.LIVE_SCAN_RETRY_SECONDS", 0.0)
+    calls = []
+
+    async def identify(img):
+        calls.append(img)
+        return [("base1-4", 0.95), ("base1-5", 0.5)]
+
+    frame = encode_frame(0)
+
+    async def script(websocket, session):
+        websocket.send_frame(frame)
+        await until(lambda: len(websocket.sent) == 1)
+        websocket.send_frame(frame)
+        await until(lambda: session.stats["skipped"] == 1)
+
+    _, session = run_session(script, identify)
+    assert len(calls) == 1
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ocr import AsyncOCRClient, OCRError
+
+
+def ocr_body(text):
+    return {"IsErroredOnProcessing": False, "ParsedResults": [{"ParsedText": text}]}
+
+
+def run_with(responses, image=b"image-bytes", calls=1, max_retries=2):
+    """Run ocr_bytes `calls` times against a MockTransport answering from `responses` in order."""
+    requests = []
+    responses = iter(responses)
+
+    def handler(request):
+        requests.append(request)
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def main():
+        client = AsyncOCRClient(api_key="key", endpoint="https://ocr.test/parse", max_retries=max_retries,
+                                transport=httpx.MockTransport(handler))
+        try:
+            return [await client.ocr_bytes(image) for _ in range(calls)], client
+        finally:
+            await client.aclose()
+
+    texts, client = asyncio.run(main())
+    return texts, client, requests
+
+
+def test_timeout_is_retried():
+    texts, _, requests = run_with([httpx.ReadTimeout("slow"), httpx.Response(200, json=ocr_body("Pikachu"))])
+    assert texts == ["Pikachu"]
+    assert len(requests) == 2
+
+
+def test_retryable_status_is_retried():
+    texts, _, requests = run_with([httpx.Response(503), httpx.Response(429), httpx.Response(200, json=ocr_body("Eevee"))])
+    assert texts == ["Eevee"]
+    assert len(requests) == 3
+
+
+def test_gives_up_after_max_retries():
+    with pytest.raises(OCRError):
+        run_with([httpx.ConnectTimeout("down")] * 2, max_retries=1)
+
+
+def test_client_error_is_not_retried():
+    with pytest.raises(OCRError):
+        run_with([httpx.Response(400), httpx.Response(200, json=ocr_body("unused"))])
+
+
+def test_repeated_image_is_served_from_cache():
+    texts, client, requests = run_with([httpx.Response(200, json=ocr_body("Mew"))], calls=2)
+    assert texts == ["Mew", "Mew"]
+    assert len(requests) == 1
+    assert (client.cache_hits, client.cache_misses) == (1, 1)
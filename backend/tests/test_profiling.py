@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+import profiling
+from profiling import ProfilingMiddleware, StackSampler
+
+TOKEN = "secret-token"
+
+
+@pytest.fixture(autouse=True)
+def profiling_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", TOKEN)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def request(headers=(), query_string=b""):
+    """Run one GET /v1/api/health through the middleware; returns the response headers."""
+    scope = {"type": "http", "method": "GET", "path": "/v1/api/health", "headers": list(headers),
+             "query_string": query_string}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(ProfilingMiddleware(app)(scope, receive, send))
+    return dict(messages[0]["headers"])
+
+
+def test_header_token_profiles_the_request(tmp_path):
+    headers = request([(b"x-profile", TOKEN.encode())])
+    assert (tmp_path / headers[b"x-profile-file"].decode()).exists()
+
+
+def test_query_string_token_is_ignored(tmp_path):
+    headers = request(query_string=f"profile={TOKEN}".encode())
+    assert b"x-profile-file" not in headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_wrong_token_is_ignored():
+    assert b"x-profile-file" not in request([(b"x-profile", b"guess")])
+
+
+def test_sampler_is_stopped_off_the_event_loop(monkeypatch):
+    stopped_on = []
+    original_stop = StackSampler.stop
+
+    def stop(self):
+        stopped_on.append(threading.current_thread())
+        original_stop(self)
+
+    monkeypatch.setattr(StackSampler, "stop", stop)
+    request([(b"x-profile", TOKEN.encode())])
+    assert stopped_on and stopped_on[0] is not threading.main_thread()
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+
+import image_similarity
+from image_similarity import REGION_BOXES, CardEmbeddingIndex, ImageEmbeddingModel, embedding_image_search
+
+DIM = 4
+# Query regions match card A exactly and card B not at all
+QUERY_REGIONS = np.tile(np.eye(DIM, dtype=np.float32)[0], (len(REGION_BOXES), 1))
+
+
+@pytest.fixture
+def region_calls(tmp_path, monkeypatch):
+    """Three cards with one-hot global embeddings and region embeddings; returns the region CLIP calls."""
+    index = CardEmbeddingIndex(np.eye(DIM, dtype=np.float32)[:3], ["A", "B", "C"], np.arange(3))
+    regions = np.zeros((3, len(REGION_BOXES), DIM), dtype=np.float16)
+    regions[0, :, 0] = 1
+    regions[1, :, 1] = 1
+    regions[2, :, 2] = 1
+    np.save(tmp_path / "region_embeddings.npy", regions)
+    monkeypatch.setattr(ImageEmbeddingModel, "_instance",
+                        ImageEmbeddingModel.from_model(None, None, "test", "cpu", str(tmp_path)))
+    monkeypatch.setattr(image_similarity, "get_card_index", lambda: index)
+
+    calls = []
+
+    def region_embeddings(images):
+        calls.append(images)
+        return [QUERY_REGIONS for _ in images]
+
+    monkeypatch.setattr(image_similarity, "get_region_embeddings_batch", region_embeddings)
+    return calls
+
+
+def search(query, **kwargs):
+    return [card_id for card_id, _ in
+            embedding_image_search(Image.new("RGB", (63, 88)), top_k=3, query_embedding=np.array(query), **kwargs)]
+
+
+def test_rerank_resolves_a_near_tie(region_calls):
+    card = Image.new("RGB", (440, 616))
+    # B leads A by 0.01 globally, but A's regions match
+    assert search([0.89, 0.90, 0.1, 0.0]) == ["B", "A", "C"]
+    assert not region_calls
+    assert search([0.89, 0.90, 0.1, 0.0], card_image=card) == ["A", "B", "C"]
+    assert region_calls == [[card]]
+
+
+def test_clear_leader_is_not_reranked(region_calls):
+    detections = []
+
+    def detect():
+        detections.append(1)
+        return Image.new("RGB", (440, 616))
+
+    assert search([0.5, 0.9, 0.1, 0.0], card_image=detect) == ["B", "A", "C"]
+    assert not detections and not region_calls
+
+
+def test_photo_without_a_single_card_is_not_reranked(region_calls):
+    assert search([0.89, 0.90, 0.1, 0.0], card_image=lambda: None) == ["B", "A", "C"]
+    assert not region_calls
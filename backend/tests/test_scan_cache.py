@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from perceptual_hash import dhash64
+from scan_cache import SCAN_CACHE_MAX_DISTANCE, PerceptualHashCache
+
+CATALOG_SIZE = 1500
+
+
+def synthetic_card(rng):
+    """A card-shaped image: the shared yellow frame and text box, with its own artwork."""
+    card = Image.new("RGB", (252, 352), (232, 200, 60))
+    artwork = Image.fromarray((rng.random((6, 8, 3)) * 255).astype(np.uint8))
+    card.paste(artwork.resize((212, 150), Image.Resampling.BICUBIC), (20, 40))
+    card.paste(Image.new("RGB", (212, 120), (235, 230, 215)), (20, 205))
+    return card
+
+
+@pytest.fixture(scope="module")
+def catalog_hashes():
+    rng = np.random.default_rng(0)
+    return np.array([dhash64(synthetic_card(rng)) for _ in range(CATALOG_SIZE)], dtype=np.uint64)
+
+
+def cross_card_pairs(hashes, max_distance):
+    distances = np.bitwise_count(hashes[:, None] ^ hashes[None, :])
+    return int(np.count_nonzero(np.triu(distances <= max_distance, k=1)))
+
+
+def test_default_radius_does_not_join_distinct_catalog_cards(catalog_hashes):
+    # Cards share their layout, so a loose radius does join different cards
+    assert cross_card_pairs(catalog_hashes, 6) > 0
+    assert cross_card_pairs(catalog_hashes, SCAN_CACHE_MAX_DISTANCE) == 0
+
+
+def test_catalog_card_is_never_answered_with_another_cards_result(catalog_hashes):
+    cache = PerceptualHashCache(capacity=CATALOG_SIZE, ttl_seconds=60)
+    for number, image_hash in enumerate(catalog_hashes):
+        cache.put(int(image_hash), [f"card-{number}"])
+    for number, image_hash in enumerate(catalog_hashes):
+        assert cache.get(int(image_hash)) == [f"card-{number}"]
+
+
+def test_near_duplicate_frame_hits_within_radius():
+    cache = PerceptualHashCache(capacity=4, ttl_seconds=60, max_distance=2)
+    cache.put(0b1111, ["a"])
+    assert cache.get(0b1101) == ["a"]
+    assert cache.get(0b0001) is None
+
+
+def test_ambiguous_result_only_answers_its_exact_hash():
+    cache = PerceptualHashCache(capacity=4, ttl_seconds=60, max_distance=2)
+    cache.put(0b1111, ["a"], near_matches=False)
+    assert cache.get(0b1111) == ["a"]
+    assert cache.get(0b1101) is None
+
+
+def test_scopes_are_kept_apart():
+    cache = PerceptualHashCache(capacity=4, ttl_seconds=60, max_distance=2)
+    cache.put(0b1111, ["a"], scope="set_id=base1")
+    assert cache.get(0b1111) is None
+    assert cache.get(0b1111, scope="set_id=base1") == ["a"]
@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+
+import scan_jobs
+from scan_jobs import create_job, ensure_scan_job_tables, new_job_id, process_next_batch, spool_image
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    """A two-image job; returns a function reading (status, card_id, error) per image."""
+    monkeypatch.setattr(scan_jobs, "DB_PATH", str(tmp_path / "pokemon_cards.db"))
+    monkeypatch.setattr(scan_jobs, "SCAN_JOB_SPOOL_DIR", str(tmp_path / "spool"))
+    ensure_scan_job_tables()
+    job_id = new_job_id()
+    create_job(job_id, "alice", [(f"{index}.jpg", spool_image(job_id, index, b"image")) for index in range(2)])
+
+    def items():
+        conn = sqlite3.connect(scan_jobs.DB_PATH)
+        try:
+            return conn.execute(
+                "SELECT status, card_id, error FROM scan_job_items WHERE job_id = ? ORDER BY item_index",
+                (job_id,)).fetchall()
+        finally:
+            conn.close()
+    return items
+
+
+def test_failing_image_does_not_fail_the_rest_of_its_batch(job, monkeypatch):
+    def scan_batch(rows):
+        if any(item_index == 1 for _, item_index, _, _ in rows):
+            raise RuntimeError("corrupt tensor")
+        return [("done", "base1-4", 0.9, 0.1, 1, '["base1-4"]', None, job_id, item_index)
+                for job_id, item_index, _, _ in rows]
+
+    monkeypatch.setattr(scan_jobs, "_scan_batch", scan_batch)
+    assert process_next_batch() == 2
+    assert job() == [("done", "base1-4", None), ("failed", None, "Scan failed: corrupt tensor")]
+
+
+def test_claims_are_released_when_the_worker_raises(job, monkeypatch):
+    def scan_rows(rows):
+        raise MemoryError()
+
+    monkeypatch.setattr(scan_jobs, "_scan_rows", scan_rows)
+    with pytest.raises(MemoryError):
+        process_next_batch()
+    assert job() == [("pending", None, None), ("pending", None, None)]
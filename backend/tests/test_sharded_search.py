@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+
+import sharded_search
+from image_similarity import ImageEmbeddingModel
+from index_format import write_index, write_side_stamp
+from sharded_search import (LocalShard, RemoteShard, ShardCoordinator, ShardSearcher, build_shards,
+                            create_shard_app, sharded_image_search)
+
+COUNT = 12
+DIM = 4
+
+
+@pytest.fixture
+def shards(tmp_path):
+    """Two hash shards cut from a packed index; returns (embeddings, index checksum, shard dirs)."""
+    embeddings = np.random.default_rng(0).normal(size=(COUNT, DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    card_ids = [f"card-{i}" for i in range(COUNT)]
+    np.save(tmp_path / "embeddings.npy", embeddings)
+    (tmp_path / "image_metadata.json").write_text(json.dumps([{"card_id": card_id} for card_id in card_ids]))
+    header = write_index(str(tmp_path / "card_index.bin"), embeddings, card_ids, model="test")
+    manifest = build_shards(str(tmp_path / "embeddings.npy"), str(tmp_path / "image_metadata.json"),
+                            str(tmp_path / "shards"), "hash", 2, str(tmp_path / "card_index.bin"))
+    assert manifest["index_checksum"] == header["checksum"]
+    return embeddings, header["checksum"], [str(tmp_path / "shards" / shard["path"]) for shard in manifest["shards"]]
+
+
+class SlowShard:
+    name = "slow"
+
+    async def search(self, query_embedding, top_k, filters):
+        await asyncio.sleep(5)
+
+    async def aclose(self):
+        pass
+
+
+class FailingShard(SlowShard):
+    name = "failing"
+
+    async def search(self, query_embedding, top_k, filters):
+        raise RuntimeError("shard down")
+
+
+def search(coordinator, query, top_k=COUNT):
+    async def run():
+        try:
+            return await coordinator.search(query, top_k)
+        finally:
+            await coordinator.aclose()
+    return asyncio.run(run())
+
+
+def test_each_shard_records_the_index_checksum(shards):
+    _, checksum, shard_dirs = shards
+    assert [ShardSearcher(shard_dir).index_checksum for shard_dir in shard_dirs] == [checksum, checksum]
+
+
+def test_local_and_remote_shards_merge_best_first(shards):
+    embeddings, checksum, (local_dir, remote_dir) = shards
+    remote = RemoteShard("http://shard", transport=httpx.ASGITransport(app=create_shard_app(remote_dir)))
+    result = search(ShardCoordinator([LocalShard(local_dir), remote], deadline_seconds=5), embeddings[3])
+
+    expected = np.argsort(-(embeddings @ embeddings[3]))
+    assert [row for _, _, row in result["matches"]] == expected.tolist()
+    assert [card_id for card_id, _, _ in result["matches"]] == [f"card-{row}" for row in expected]
+    assert result["failed_shards"] == [] and not result["partial"]
+    assert result["index_checksum"] == checksum
+
+
+def test_slow_shard_is_dropped_at_the_deadline(shards):
+    embeddings, _, (local_dir, _) = shards
+    local = LocalShard(local_dir)
+    result = search(ShardCoordinator([local, SlowShard()], deadline_seconds=0.2), embeddings[0])
+
+    assert result["partial"] and result["failed_shards"] == ["slow"]
+    assert [row for _, _, row in result["matches"]] == local.searcher.global_rows[
+        np.argsort(-(local.searcher.index.embeddings @ embeddings[0]))].tolist()
+
+
+def test_failing_shard_is_reported_and_the_rest_merged(shards):
+    embeddings, checksum, (local_dir, _) = shards
+    result = search(ShardCoordinator([FailingShard(), LocalShard(local_dir)], deadline_seconds=5), embeddings[0])
+
+    assert result["partial"] and result["failed_shards"] == ["failing"]
+    assert result["matches"] and result["index_checksum"] == checksum
+
+
+def test_shards_from_different_indexes_have_no_checksum(shards):
+    embeddings, _, (local_dir, other_dir) = shards
+    other = LocalShard(other_dir)
+    other.searcher.index_checksum = "0" * 64
+    result = search(ShardCoordinator([LocalShard(local_dir), other], deadline_seconds=5), embeddings[0])
+    assert result["index_checksum"] is None
+
+
+@pytest.mark.parametrize("stamped_for_shards", [True, False])
+def test_rerank_requires_regions_stamped_for_the_shards_index(shards, tmp_path, monkeypatch, stamped_for_shards):
+    embeddings, checksum, shard_dirs = shards
+    clip = ImageEmbeddingModel.from_model(None, None, "test", "cpu", str(tmp_path))
+    monkeypatch.setattr(ImageEmbeddingModel, "_instance", clip)
+    np.save(clip.region_embedding_file, np.zeros((COUNT, 3, DIM), dtype=np.float16))
+    write_side_stamp(clip.region_embedding_file, checksum if stamped_for_shards else "0" * 64)
+    reranked = []
+    monkeypatch.setattr(sharded_search, "needs_region_rerank", lambda scores: True)
+    monkeypatch.setattr(sharded_search, "rerank_with_regions", lambda *args: reranked.append(args))
+
+    card = Image.new("RGB", (440, 616))
+    coordinator = ShardCoordinator([LocalShard(shard_dir) for shard_dir in shard_dirs], deadline_seconds=5)
+    result = asyncio.run(sharded_image_search(card, None, 3, coordinator, query_embedding=embeddings[5],
+                                              card_image=card))
+    assert result["matches"][0][0] == "card-5"
+    assert len(reranked) == (1 if stamped_for_shards else 0)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+
+from similar_cards import SimilarCardGraph, compute_neighbours
+
+
+def unit_vectors(count, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64])
+def test_neighbours_match_brute_force_across_blocks(block_size):
+    embeddings = unit_vectors(30)
+    neighbours, scores = compute_neighbours(embeddings, k=5, block_size=block_size)
+
+    similarities = embeddings @ embeddings.T
+    np.fill_diagonal(similarities, -np.inf)
+    assert neighbours.tolist() == np.argsort(-similarities, axis=1)[:, :5].tolist()
+    assert np.allclose(scores, np.take_along_axis(similarities, neighbours, axis=1), atol=1e-3)
+
+
+def test_a_card_is_never_its_own_neighbour_and_order_is_best_first():
+    embeddings = unit_vectors(20)
+    # Exact duplicates (reprints) must still list each other, not themselves
+    embeddings[7] = embeddings[3]
+    neighbours, scores = compute_neighbours(embeddings, k=19, block_size=6)
+    assert all(row not in neighbours[row] for row in range(20))
+    assert neighbours[3, 0] == 7 and neighbours[7, 0] == 3
+    assert np.all(np.diff(scores.astype(np.float32), axis=1) <= 0)
+
+
+def test_k_is_capped_by_the_catalog_size():
+    neighbours, _ = compute_neighbours(unit_vectors(4), k=10)
+    assert neighbours.shape == (4, 3)
+    assert compute_neighbours(unit_vectors(1), k=10)[0].shape == (1, 0)
+
+
+def test_graph_lookup_returns_card_ids():
+    embeddings = unit_vectors(6)
+    graph = SimilarCardGraph([f"card-{i}" for i in range(6)], *compute_neighbours(embeddings, k=3))
+    matches = graph.similar("card-2", limit=2)
+    assert [card_id for card_id, _ in matches] == [f"card-{row}" for row in graph.neighbours[2, :2]]
+    assert graph.similar("missing") is None
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+
+import text_search
+from image_similarity import ImageEmbeddingModel
+from text_search import TEXT_QUERY_TEMPLATE, TextEmbeddingCache, build_common_queries
+
+DIM = 4
+
+
+@pytest.fixture
+def text_tower(tmp_path, monkeypatch):
+    """A fake CLIP text tower; returns the texts it was asked to embed."""
+    model = SimpleNamespace(config=SimpleNamespace(projection_dim=DIM))
+    monkeypatch.setattr(ImageEmbeddingModel, "_instance",
+                        ImageEmbeddingModel.from_model(model, None, "test-clip", "cpu", str(tmp_path)))
+    embedded = []
+
+    def get_text_embeddings(texts):
+        embedded.extend(texts)
+        return [np.full(DIM, 0.5, dtype=np.float32) for _ in texts]
+
+    monkeypatch.setattr(text_search, "get_text_embeddings", get_text_embeddings)
+    return embedded
+
+
+def test_recent_queries_are_served_from_the_lru(text_tower, tmp_path):
+    cache = TextEmbeddingCache(capacity=2, common_queries_file=str(tmp_path / "missing.npz"))
+    cache.get("Shiny  Charizard")
+    cache.get("shiny charizard ")
+    assert text_tower == [TEXT_QUERY_TEMPLATE.format("shiny charizard")]
+
+    cache.get("pikachu")
+    cache.get("mewtwo")
+    cache.get("shiny charizard")
+    assert len(text_tower) == 4
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_precomputed_queries_skip_the_model(text_tower, tmp_path):
+    path = str(tmp_path / "common.npz")
+    build_common_queries(["Pikachu", "fire pokemon"], path)
+    text_tower.clear()
+
+    cache = TextEmbeddingCache(common_queries_file=path)
+    assert cache.get(" PIKACHU") is not None
+    assert text_tower == []
+    assert cache.stats()["precomputedHits"] == 1
+
+
+def test_precomputed_queries_from_another_model_are_ignored(text_tower, tmp_path):
+    path = str(tmp_path / "common.npz")
+    build_common_queries(["pikachu"], path)
+    ImageEmbeddingModel._instance.model_name = "other-clip"
+    text_tower.clear()
+
+    cache = TextEmbeddingCache(common_queries_file=path)
+    cache.get("pikachu")
+    assert text_tower == [TEXT_QUERY_TEMPLATE.format("pikachu")]
+    assert cache.stats()["precomputed"] == 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pytest.importorskip("supertokens_python")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    import api
+    monkeypatch.setattr(api, "get_shard_coordinator", lambda: None)
+    monkeypatch.setattr(api, "card_summaries", lambda card_ids: [{"id": card_id} for card_id in card_ids])
+    app = FastAPI()
+    app.include_router(api.api_router)
+    return api, TestClient(app)
+
+
+def test_semantic_endpoint_ranks_with_the_cached_embedding(client, monkeypatch):
+    api, test_client = client
+    embedding = np.ones(DIM, dtype=np.float32)
+    searched = []
+
+    def search(text_embedding, filters, limit):
+        searched.append((text_embedding, filters, limit))
+        return [("base1-4", 0.31234), ("base1-58", 0.25)]
+
+    monkeypatch.setattr(api.text_embedding_cache, "get", lambda query: embedding)
+    monkeypatch.setattr(api, "search_by_text_embedding", search)
+    response = test_client.get("/v1/api/search/semantic", params={"q": "fire dragon", "limit": 2, "types": "Fire"})
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"id": "base1-4", "score": 0.3123}, {"id": "base1-58", "score": 0.25}]
+    assert searched[0][0] is embedding and searched[0][1:] == ({"types": ["Fire"]}, 2)
+
+
+def test_semantic_endpoint_rejects_a_query_it_cannot_embed(client, monkeypatch):
+    api, test_client = client
+    monkeypatch.setattr(api.text_embedding_cache, "get", lambda query: None)
+    assert test_client.get("/v1/api/search/semantic", params={"q": "???"}).status_code == 400
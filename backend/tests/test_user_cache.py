@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+import user_cache
+from user_cache import UserDataCache, get_library_revision, get_library_rows, page_library_rows
+
+
+def test_caches_value_for_the_same_revision():
+    cache = UserDataCache(capacity=4)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return "rows"
+
+    assert cache.get_or_load("alice", 3, loader) == "rows"
+    assert cache.get_or_load("alice", 3, loader) == "rows"
+    assert len(loads) == 1
+
+
+def test_new_revision_reloads():
+    cache = UserDataCache(capacity=4)
+    assert cache.get_or_load("alice", 1, lambda: "old") == "old"
+    assert cache.get_or_load("alice", 2, lambda: "new") == "new"
+    assert cache.get_or_load("alice", 2, lambda: "unused") == "new"
+
+
+def test_slow_load_does_not_replace_a_later_revision():
+    cache = UserDataCache(capacity=4)
+
+    def slow_loader():
+        # Another request caches revision 2 while this one is still reading at revision 1
+        cache.get_or_load("alice", 2, lambda: "new")
+        return "old"
+
+    assert cache.get_or_load("alice", 1, slow_loader) == "old"
+    assert cache.get_or_load("alice", 2, lambda: "unused") == "new"
+
+
+def test_failed_load_caches_nothing():
+    cache = UserDataCache(capacity=4)
+
+    def loader():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("alice", 1, loader)
+    assert cache.stats()["entries"] == 0
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = UserDataCache(capacity=2)
+    cache.get_or_load("alice", 1, lambda: "a")
+    cache.get_or_load("bob", 1, lambda: "b")
+    cache.get_or_load("alice", 1, lambda: "unused")
+    cache.get_or_load("carol", 1, lambda: "c")
+    assert cache.get_or_load("bob", 1, lambda: "reloaded") == "reloaded"
+
+
+def test_write_from_another_process_is_seen_on_the_next_read(tmp_path, monkeypatch):
+    path = str(tmp_path / "pokemon_cards.db")
+    monkeypatch.setattr(user_cache, "DB_PATH", path)
+    monkeypatch.setattr(user_cache, "user_data_cache", UserDataCache(capacity=4))
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE user_library (user_id TEXT, card_id TEXT)")
+    conn.execute("CREATE TABLE user_library_revisions (user_id TEXT PRIMARY KEY, revision INTEGER, updated_at TEXT)")
+
+    def add(card_id):
+        with conn:
+            conn.execute("INSERT INTO user_library VALUES ('alice', ?)", (card_id,))
+            conn.execute("""
+                INSERT INTO user_library_revisions VALUES ('alice', 1, datetime('now'))
+                ON CONFLICT(user_id) DO UPDATE SET revision = revision + 1
+            """)
+
+    def library():
+        revision = get_library_revision("alice")[0]
+        return page_library_rows(get_library_rows("alice", revision))[0]
+
+    add("base1-4")
+    assert library() == ["base1-4"]
+    # Written through another connection: nothing in this process is told about it
+    add("base1-58")
+    assert library() == ["base1-4", "base1-58"]
+    conn.close()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Text-to-card search over the image embedding index.
+
+A query such as "shiny charizard breathing fire" is embedded with CLIP's text
+tower, which shares its embedding space with the image tower that built
+embeddings.npy. Ranking the catalog is then one matrix-vector product against
+the existing index, with no new per-card data.
+
+The text forward pass is the only model cost, so query embeddings are memoized:
+    - a bounded LRU of recent queries (TEXT_EMBEDDING_CACHE_SIZE)
+    - a pinned table of common queries (Pokemon names, types) precomputed by
+      `build` into embedding_cache/text_query_embeddings.npz, never evicted; the
+      file records the model and dimension it was built with and is ignored
+      when they differ from the running model
+Queries are normalized (case, whitespace) before lookup so trivial variants share an entry.
+
+Usage:
+    python text_search.py build [--limit 2000]
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from image_similarity import CACHE_DIR, ImageEmbeddingModel, get_card_index, get_text_embeddings
+from metrics import time_stage
+
+# Defaults are overridable from the environment
+TEXT_EMBEDDING_CACHE_SIZE = int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", "2048"))
+# Wrapping the query in a caption reads closer to CLIP's training text than a bare phrase
+TEXT_QUERY_TEMPLATE = "Pokemon card artwork of {}"
+COMMON_QUERIES_FILE = os.path.join(CACHE_DIR, "text_query_embeddings.npz")
+# Queries embedded per text-tower forward pass while building the common set
+BUILD_BATCH_SIZE = 64
+
+DB_PATH = 'pokemon_cards.db'
+POKEMON_TYPES = ("colorless", "darkness", "dragon", "fairy", "fighting", "fire",
+                 "grass", "lightning", "metal", "psychic", "water")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace, so the cache key ignores trivial differences."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def load_common_queries(path: str, model_name: str, dim: int) -> Dict[str, np.ndarray]:
+    """
+    Normalized query -> embedding from a file written by `build`. Empty if the
+    file is missing or was built with a different TEXT_QUERY_TEMPLATE, model or
+    embedding dimension.
+    """
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        if str(data["template"]) != TEXT_QUERY_TEMPLATE:
+            print("Warning: common text queries were built with another template, ignoring them.")
+            return {}
+        built_with = (str(data["model"]), int(data["dim"])) if "model" in data.files else None
+        if built_with != (model_name, dim):
+            print(f"Warning: common text queries were built with {built_with}, running {(model_name, dim)}; "
+                  "ignoring them.")
+            return {}
+        embeddings = np.ascontiguousarray(data["embeddings"].astype(np.float32))
+        return {str(query): embedding for query, embedding in zip(data["queries"], embeddings)}
+
+
+class TextEmbeddingCache:
+    """
+    Query text -> CLIP text embedding: pinned precomputed entries plus a bounded LRU.
+
+    The text tower runs outside the lock; two threads missing on the same query
+    may both compute it, which is harmless.
+    """
+
+    def __init__(self, capacity: int = TEXT_EMBEDDING_CACHE_SIZE, common_queries_file: str = COMMON_QUERIES_FILE):
+        self.capacity = capacity
+        self.common_queries_file = common_queries_file
+        self._common: Optional[Dict[str, np.ndarray]] = None
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.precomputed_hits = 0
+        self.misses = 0
+
+    @property
+    def common(self) -> Dict[str, np.ndarray]:
+        """Precomputed common queries, loaded on first use."""
+        if self._common is None:
+            with self._lock:
+                if self._common is None:
+                    clip = ImageEmbeddingModel()
+                    self._common = load_common_queries(self.common_queries_file, clip.model_name,
+                                                       clip.model.config.projection_dim)
+        return self._common
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Normalized (D,) embedding of the query, or None if CLIP could not embed it.
+
+        Args:
+            query: Free text; normalized before lookup
+        """
+        key = normalize_query(query)
+        embedding = self.common.get(key)
+        with self._lock:
+            if embedding is not None:
+                self.precomputed_hits += 1
+                return embedding
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+
+        embedding = get_text_embeddings([TEXT_QUERY_TEMPLATE.format(key)])[0]
+        if embedding is None:
+            return None
+
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return embedding
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.precomputed_hits + self.misses
+            return {
+                "hits": self.hits,
+                "precomputedHits": self.precomputed_hits,
+                "misses": self.misses,
+                "hitRate": round((self.hits + self.precomputed_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "precomputed": len(self._common or {}),
+                "capacity": self.capacity,
+            }
+
+
+text_embedding_cache = TextEmbeddingCache()
+
+
+def search_by_text_embedding(text_embedding: np.ndarray, filters: Optional[Dict[str, List[str]]] = None,
+                             top_k: int = 10) -> List[tuple]:
+    """
+    Rank the catalog against a text embedding.
+
+    Returns:
+        list: (card_id, score) tuples, best first; scores are text-image cosine
+            similarities, which run much lower than image-image ones (~0.2-0.35)
+    """
+    index = get_card_index()
+    rows = index.attributes.filter_rows(filters) if filters else None
+    if rows is not None and len(rows) == 0:
+        return []
+
+    with time_stage("vector_search"):
+        similarities = index.similarities(text_embedding, rows)
+        if len(similarities) == 0:
+            return []
+        positions = rows if rows is not None else np.arange(len(similarities))
+        num_results = min(top_k, len(similarities))
+        top = np.argpartition(-similarities, num_results - 1)[:num_results]
+        top = top[np.argsort(-similarities[top])]
+    return [(index.card_ids[positions[i]], float(similarities[i])) for i in top]
+
+
+def default_common_queries(limit: int) -> List[str]:
+    """Pokemon names with the most cards, then the energy types, normalized."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        names = [row[0] for row in conn.execute('''
+            SELECT name FROM pokemon_cards WHERE supertype NOT IN ('Trainer', 'Energy')
+            GROUP BY name ORDER BY COUNT(*) DESC, name LIMIT ?
+        ''', (limit,))]
+    finally:
+        conn.close()
+    queries = [normalize_query(name) for name in names]
+    queries += [f"{pokemon_type} pokemon" for pokemon_type in POKEMON_TYPES]
+    return list(dict.fromkeys(queries))
+
+
+def build_common_queries(queries: Sequence[str], output: str = COMMON_QUERIES_FILE) -> int:
+    """Embed the queries in batches and write them for TextEmbeddingCache; returns how many were stored."""
+    kept, embeddings = [], []
+    for start in range(0, len(queries), BUILD_BATCH_SIZE):
+        batch = [normalize_query(query) for query in queries[start:start + BUILD_BATCH_SIZE]]
+        for query, embedding in zip(batch, get_text_embeddings([TEXT_QUERY_TEMPLATE.format(q) for q in batch])):
+            if embedding is not None:
+                kept.append(query)
+                embeddings.append(embedding)
+        print(f"Embedded {min(start + BUILD_BATCH_SIZE, len(queries))}/{len(queries)} queries")
+    embeddings = np.array(embeddings, dtype=np.float32)
+    np.savez(output, queries=np.array(kept), embeddings=embeddings, template=np.array(TEXT_QUERY_TEMPLATE),
+             model=np.array(ImageEmbeddingModel().model_name), dim=np.array(embeddings.shape[1] if kept else 0))
+    return len(kept)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Precompute embeddings for common queries")
+    build.add_argument("--limit", type=int, default=2000, help="Most-printed Pokemon names to include")
+    build.add_argument("--queries", help="JSON list of extra queries to include")
+    build.add_argument("--output", default=COMMON_QUERIES_FILE, help="Output .npz file")
+
+    args = parser.parse_args()
+    queries = default_common_queries(args.limit)
+    if args.queries:
+        with open(args.queries) as f:
+            queries = list(dict.fromkeys(queries + [normalize_query(query) for query in json.load(f)]))
+    count = build_common_queries(queries, args.output)
+    print(f"Wrote {count} query embeddings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
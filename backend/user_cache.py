@@ -0,0 +1,129 @@
+"""
+Per-user cache of library rows read on authenticated requests.
+
+Each authenticated library call used to read the library page from SQLite.
+This module keeps each user's whole library as (rowids, card_ids) in a bounded
+LRU, tagged with the library revision it was read at.
+
+The revision itself is never cached: it is read from user_library_revisions on
+every request (one primary-key lookup), and a cached library is only used when
+its tag equals the current revision. Every library write bumps the revision in
+the same transaction, so a write made by any serve.py worker is seen by every
+worker on its next request, with no invalidation messages and no TTL.
+"""
+
+import bisect
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Defaults are overridable from the environment
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Larger libraries are paged straight from SQLite instead of being held in memory
+USER_CACHE_MAX_LIBRARY_ROWS = int(os.getenv("USER_CACHE_MAX_LIBRARY_ROWS", "5000"))
+
+DB_PATH = 'pokemon_cards.db'
+
+
+class UserDataCache:
+    """
+    Bounded LRU of per-user values, each tagged with the revision it was loaded at.
+
+    A lookup hits only when the caller's revision equals the entry's tag. Loaders
+    run outside the lock; an exception from a loader propagates and nothing is
+    cached. Callers read the revision before loading, so an entry's rows are
+    never older than its tag (at worst newer, which the next revision read
+    replaces).
+    """
+
+    def __init__(self, capacity: int = USER_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, user_id: str, revision: int, loader: Callable[[], Any]) -> Any:
+        """Return the value cached for user_id at this revision, calling loader() otherwise."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == revision:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+
+        with self._lock:
+            current = self._entries.get(user_id)
+            # A slow load must not replace an entry for a later revision
+            if current is None or current[0] <= revision:
+                self._entries[user_id] = (revision, value)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+            }
+
+
+user_data_cache = UserDataCache()
+
+
+def _query(sql: str, params: tuple, fetch_all: bool = False):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cursor = conn.execute(sql, params)
+        return cursor.fetchall() if fetch_all else cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def get_library_revision(user_id: str) -> tuple:
+    """(revision, updated_at) of the user's library, read from SQLite; (0, None) if it was never written."""
+    row = _query("SELECT revision, updated_at FROM user_library_revisions WHERE user_id = ?", (user_id,))
+    return (row[0], row[1]) if row else (0, None)
+
+
+def get_library_rows(user_id: str, revision: int) -> Optional[Tuple[List[int], List[str]]]:
+    """
+    The user's whole library as (rowids, card_ids) in insertion order, or None
+    when it has more than USER_CACHE_MAX_LIBRARY_ROWS rows and should be paged in SQL.
+
+    Args:
+        revision: The library revision the caller just read (see get_library_revision)
+    """
+    def load():
+        rows = _query("SELECT rowid, card_id FROM user_library WHERE user_id = ? ORDER BY rowid LIMIT ?",
+                      (user_id, USER_CACHE_MAX_LIBRARY_ROWS + 1), fetch_all=True)
+        if len(rows) > USER_CACHE_MAX_LIBRARY_ROWS:
+            return None
+        return [row[0] for row in rows], [row[1] for row in rows]
+    return user_data_cache.get_or_load(user_id, revision, load)
+
+
+def page_library_rows(library: Tuple[List[int], List[str]], after_row_id: int = 0,
+                      limit: Optional[int] = None) -> tuple:
+    """Keyset page of cached library rows; same return shape as api.get_user_library."""
+    row_ids, card_ids = library
+    start = bisect.bisect_right(row_ids, after_row_id)
+    end = len(row_ids) if limit is None else min(start + limit, len(row_ids))
+    last_row_id = row_ids[end - 1] if end < len(row_ids) and end > start else None
+    return card_ids[start:end], last_row_id
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Report per-process memory of a serve.py deployment (Linux).
+
+For the parent and each worker it prints:
+    RSS  resident pages, shared pages counted in full in every process
+    PSS  proportional share: shared pages split evenly between their users
+    USS  unique (private) pages, what the process would free on exit
+Summing RSS overstates the real footprint; summing PSS gives it. With the model
+and index shared copy-on-write, each extra worker should only cost its USS.
+
+Usage:
+    python worker_memory.py --pid-file serve.pid
+    python worker_memory.py --pid 12345
+"""
+
+import argparse
+import os
+
+
+def read_smaps_rollup(pid):
+    """{field: kB} from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return fields
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent PID; the command name (field 2) may contain spaces
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def memory_row(pid, role):
+    rollup = read_smaps_rollup(pid)
+    return {
+        "pid": pid,
+        "role": role,
+        "rss_mb": rollup.get("Rss", 0) / 1024,
+        "pss_mb": rollup.get("Pss", 0) / 1024,
+        "uss_mb": (rollup.get("Private_Clean", 0) + rollup.get("Private_Dirty", 0)) / 1024,
+        "shared_mb": (rollup.get("Shared_Clean", 0) + rollup.get("Shared_Dirty", 0)) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, help="serve.py parent PID")
+    parser.add_argument("--pid-file", help="File written by serve.py --pid-file")
+    args = parser.parse_args()
+
+    if args.pid is None:
+        if not args.pid_file:
+            parser.error("pass --pid or --pid-file")
+        with open(args.pid_file) as f:
+            args.pid = int(f.read().strip())
+
+    rows = [memory_row(args.pid, "parent")] + [memory_row(pid, "worker") for pid in child_pids(args.pid)]
+
+    print(f"{'pid':>8}  {'role':<8}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}{'shared MB':>11}")
+    for row in rows:
+        print(f"{row['pid']:>8}  {row['role']:<8}{row['rss_mb']:>10.1f}{row['pss_mb']:>10.1f}"
+              f"{row['uss_mb']:>10.1f}{row['shared_mb']:>11.1f}")
+    workers = [row for row in rows if row["role"] == "worker"]
+    print(f"\nSum of RSS: {sum(row['rss_mb'] for row in rows):.1f} MB (double-counts shared pages)")
+    print(f"Sum of PSS: {sum(row['pss_mb'] for row in rows):.1f} MB (actual footprint)")
+    if workers:
+        print(f"Mean worker USS: {sum(row['uss_mb'] for row in workers) / len(workers):.1f} MB (cost of one more worker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,21 @@ export const useCardApi = () => {
 
   const fetchLibrary = async (): Promise<{ success: boolean; card_ids: string[] }> => {
     const apiBaseUrl = import.meta.env.VITE_API_BASE_URL || window.location.origin;
-    const response = await fetch(`${apiBaseUrl}/v1/api/library`, {
-      credentials: 'include', // Include cookies for session authentication
-    });
-    return response.json();
+    // The library endpoint is cursor-paginated; follow next_cursor until exhausted
+    const cardIds: string[] = [];
+    let cursor: string | null = null;
+    do {
+      const params = new URLSearchParams({ limit: '500' });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`${apiBaseUrl}/v1/api/library?${params.toString()}`, {
+        credentials: 'include', // Include cookies for session authentication
+      });
+      const page = await response.json();
+      if (!page.success) return { success: false, card_ids: cardIds };
+      cardIds.push(...(page.card_ids || []));
+      cursor = page.next_cursor || null;
+    } while (cursor);
+    return { success: true, card_ids: cardIds };
   };
 
   return {
@@ -85,4 +96,4 @@ export class CardApiService {
     const data = await response.json();
     return data && data.name ? data : null;
   }
-}
\ No newline at end of file
+}